@@ -0,0 +1,39 @@
+/* eslint-env node */
+
+// Arguments for the emcc/em++ call of a /compile request. `dependencies` is
+// dependencies.json from dependencies/build.py, `profile` an entry of its
+// libkipr_c_profiles (or null for the default libkipr build).
+function compileArgs({
+  dependencies,
+  compileFlags,
+  language,
+  profile,
+  code,
+  path,
+}) {
+  const harness = dependencies.compile_harness?.[language];
+  const args = [
+    ...compileFlags,
+    ...(profile ? profile.flags : []),
+    // Every profile installs the same headers
+    `-I${dependencies.libkipr_c}/include`,
+    `-L${profile ? profile.path : dependencies.libkipr_c}/lib`,
+    '-lkipr',
+    '-o',
+    `${path}.js`,
+    path,
+  ];
+  if (harness) {
+    // clang rejects a PCH built with different optimization flags, so each
+    // profile has its own. Older builds did not record them, so go without.
+    const pch = profile ? profile.pch?.[language] : harness.pch;
+    // The precompiled header is only valid for programs that include libkipr themselves
+    if (pch && /#\s*include\s*<kipr\/wombat\.h(pp)?>/.test(code)) {
+      args.unshift('-include-pch', pch);
+    }
+    args.push(harness.wrapper);
+  }
+  return args;
+}
+
+module.exports = { compileArgs };
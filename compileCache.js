@@ -0,0 +1,129 @@
+/* eslint-env node */
+
+const fs = require('fs');
+const path = require('path');
+const crypto = require('crypto');
+const metrics = require('./metrics');
+
+// On-disk cache of /compile results, keyed by a hash of everything that affects
+// the emitted JS. Entries are evicted least recently used first once the cache
+// grows past `maxBytes`. Recency is kept in the file mtimes so the order
+// survives restarts.
+class CompileCache {
+  constructor(dir, maxBytes) {
+    this.dir = dir;
+    this.maxBytes = maxBytes;
+    // key -> entry size in bytes, least recently used first
+    this.entries = new Map();
+    this.size = 0;
+
+    fs.mkdirSync(dir, { recursive: true });
+    const existing = [];
+    for (const name of fs.readdirSync(dir)) {
+      if (!name.endsWith('.json')) continue;
+      try {
+        const stat = fs.statSync(path.join(dir, name));
+        existing.push({ key: name.slice(0, -'.json'.length), stat });
+      } catch (e) {
+        // Removed by another process in the meantime
+      }
+    }
+    existing.sort((a, b) => a.stat.mtimeMs - b.stat.mtimeMs);
+    for (const { key, stat } of existing) this.add(key, stat.size);
+    this.evict();
+  }
+
+  static key(parts) {
+    return crypto
+      .createHash('sha256')
+      .update(JSON.stringify(parts))
+      .digest('hex');
+  }
+
+  file(key) {
+    return path.join(this.dir, `${key}.json`);
+  }
+
+  add(key, size) {
+    this.remove(key);
+    this.entries.set(key, size);
+    this.size += size;
+    metrics.compilation.cacheSize.set(this.size);
+  }
+
+  remove(key) {
+    if (!this.entries.has(key)) return;
+    this.size -= this.entries.get(key);
+    this.entries.delete(key);
+    metrics.compilation.cacheSize.set(this.size);
+  }
+
+  evict() {
+    for (const key of this.entries.keys()) {
+      if (this.size <= this.maxBytes) break;
+      this.remove(key);
+      metrics.compilation.cacheEvictions.inc();
+      fs.unlink(this.file(key), () => {});
+    }
+  }
+
+  // Calls back with the cached { result, stdout, stderr }, or null on a miss
+  get(key, callback) {
+    const size = this.entries.get(key);
+    if (size === undefined) {
+      metrics.compilation.cacheRequests.inc({ result: 'miss' });
+      return callback(null);
+    }
+
+    fs.readFile(this.file(key), 'utf8', (err, data) => {
+      let entry = null;
+      if (!err) {
+        try {
+          entry = JSON.parse(data);
+        } catch (e) {
+          // Truncated or corrupt, treat as a miss and let the next compile replace it
+        }
+      }
+
+      if (!entry) {
+        this.remove(key);
+        metrics.compilation.cacheRequests.inc({ result: 'miss' });
+        return callback(null);
+      }
+
+      // Mark as most recently used, in memory and on disk
+      this.add(key, size);
+      const now = new Date();
+      fs.utimes(this.file(key), now, now, () => {});
+
+      metrics.compilation.cacheRequests.inc({ result: 'hit' });
+      callback(entry);
+    });
+  }
+
+  set(key, entry) {
+    const data = JSON.stringify(entry);
+    const size = Buffer.byteLength(data);
+    if (size > this.maxBytes) return;
+
+    // Write then rename, so concurrent readers never see a partial entry
+    const tempFile = `${this.file(key)}.${process.pid}.${crypto.randomUUID()}.tmp`;
+    fs.writeFile(tempFile, data, (err) => {
+      if (err) {
+        console.error(`Failed to write compile cache entry ${key}:`, err.message);
+        return;
+      }
+      fs.rename(tempFile, this.file(key), (err) => {
+        if (err) {
+          console.error(`Failed to write compile cache entry ${key}:`, err.message);
+          fs.unlink(tempFile, () => {});
+          return;
+        }
+        this.add(key, size);
+        this.evict();
+      });
+    });
+  }
+}
+
+module.exports = { CompileCache };
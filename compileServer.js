@@ -0,0 +1,61 @@
+/* eslint-env node */
+
+const net = require('net');
+const { execFile } = require('child_process');
+
+// Runs emcc/em++ through the warm compile daemon (dependencies/compile_server.py)
+// listening on `socketPath`. Falls back to spawning the compiler directly if no
+// socket is configured or the daemon is unreachable.
+// The callback receives (err, stdout, stderr), like child_process.execFile.
+function runCompiler(socketPath, cc, args, options, callback) {
+  if (!socketPath) {
+    return execFile(cc, args, options, callback);
+  }
+
+  let done = false;
+  const finish = (...results) => {
+    if (done) return;
+    done = true;
+    callback(...results);
+  };
+
+  const chunks = [];
+  const socket = net.createConnection(socketPath);
+  socket.on('connect', () => {
+    socket.end(JSON.stringify({ cc, args, cwd: options.cwd }));
+  });
+  socket.on('data', (chunk) => chunks.push(chunk));
+  socket.on('error', (err) => {
+    if (chunks.length > 0) return finish(err, '', err.message);
+
+    console.error(
+      `Compile server at ${socketPath} is unreachable, running ${cc} directly:`,
+      err.message,
+    );
+    done = true;
+    execFile(cc, args, options, callback);
+  });
+  socket.on('end', () => {
+    let response;
+    try {
+      response = JSON.parse(Buffer.concat(chunks).toString());
+    } catch (err) {
+      return finish(err, '', `Invalid response from compile server: ${err.message}`);
+    }
+
+    if (response.error) {
+      return finish(new Error(response.error), '', response.error);
+    }
+
+    if (response.code !== 0) {
+      const err = new Error(`${cc} exited with code ${response.code}`);
+      err.code = response.code;
+      err.killed = response.timed_out;
+      return finish(err, response.stdout, response.stderr);
+    }
+
+    finish(null, response.stdout, response.stderr);
+  });
+}
+
+module.exports = { runCompiler };
@@ -1,6 +1,8 @@
 /* eslint-env node */
 
 const fs = require("fs");
+const os = require("os");
+const path = require("path");
 
 let dependencies = {};
 try {
@@ -40,6 +42,21 @@ module.exports = {
       server: {
         port: getEnvVarOrDefault("SERVER_PORT", 3000),
         feedbackWebhookURL: getEnvVarOrDefault("FEEDBACK_WEBHOOK_URL", ""),
+        // Unix socket of dependencies/compile_server.py. If unset, /compile spawns emcc directly.
+        compileServerSocket: getEnvVarOrDefault("COMPILE_SERVER_SOCKET", ""),
+        // libkipr optimization profile used when /compile requests do not name one
+        // (one of libkipr_c_profiles in dependencies.json). Empty uses the default build.
+        compileProfile: getEnvVarOrDefault("COMPILE_LIBKIPR_PROFILE", ""),
+        // On-disk cache of compile results. Set COMPILE_CACHE_MAX_BYTES to 0 to disable.
+        compileCache: {
+          dir: getEnvVarOrDefault(
+            "COMPILE_CACHE_DIR",
+            path.join(os.tmpdir(), "kipr-compile-cache")
+          ),
+          maxBytes: Number(
+            getEnvVarOrDefault("COMPILE_CACHE_MAX_BYTES", 256 * 1024 * 1024)
+          ),
+        },
         dependencies,
       },
       caching: {
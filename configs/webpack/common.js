@@ -26,12 +26,20 @@ const modules = ['node_modules'];
 if (dependencies.cpython) modules.push(resolve(dependencies.cpython));
 
 let libkiprCDocumentation = undefined;
+let libkiprCCompactDocumentation = undefined;
 let libkiprCCCommonDocumentation = undefined;
 if (dependencies.libkipr_c_documentation) {
   libkiprCDocumentation = JSON.parse(
     readFileSync(resolve(dependencies.libkipr_c_documentation)),
   );
 }
+// The same documentation in the compact format, about a third of the size.
+// When present, the simulator inlines it instead and decodes it at startup.
+if (dependencies.libkipr_c_compact_documentation) {
+  libkiprCCompactDocumentation = JSON.parse(
+    readFileSync(resolve(dependencies.libkipr_c_compact_documentation)),
+  );
+}
 if (dependencies.libkipr_c_common_documentation) {
   libkiprCCCommonDocumentation = JSON.parse(
     readFileSync(resolve(dependencies.libkipr_c_common_documentation)),
@@ -223,7 +231,12 @@ module.exports = {
       SIMULATOR_VERSION: JSON.stringify(require('../../package.json').version),
       SIMULATOR_GIT_HASH: JSON.stringify(commitHash),
       SIMULATOR_HAS_CPYTHON: JSON.stringify(dependencies.cpython !== undefined),
-      SIMULATOR_LIBKIPR_C_DOCUMENTATION: JSON.stringify(libkiprCDocumentation),
+      SIMULATOR_LIBKIPR_C_DOCUMENTATION: JSON.stringify(
+        libkiprCCompactDocumentation ? undefined : libkiprCDocumentation,
+      ),
+      SIMULATOR_LIBKIPR_C_COMPACT_DOCUMENTATION: JSON.stringify(
+        libkiprCCompactDocumentation,
+      ),
       SIMULATOR_I18N: JSON.stringify(i18n),
 
       // needed because ivygate relies on them being defined
@@ -0,0 +1,549 @@
+#!/usr/bin/python3
+"""
+benchmark_compile.py
+
+Measures how long /compile takes for a corpus of student programs, so changes
+to the toolchain, compile flags or libkipr can be compared run to run.
+
+C and C++ programs are compiled in one of two ways:
+
+  emcc    (default) each program is compiled with the same emcc/em++
+          invocation and simMainWrapper augmentation as the /compile endpoint
+          in express.js, using the paths recorded in dependencies.json
+  server  with --server, each program is sent to a running server's /compile
+          endpoint, so the compile result cache and the compile server (if the
+          server is configured with them) are measured as well
+
+Every concurrency level runs passes whose cache state is set up explicitly:
+
+  cold  with --server, every program has a unique comment appended, so the
+        server's compile cache misses and the program is really compiled.
+        With --ccache, programs are compiled through a new, empty ccache.
+  warm  `--repeat` further compiles of each program exactly as sent in the
+        cold pass, so they hit the compile cache (or ccache)
+  none  without --server or --ccache there is no cache to warm, so
+        `--repeat` compiles of each program are measured as a single pass
+
+With --server, the hits and misses of each pass are read from the server's
+/metrics, which shows whether the warm pass was served from the cache.
+
+With --wasm, programs are compiled with the WebAssembly variant of the flags
+(compile_flags_wasm) and the output size includes the .wasm file. With
+--profile, programs are linked against that libkipr optimization profile.
+
+Python programs are not compiled by /compile. They run on the browser CPython,
+which imports the stdlib from the bundle built by package_stdlib.py. For each
+Python program, the native interpreter from the CPython build imports the
+program's stdlib imports from that bundle only. This measures the import cost
+and fails if the bundle is missing a module the program needs.
+
+The results are written as JSON. With --baseline, the p95 latency of each pass
+is compared to an earlier results file and the script exits with status 1 if
+any pass regressed by more than --max-regression. A baseline recorded with
+different settings (backend, flags, profile, wasm or ccache) is rejected rather
+than compared.
+
+Usage:
+  python3 benchmark_compile.py \
+    --corpus student_programs \
+    --concurrency 1 --concurrency 4 \
+    [--server http://localhost:3000] \
+    --output compile_benchmark.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+import uuid
+from dataclasses import dataclass
+from multiprocessing.pool import ThreadPool
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+COMPILERS = {
+  '.c': ('c', 'emcc'),
+  '.cpp': ('cpp', 'em++'),
+  '.py': ('python', None),
+}
+
+# Used by express.js when dependencies.json predates compile_flags
+DEFAULT_COMPILE_FLAGS = [
+  '-s', 'WASM=0',
+  '-s', 'INVOKE_RUN=0',
+  '-s', 'ASYNCIFY',
+  '-s', 'EXIT_RUNTIME=1',
+  '-s', "EXPORTED_FUNCTIONS=['_main', '_simMainWrapper']",
+]
+
+INCLUDES_LIBKIPR = re.compile(r'#\s*include\s*<kipr/wombat\.h(pp)?>')
+
+CACHE_REQUESTS = re.compile(r'^simulator_compilation_cache_requests_total\{result="(hit|miss)"\} (\S+)$')
+
+# Results that must match a baseline for its latencies to be comparable
+COMPARABLE_SETTINGS = ('backend', 'compile_flags', 'wasm', 'profile', 'ccache', 'compile_harness')
+
+# Imports the stdlib modules a Python program imports, from the bundle alone.
+# Directories holding the native interpreter's pure-Python stdlib (the ones
+# with os.py) are removed from sys.path, so only its extension modules remain.
+PYTHON_IMPORT_CHECK = '''
+import ast, importlib, marshal, os, sys
+bundle, source_path = sys.argv[1], sys.argv[2]
+sys.path[:] = [bundle] + [path for path in sys.path if path and not os.path.exists(os.path.join(path, 'os.py'))]
+with open(source_path, encoding='utf-8') as f:
+  source = f.read()
+tree = ast.parse(source, source_path)
+names = set()
+for node in ast.walk(tree):
+  if isinstance(node, ast.Import):
+    names.update(alias.name for alias in node.names)
+  elif isinstance(node, ast.ImportFrom) and node.level == 0:
+    names.add(node.module)
+for name in sorted(names):
+  # libkipr's binding is loaded separately
+  if name.split('.')[0] not in ('kipr', '_kipr'):
+    importlib.import_module(name)
+print(len(marshal.dumps(compile(tree, source_path, 'exec'))))
+'''
+
+working_dir = Path(__file__).parent.absolute()
+compile_harness_dir = working_dir / 'compile_harness'
+
+
+@dataclass
+class Program:
+  path: Path
+  language: str
+  cc: Optional[str]
+  code: str
+
+
+@dataclass
+class Sample:
+  program: str
+  seconds: float
+  # Unknown when compiling through a server
+  peak_rss: Optional[int]
+  output_size: int
+  returncode: int
+  stderr: str
+
+
+def find_programs(corpus: List[str]) -> List[Program]:
+  """Return the C, C++ and Python programs in `corpus`."""
+  paths = []
+  for entry in corpus:
+    entry = Path(entry)
+    if entry.is_dir():
+      paths += sorted(path for path in entry.rglob('*') if path.is_file())
+    else:
+      paths.append(entry)
+
+  programs = []
+  for path in paths:
+    if path.suffix in COMPILERS:
+      language, cc = COMPILERS[path.suffix]
+      programs.append(Program(path, language, cc, path.read_text(encoding='utf-8')))
+  return programs
+
+
+def compile_args(
+  dependencies: Dict[str, Any],
+  flags: List[str],
+  profile: Optional[Dict[str, Any]],
+  program: Program,
+  source: Path,
+  output: Path,
+) -> Tuple[List[str], str]:
+  """Return the compiler arguments and augmented source /compile would use for
+  `program`, linked against libkipr `profile` (or the default build if None)."""
+  harness = dependencies.get('compile_harness', {}).get(program.language)
+  args = [
+    *flags,
+    *(profile['flags'] if profile else []),
+    f"-I{dependencies['libkipr_c']}/include",
+    f"-L{profile['path'] if profile else dependencies['libkipr_c']}/lib",
+    '-lkipr',
+    '-o', f'{output}',
+    f'{source}',
+  ]
+
+  if harness:
+    # Same PCH choice as compileArgs.js
+    pch = profile.get('pch', {}).get(program.language) if profile else harness['pch']
+    if pch and INCLUDES_LIBKIPR.search(program.code):
+      args = ['-include-pch', pch, *args]
+    args.append(harness['wrapper'])
+    code = program.code
+  else:
+    # Same as the augmentation appended by express.js
+    wrapper = compile_harness_dir / f'sim_main_wrapper.{program.language}'
+    code = f'{program.code}\n{wrapper.read_text(encoding="utf-8")}\n'
+
+  return args, code
+
+
+def run_measured(args: List[str], env: Dict[str, str], job_dir: Path) -> Tuple[float, int, int, str, str]:
+  """Run `args` and return its wall time, peak RSS, exit code, stdout and stderr."""
+  with open(job_dir / 'stdout', 'w+', encoding='utf-8', errors='replace') as stdout, \
+       open(job_dir / 'stderr', 'w+', encoding='utf-8', errors='replace') as stderr:
+    start = time.perf_counter()
+    process = subprocess.Popen(args, env=env, stdout=stdout, stderr=stderr)
+    # The rusage of the waited-for child includes the clang and node processes it waited for
+    _, status, rusage = os.wait4(process.pid, 0)
+    seconds = time.perf_counter() - start
+    returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+    stdout.seek(0)
+    stderr.seek(0)
+    return seconds, rusage.ru_maxrss * 1024, returncode, stdout.read(), stderr.read()
+
+
+def compile_program(
+  dependencies: Dict[str, Any],
+  flags: List[str],
+  profile: Optional[Dict[str, Any]],
+  env: Dict[str, str],
+  program: Program,
+) -> Sample:
+  with tempfile.TemporaryDirectory(prefix='kipr-benchmark-') as job_dir:
+    job_dir = Path(job_dir)
+    source = job_dir / f'program.{program.language}'
+    output = job_dir / 'program.js'
+    args, code = compile_args(dependencies, flags, profile, program, source, output)
+    source.write_text(code, encoding='utf-8')
+
+    seconds, peak_rss, returncode, _, stderr = run_measured([program.cc, *args], env, job_dir)
+    return Sample(
+      program=f'{program.path}',
+      seconds=seconds,
+      peak_rss=peak_rss,
+      output_size=sum(path.stat().st_size for path in (output, output.with_suffix('.wasm')) if path.exists()),
+      returncode=returncode,
+      stderr=stderr,
+    )
+
+
+def request_compile(server: str, profile: Optional[str], program: Program) -> Sample:
+  """Compile `program` through the /compile endpoint of `server`."""
+  body = { 'language': program.language, 'code': program.code }
+  if profile:
+    body['profile'] = profile
+  request = urllib.request.Request(
+    f'{server}/compile',
+    data=json.dumps(body).encode(),
+    headers={ 'Content-Type': 'application/json' },
+  )
+
+  start = time.perf_counter()
+  try:
+    with urllib.request.urlopen(request, timeout=300) as response:
+      result = json.load(response)
+    returncode = 0
+  except urllib.error.HTTPError as err:
+    result = { 'stderr': err.read().decode(errors='replace') }
+    returncode = err.code
+  seconds = time.perf_counter() - start
+
+  # A program that fails to compile is a 200 without a result
+  if returncode == 0 and 'result' not in result:
+    returncode = 1
+
+  return Sample(
+    program=f'{program.path}',
+    seconds=seconds,
+    peak_rss=None,
+    output_size=len(result['result'].encode()) if returncode == 0 else 0,
+    returncode=returncode,
+    stderr=result.get('stderr') or result.get('error') or '',
+  )
+
+
+def check_python_program(python: str, bundle: str, program: Program) -> Sample:
+  with tempfile.TemporaryDirectory(prefix='kipr-benchmark-') as job_dir:
+    job_dir = Path(job_dir)
+    seconds, peak_rss, returncode, stdout, stderr = run_measured(
+      [python, '-I', '-S', '-c', PYTHON_IMPORT_CHECK, bundle, f'{program.path}'],
+      dict(os.environ),
+      job_dir,
+    )
+    return Sample(
+      program=f'{program.path}',
+      seconds=seconds,
+      peak_rss=peak_rss,
+      output_size=int(stdout) if returncode == 0 else 0,
+      returncode=returncode,
+      stderr=stderr,
+    )
+
+
+def with_nonce(program: Program) -> Program:
+  """`program` with a unique trailing comment, so no cache has seen it before."""
+  code = f'{program.code}\n// benchmark {uuid.uuid4()}\n'
+  return Program(program.path, program.language, program.cc, code)
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+  """Nearest-rank percentile of `values`."""
+  if not values:
+    return None
+  values = sorted(values)
+  return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def summarize(values: List[float]) -> Dict[str, Optional[float]]:
+  return {
+    'p50': percentile(values, 50),
+    'p95': percentile(values, 95),
+    'p99': percentile(values, 99),
+    'mean': sum(values) / len(values) if values else None,
+    'max': max(values) if values else None,
+  }
+
+
+def run_pass(measure: Callable[[Program], Sample], programs: List[Program], concurrency: int) -> Dict[str, Any]:
+  start = time.perf_counter()
+  with ThreadPool(concurrency) as pool:
+    samples = pool.map(measure, programs)
+  wall_seconds = time.perf_counter() - start
+
+  succeeded = [sample for sample in samples if sample.returncode == 0]
+  failed = [sample for sample in samples if sample.returncode != 0]
+  for sample in failed:
+    print(f'{sample.program} failed with exit code {sample.returncode}:\n{sample.stderr}', file=sys.stderr)
+
+  return {
+    'samples': len(samples),
+    'failures': [sample.program for sample in failed],
+    'wall_seconds': wall_seconds,
+    'throughput_per_second': len(samples) / wall_seconds if wall_seconds > 0 else None,
+    'latency_ms': summarize([sample.seconds * 1000 for sample in succeeded]),
+    'output_bytes': summarize([sample.output_size for sample in succeeded]),
+    'peak_rss_bytes': summarize([sample.peak_rss for sample in succeeded if sample.peak_rss is not None]),
+  }
+
+
+def server_cache_requests(server: str) -> Optional[Dict[str, float]]:
+  """Return the compile cache hits and misses the server has counted, if it exports them."""
+  try:
+    with urllib.request.urlopen(f'{server}/metrics', timeout=30) as response:
+      text = response.read().decode()
+  except (urllib.error.URLError, OSError):
+    return None
+
+  counts = { 'hit': 0.0, 'miss': 0.0 }
+  for line in text.splitlines():
+    match = CACHE_REQUESTS.match(line)
+    if match:
+      counts[match.group(1)] = float(match.group(2))
+  return counts
+
+
+def compiler_env(dependencies: Dict[str, Any], ccache_dir: Optional[Path]) -> Dict[str, str]:
+  """The environment express.js gives the compiler, optionally with ccache."""
+  env = dict(os.environ)
+  env.update(dependencies['emsdk_env'])
+  env['PATH'] = f"{dependencies['emsdk_env']['PATH']}:{os.environ.get('PATH', '')}"
+  if ccache_dir is not None:
+    env['EM_COMPILER_WRAPPER'] = 'ccache'
+    env['CCACHE_DIR'] = f'{ccache_dir}'
+    env['CCACHE_NOHASHDIR'] = '1'
+  return env
+
+
+def setting_mismatches(results: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+  return [
+    f'{setting}: {baseline.get(setting)!r} in the baseline, {results.get(setting)!r} now'
+    for setting in COMPARABLE_SETTINGS
+    if results.get(setting) != baseline.get(setting)
+  ]
+
+
+def find_regressions(results: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> List[str]:
+  baseline_runs = {(run['kind'], run['concurrency'], run['cache']): run for run in baseline['runs']}
+  regressions = []
+  for run in results['runs']:
+    previous = baseline_runs.get((run['kind'], run['concurrency'], run['cache']))
+    if previous is None:
+      continue
+    current_p95 = run['latency_ms']['p95']
+    previous_p95 = previous['latency_ms']['p95']
+    if current_p95 is None or not previous_p95:
+      continue
+    if current_p95 > previous_p95 * (1 + max_regression):
+      regressions.append(
+        f"{run['kind']} {run['cache']} pass at concurrency {run['concurrency']}: "
+        f"p95 {current_p95:.0f} ms vs {previous_p95:.0f} ms"
+      )
+  return regressions
+
+
+def main() -> None:
+  parser = argparse.ArgumentParser()
+  parser.add_argument(
+    "--dependencies",
+    default=working_dir / 'dependencies.json',
+    help="Path to the dependencies.json written by build.py",
+  )
+  parser.add_argument(
+    "--corpus",
+    action="append",
+    default=[],
+    help="Program, or directory of programs, to compile (default: student_programs)",
+  )
+  parser.add_argument(
+    "--concurrency",
+    action="append",
+    type=int,
+    default=[],
+    help="Number of simultaneous compiles. May be given more than once (default: 1 and the CPU count)",
+  )
+  parser.add_argument("--repeat", type=int, default=3, help="Compiles of each program in the warm (or only) pass")
+  parser.add_argument("--server", help="URL of a running server to compile through, e.g. http://localhost:3000")
+  parser.add_argument("--ccache", action="store_true", help="Compile through ccache, as build.py does")
+  parser.add_argument("--wasm", action="store_true", help="Compile to WebAssembly instead of JS")
+  parser.add_argument("--profile", help="libkipr optimization profile to link against (e.g. O0, O2, Os)")
+  parser.add_argument("--output", help="Path to write the JSON results (default: stdout)")
+  parser.add_argument("--baseline", help="Earlier results to compare p95 latency against")
+  parser.add_argument(
+    "--max-regression",
+    type=float,
+    default=0.1,
+    help="Allowed p95 slowdown relative to --baseline, as a fraction",
+  )
+  args = parser.parse_args()
+
+  with open(args.dependencies, 'r', encoding='utf-8') as f:
+    dependencies = json.load(f)
+
+  programs = find_programs(args.corpus or [working_dir / 'student_programs'])
+  compiled = [program for program in programs if program.cc is not None]
+  python_programs = [program for program in programs if program.cc is None]
+  if not compiled and not python_programs:
+    print('No C, C++ or Python programs found in the corpus', file=sys.stderr)
+    sys.exit(1)
+
+  server = args.server.rstrip('/') if args.server else None
+  if server and (args.ccache or args.wasm):
+    print('--ccache and --wasm do not apply to --server, which compiles with its own settings', file=sys.stderr)
+    sys.exit(1)
+
+  if args.ccache and shutil.which('ccache') is None:
+    print('ccache is not installed', file=sys.stderr)
+    sys.exit(1)
+
+  if args.wasm:
+    if 'compile_flags_wasm' not in dependencies:
+      print('dependencies.json has no compile_flags_wasm. Rerun build.py.', file=sys.stderr)
+      sys.exit(1)
+    flags = dependencies['compile_flags_wasm']
+  else:
+    flags = dependencies.get('compile_flags', DEFAULT_COMPILE_FLAGS)
+
+  profile = None
+  if args.profile:
+    profiles = dependencies.get('libkipr_c_profiles', {})
+    if args.profile not in profiles:
+      print(f"Unknown libkipr profile {args.profile}. Available: {', '.join(profiles) or 'none'}", file=sys.stderr)
+      sys.exit(1)
+    profile = profiles[args.profile]
+
+  python_stdlib = dependencies.get('python_stdlib', {})
+  skipped = []
+  if python_programs and not (python_stdlib.get('python') and os.path.exists(python_stdlib['python'])):
+    print('dependencies.json has no native Python to check the stdlib bundle with. Skipping Python programs.', file=sys.stderr)
+    skipped = [f'{program.path}' for program in python_programs]
+    python_programs = []
+
+  concurrency_levels = sorted(set(args.concurrency or [1, multiprocessing.cpu_count()]))
+
+  def measure(
+    kind: str,
+    cache: str,
+    measure_program: Callable[[Program], Sample],
+    programs: List[Program],
+    concurrency: int,
+  ) -> Dict[str, Any]:
+    print(f'{kind} {cache} pass: {len(programs)} programs at concurrency {concurrency}...', file=sys.stderr)
+    before = server_cache_requests(server) if server else None
+    result = run_pass(measure_program, programs, concurrency)
+    after = server_cache_requests(server) if server else None
+    if before is not None and after is not None:
+      result['cache_requests'] = { key: after[key] - before[key] for key in after }
+    return { 'kind': kind, 'concurrency': concurrency, 'cache': cache, **result }
+
+  runs = []
+  for concurrency in concurrency_levels:
+    if compiled and server:
+      cold_programs = [with_nonce(program) for program in compiled]
+      compile_via_server = lambda program: request_compile(server, args.profile, program)
+      runs.append(measure('compile', 'cold', compile_via_server, cold_programs, concurrency))
+      runs.append(measure('compile', 'warm', compile_via_server, cold_programs * args.repeat, concurrency))
+      if runs[-1].get('cache_requests', {}).get('hit') == 0:
+        print('The warm pass had no compile cache hits. Is the cache enabled on the server?', file=sys.stderr)
+    elif compiled and args.ccache:
+      with tempfile.TemporaryDirectory(prefix='kipr-benchmark-ccache-') as ccache_dir:
+        env = compiler_env(dependencies, Path(ccache_dir))
+        compile_direct = lambda program: compile_program(dependencies, flags, profile, env, program)
+        runs.append(measure('compile', 'cold', compile_direct, compiled, concurrency))
+        runs.append(measure('compile', 'warm', compile_direct, compiled * args.repeat, concurrency))
+    elif compiled:
+      env = compiler_env(dependencies, None)
+      compile_direct = lambda program: compile_program(dependencies, flags, profile, env, program)
+      runs.append(measure('compile', 'none', compile_direct, compiled * args.repeat, concurrency))
+
+    if python_programs:
+      check_python = lambda program: check_python_program(python_stdlib['python'], python_stdlib['bundle'], program)
+      runs.append(measure('python_import', 'none', check_python, python_programs * args.repeat, concurrency))
+
+  results = {
+    'backend': 'server' if server else 'emcc',
+    'emsdk_version': dependencies.get('emsdk_version'),
+    'libkipr_hash': dependencies.get('libkipr_hash'),
+    'compile_flags': flags,
+    'wasm': args.wasm,
+    'profile': args.profile,
+    'compile_harness': 'compile_harness' in dependencies,
+    'ccache': args.ccache,
+    'cpu_count': multiprocessing.cpu_count(),
+    'programs': [f'{program.path}' for program in programs],
+    'skipped': skipped,
+    'runs': runs,
+  }
+
+  output = json.dumps(results, indent=2)
+  if args.output:
+    with open(args.output, 'w', encoding='utf-8') as f:
+      f.write(output)
+  else:
+    print(output)
+
+  failed = any(run['failures'] for run in runs)
+
+  if args.baseline:
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+      baseline = json.load(f)
+    mismatches = setting_mismatches(results, baseline)
+    for mismatch in mismatches:
+      print(f'Baseline is not comparable, {mismatch}', file=sys.stderr)
+    regressions = [] if mismatches else find_regressions(results, baseline, args.max_regression)
+    for regression in regressions:
+      print(f'Regression: {regression}', file=sys.stderr)
+    failed = failed or bool(mismatches) or bool(regressions)
+
+  if failed:
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+  main()
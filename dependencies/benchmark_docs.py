@@ -0,0 +1,305 @@
+#!/usr/bin/python3
+"""
+benchmark_docs.py
+
+Measures how the documentation pipeline scales with the size of the
+documented library. For each corpus size, a synthetic Doxygen XML tree is
+generated and both stages of the pipeline are run on it:
+
+  doxygen_json  generate_doxygen_json.py, from the XML to json.json
+  docs_tr_ts    generate_docs_tr_ts.py, from json.json to docs.generated.ts
+
+Each run records wall time, peak memory and output size. The synthetic
+corpus mirrors libkipr's: every function is documented in both its group and
+its header, parameter types refer to structs, and one in ten detailed
+descriptions nests <para> elements up to --nesting levels deep, with text at
+every level.
+
+For each pair of consecutive sizes, the growth in time is reported as an
+exponent (1 for linear scaling). The script exits with status 1 if any stage
+scales worse than --max-exponent, which catches super-linear regressions
+before they show up on the real documentation.
+
+Usage:
+  python3 benchmark_docs.py \
+    --size 500 --size 5000 --size 20000 \
+    --output docs_benchmark.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List
+
+working_dir = Path(__file__).parent.absolute()
+
+# Modules whose group and header files match generate_doxygen_json.py's xml_file_matches
+MODULES = ['analog', 'button', 'console', 'digital', 'motor', 'servo']
+
+WORDS = (
+  'the motor servo port sensor value returns position velocity ticks counter analog digital '
+  'button console wait time milliseconds power percent enable disable clear set get current '
+  'speed robot wheel distance threshold reading range specified between'
+).split()
+
+TYPES = ['int', 'double', 'float', 'unsigned char', 'const char *']
+
+
+@dataclass
+class Sample:
+  seconds: float
+  peak_rss: int
+  output_size: int
+
+
+def sentence(rng: random.Random, words: int) -> str:
+  return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+def nested_paragraphs(rng: random.Random, depth: int) -> str:
+  """<para> elements nested `depth` deep, with text and inline markup at every level."""
+  opening = ''.join(
+    f'<para>{sentence(rng, 6)} <computeroutput>{rng.choice(WORDS)}</computeroutput> '
+    for _ in range(depth)
+  )
+  closing = ''.join(f' {sentence(rng, 4)}</para>' for _ in range(depth))
+  return opening + closing
+
+
+def function_memberdef(rng: random.Random, function_id: str, name: str, structs: List[str], nesting: int) -> str:
+  depth = rng.randint(1, nesting) if rng.random() < 0.1 else rng.randint(1, 3)
+  parameters = []
+  parameter_items = []
+  for i in range(rng.randint(0, 4)):
+    if structs and rng.random() < 0.2:
+      struct = rng.choice(structs)
+      parameter_type = f'<ref refid="struct_{struct}" kindref="compound">{struct}</ref> *'
+    else:
+      parameter_type = rng.choice(TYPES)
+    parameters.append(f'<param><type>{parameter_type}</type><declname>p{i}</declname></param>')
+    parameter_items.append(
+      f'<parameteritem><parameternamelist><parametername>p{i}</parametername></parameternamelist>'
+      f'<parameterdescription><para>{sentence(rng, 8)}</para></parameterdescription></parameteritem>'
+    )
+
+  return f'''<memberdef kind="function" id="{function_id}" prot="public" static="no">
+<type>EXPORT_SYM {rng.choice(TYPES)}</type>
+<definition>{name}</definition>
+<name>{name}</name>
+{''.join(parameters)}
+<briefdescription><para>{sentence(rng, 10)}</para></briefdescription>
+<detaileddescription>{nested_paragraphs(rng, depth)}<para>
+<parameterlist kind="param">{''.join(parameter_items)}</parameterlist>
+<simplesect kind="return"><para>{sentence(rng, 6)}</para></simplesect>
+</para></detaileddescription>
+</memberdef>'''
+
+
+def write_xml(path: Path, compounds: str) -> None:
+  path.write_text(f'<?xml version="1.0" encoding="UTF-8"?>\n<doxygen>{compounds}</doxygen>\n', encoding='utf-8')
+
+
+def generate_corpus(directory: Path, functions: int, nesting: int, seed: int) -> int:
+  """Write a synthetic Doxygen XML tree documenting `functions` functions and
+  return its size in bytes."""
+  rng = random.Random(seed)
+  directory.mkdir(parents=True, exist_ok=True)
+  index = []
+
+  structs = [f'{module}_config' for module in MODULES]
+  for struct in structs:
+    members = ''.join(
+      f'<memberdef kind="variable" id="struct_{struct}_1m{i}"><type>{rng.choice(TYPES)}</type><name>m{i}</name>'
+      f'<briefdescription><para>{sentence(rng, 6)}</para></briefdescription><detaileddescription/></memberdef>'
+      for i in range(4)
+    )
+    write_xml(directory / f'struct_{struct}.xml', (
+      f'<compounddef id="struct_{struct}" kind="struct"><compoundname>{struct}</compoundname>'
+      f'<sectiondef kind="public-attrib">{members}</sectiondef>'
+      f'<briefdescription><para>{sentence(rng, 8)}</para></briefdescription>'
+      f'<detaileddescription>{nested_paragraphs(rng, 2)}</detaileddescription></compounddef>'
+    ))
+    index.append(f'<compound refid="struct_{struct}" kind="struct"><name>{struct}</name></compound>')
+
+  for m, module in enumerate(MODULES):
+    count = functions // len(MODULES) + (1 if m < functions % len(MODULES) else 0)
+    memberdefs = ''.join(
+      function_memberdef(rng, f'group__{module}_1ga{i:08x}', f'{module}_{rng.choice(WORDS)}_{i}', structs, nesting)
+      for i in range(count)
+    )
+
+    # Doxygen documents grouped functions in both the group and the header
+    write_xml(directory / f'group__{module}.xml', (
+      f'<compounddef id="group__{module}" kind="group"><compoundname>{module}</compoundname>'
+      f'<title>{module}</title><sectiondef kind="func">{memberdefs}</sectiondef></compounddef>'
+    ))
+    write_xml(directory / f'{module}_8h.xml', (
+      f'<compounddef id="{module}_8h" kind="file"><compoundname>{module}.h</compoundname>'
+      f'<sectiondef kind="func">{memberdefs}</sectiondef></compounddef>'
+    ))
+    index.append(f'<compound refid="group__{module}" kind="group"><name>{module}</name></compound>')
+    index.append(f'<compound refid="{module}_8h" kind="file"><name>{module}.h</name></compound>')
+
+  write_xml(directory / 'index.xml', ''.join(index))
+  return sum(path.stat().st_size for path in directory.iterdir())
+
+
+def run(args: List[str], outputs: List[Path]) -> Sample:
+  start = time.perf_counter()
+  process = subprocess.Popen(args, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+  stderr = process.stderr.read()
+  # The rusage of the waited-for child covers the children it waited for, e.g. parser processes
+  _, status, rusage = os.wait4(process.pid, 0)
+  seconds = time.perf_counter() - start
+  process.stderr.close()
+  if not os.WIFEXITED(status) or os.WEXITSTATUS(status) != 0:
+    raise RuntimeError(f"{' '.join(args)} failed:\n{stderr.decode(errors='replace')}")
+
+  return Sample(
+    seconds=seconds,
+    peak_rss=rusage.ru_maxrss * 1024,
+    output_size=sum(path.stat().st_size for path in outputs),
+  )
+
+
+def summarize(samples: List[Sample]) -> Dict[str, Any]:
+  return {
+    'seconds': {
+      'min': min(sample.seconds for sample in samples),
+      'median': statistics.median(sample.seconds for sample in samples),
+    },
+    'peak_rss_bytes': max(sample.peak_rss for sample in samples),
+    'output_bytes': samples[-1].output_size,
+  }
+
+
+def benchmark_size(functions: int, nesting: int, seed: int, repeat: int, jobs: int) -> Dict[str, Any]:
+  with tempfile.TemporaryDirectory(prefix='kipr-docs-benchmark-') as work_dir:
+    work_dir = Path(work_dir)
+    xml_dir = work_dir / 'xml'
+    corpus_bytes = generate_corpus(xml_dir, functions, nesting, seed)
+
+    json_path = work_dir / 'json.json'
+    common_path = work_dir / 'json_common.json'
+    ts_path = work_dir / 'docs.generated.ts'
+
+    doxygen_json = [
+      run([
+        sys.executable, f'{working_dir / "generate_doxygen_json.py"}',
+        f'{xml_dir}', f'{json_path}', f'{common_path}', '--jobs', f'{jobs}'
+      ], [json_path, common_path])
+      for _ in range(repeat)
+    ]
+    docs_tr_ts = [
+      run([
+        sys.executable, f'{working_dir / "generate_docs_tr_ts.py"}',
+        '--input', f'{json_path}', '--output', f'{ts_path}'
+      ], [ts_path])
+      for _ in range(repeat)
+    ]
+
+  return {
+    'functions': functions,
+    'corpus_bytes': corpus_bytes,
+    'stages': {
+      'doxygen_json': summarize(doxygen_json),
+      'docs_tr_ts': summarize(docs_tr_ts),
+    },
+  }
+
+
+def scaling(runs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+  """Growth exponent of each stage's median time between consecutive sizes."""
+  results = []
+  for smaller, larger in zip(runs, runs[1:]):
+    for stage in smaller['stages']:
+      before = smaller['stages'][stage]['seconds']['median']
+      after = larger['stages'][stage]['seconds']['median']
+      results.append({
+        'stage': stage,
+        'from_functions': smaller['functions'],
+        'to_functions': larger['functions'],
+        'exponent': math.log(after / before) / math.log(larger['functions'] / smaller['functions']),
+      })
+  return results
+
+
+def main() -> None:
+  parser = argparse.ArgumentParser()
+  parser.add_argument(
+    "--size",
+    action="append",
+    type=int,
+    default=[],
+    help="Number of functions in a corpus. May be given more than once (default: 500, 5000 and 20000)",
+  )
+  parser.add_argument("--nesting", type=int, default=64, help="Maximum depth of nested <para> elements")
+  parser.add_argument("--seed", type=int, default=0, help="Seed for the corpus generator")
+  parser.add_argument("--repeat", type=int, default=3, help="Runs of each stage per corpus")
+  parser.add_argument("--jobs", type=int, default=1, help="Processes generate_doxygen_json.py parses with")
+  parser.add_argument(
+    "--max-exponent",
+    type=float,
+    default=1.3,
+    help="Largest allowed growth exponent of a stage's time between consecutive sizes",
+  )
+  parser.add_argument("--output", help="Path to write the JSON results (default: stdout)")
+  parser.add_argument(
+    "--generate-only",
+    metavar="DIR",
+    help="Write a corpus of the first --size to DIR and exit, without benchmarking",
+  )
+  args = parser.parse_args()
+
+  sizes = sorted(set(args.size or [500, 5000, 20000]))
+  if args.generate_only:
+    corpus_bytes = generate_corpus(Path(args.generate_only), sizes[0], args.nesting, args.seed)
+    print(f'Wrote {sizes[0]} functions ({corpus_bytes} bytes) to {args.generate_only}', file=sys.stderr)
+    return
+
+  runs = []
+  for functions in sizes:
+    print(f'Benchmarking {functions} functions...', file=sys.stderr)
+    runs.append(benchmark_size(functions, args.nesting, args.seed, args.repeat, args.jobs))
+
+  results = {
+    'nesting': args.nesting,
+    'seed': args.seed,
+    'repeat': args.repeat,
+    'jobs': args.jobs,
+    'cpu_count': os.cpu_count(),
+    'runs': runs,
+    'scaling': scaling(runs),
+  }
+
+  output = json.dumps(results, indent=2)
+  if args.output:
+    with open(args.output, 'w', encoding='utf-8') as f:
+      f.write(output)
+  else:
+    print(output)
+
+  superlinear = [result for result in results['scaling'] if result['exponent'] > args.max_exponent]
+  for result in superlinear:
+    print(
+      f"Super-linear scaling: {result['stage']} from {result['from_functions']} to "
+      f"{result['to_functions']} functions, exponent {result['exponent']:.2f}",
+      file=sys.stderr,
+    )
+  if superlinear:
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+  main()
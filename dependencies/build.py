@@ -6,25 +6,45 @@ import pathlib
 import json
 import multiprocessing
 import hashlib
+import threading
+import time
+import contextlib
+import argparse
+import shutil
+import tarfile
+import gzip
+import base64
+import io
+import sys
+try:
+  import brotli
+except ImportError:
+  brotli = None
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass
+from typing import Callable, Dict, List
 
 def sha1OfFile(filepath):
   sha = hashlib.sha1()
   with open(filepath, 'rb') as f:
     while True:
-      block = f.read(2**10) # Magic number: one-megabyte blocks.
+      block = f.read(2**20) # Magic number: one-megabyte blocks.
       if not block: break
       sha.update(block)
     return sha.hexdigest()
 
-def hash_dir(dir_path):
-  hashes = []
-  for path, dirs, files in os.walk(dir_path):
-    for file in sorted(files):
-      hashes.append(sha1OfFile(os.path.join(path, file)))
-    for dir in sorted(dirs):
-      hashes.append(hash_dir(os.path.join(path, dir)))
-    break
-  return str(hash(''.join(hashes)))
+parser = argparse.ArgumentParser(
+  prog = 'build',
+  description = 'Builds the Simulator dependencies and writes dependencies.json'
+)
+
+parser.add_argument(
+  '--artifact-store',
+  default = os.environ.get('BUILD_ARTIFACT_STORE'),
+  help = 'Directory of prebuilt stage archives to restore from and export to (default: $BUILD_ARTIFACT_STORE)'
+)
+
+args = parser.parse_args()
 
 def is_tool(name):
     """Check whether `name` is on PATH and marked as executable."""
@@ -51,22 +71,575 @@ if not is_tool('doxygen'):
 
 working_dir = pathlib.Path(__file__).parent.absolute()
 
+# Build tracing
+
+class BuildTrace:
+  """Records how long each stage and each child process of the build takes.
+
+  Results are written as a Chrome trace-event file (viewable in
+  chrome://tracing or Perfetto) and as a Prometheus textfile.
+  """
+  def __init__(self):
+    self.start = time.perf_counter()
+    self.lock = threading.Lock()
+    self.local = threading.local()
+    self.events = []
+    self.stages = []
+    self.steps = []
+
+  def timestamp(self, t):
+    """Convert a `time.perf_counter()` value to trace microseconds."""
+    return int((t - self.start) * 1e6)
+
+  @property
+  def stage(self):
+    return getattr(self.local, 'stage', 'setup')
+
+  @contextlib.contextmanager
+  def span(self, name, category):
+    """Record the enclosed block as a trace event. Yields a dictionary of event args."""
+    args = {}
+    previous_stage = self.stage
+    if category == 'stage':
+      self.local.stage = name
+    start = time.perf_counter()
+    try:
+      yield args
+    finally:
+      end = time.perf_counter()
+      self.local.stage = previous_stage
+      with self.lock:
+        self.events.append({
+          'name': name,
+          'cat': category,
+          'ph': 'X',
+          'ts': self.timestamp(start),
+          'dur': self.timestamp(end) - self.timestamp(start),
+          'pid': os.getpid(),
+          'tid': threading.get_ident(),
+          'args': args
+        })
+        if category == 'stage':
+          self.stages.append({
+            'stage': name,
+            'wall': end - start,
+            'cached': args.get('cached', False)
+          })
+
+  def add_step(self, step, start, end, rusage):
+    cpu = rusage.ru_utime + rusage.ru_stime
+    # ru_maxrss is in KiB on Linux
+    max_rss = rusage.ru_maxrss * 1024
+    with self.lock:
+      self.events.append({
+        'name': step,
+        'cat': 'process',
+        'ph': 'X',
+        'ts': self.timestamp(start),
+        'dur': self.timestamp(end) - self.timestamp(start),
+        'pid': os.getpid(),
+        'tid': threading.get_ident(),
+        'args': {
+          'stage': self.stage,
+          'cpu_seconds': cpu,
+          'max_rss_bytes': max_rss
+        }
+      })
+      self.steps.append({
+        'stage': self.stage,
+        'step': step,
+        'wall': end - start,
+        'cpu': cpu,
+        'max_rss': max_rss
+      })
+
+  def write_chrome_trace(self, path):
+    with self.lock:
+      events = sorted(self.events, key = lambda event: event['ts'])
+    with open(path, 'w') as f:
+      json.dump({ 'traceEvents': events, 'displayTimeUnit': 'ms' }, f)
+
+  def write_prometheus(self, path):
+    def label(value):
+      return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    lines = [
+      '# HELP simulator_build_duration_seconds Wall time of the whole dependency build.',
+      '# TYPE simulator_build_duration_seconds gauge',
+      f'simulator_build_duration_seconds {time.perf_counter() - self.start}',
+      '# HELP simulator_build_stage_duration_seconds Wall time of each build stage.',
+      '# TYPE simulator_build_stage_duration_seconds gauge',
+    ]
+    with self.lock:
+      stages = list(self.stages)
+      steps = list(self.steps)
+    for stage in stages:
+      lines.append(f'simulator_build_stage_duration_seconds{{stage="{label(stage["stage"])}"}} {stage["wall"]}')
+    lines += [
+      '# HELP simulator_build_stage_cached Whether the stage was skipped because its inputs were unchanged.',
+      '# TYPE simulator_build_stage_cached gauge',
+    ]
+    for stage in stages:
+      lines.append(f'simulator_build_stage_cached{{stage="{label(stage["stage"])}"}} {int(stage["cached"])}')
+
+    step_metrics = [
+      ('simulator_build_step_duration_seconds', 'Wall time of each build process.', 'wall'),
+      ('simulator_build_step_cpu_seconds', 'User and system CPU time of each build process and its children.', 'cpu'),
+      ('simulator_build_step_max_rss_bytes', 'Peak resident set size of the largest process in each build step.', 'max_rss'),
+    ]
+    for name, help, field in step_metrics:
+      lines.append(f'# HELP {name} {help}')
+      lines.append(f'# TYPE {name} gauge')
+      # A stage may run the same step more than once; keep the totals per step.
+      totals = {}
+      for step in steps:
+        labels = (step['stage'], step['step'])
+        if field == 'max_rss':
+          totals[labels] = max(totals.get(labels, 0), step[field])
+        else:
+          totals[labels] = totals.get(labels, 0) + step[field]
+      for (stage, step), value in totals.items():
+        lines.append(f'{name}{{stage="{label(stage)}",step="{label(step)}"}} {value}')
+
+    with open(path, 'w') as f:
+      f.write('\n'.join(lines) + '\n')
+
+trace = BuildTrace()
+
+def run(step, args, check = True, **kwargs):
+  """Like `subprocess.run`, but records the child's wall time, CPU time and peak RSS as `step`."""
+  start = time.perf_counter()
+  process = subprocess.Popen(args, **kwargs)
+  _, status, rusage = os.wait4(process.pid, 0)
+  end = time.perf_counter()
+
+  process.returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+  trace.add_step(step, start, end, rusage)
+
+  if check and process.returncode != 0:
+    raise subprocess.CalledProcessError(process.returncode, args)
+  return process
+
+# Job budget
+
+def cgroup_cpu_limit():
+  """Return the CPU quota imposed by the container's cgroup, or None."""
+  try:
+    # cgroup v2
+    with open('/sys/fs/cgroup/cpu.max') as f:
+      quota, period = f.read().split()
+    if quota != 'max':
+      return max(1, int(quota) // int(period))
+    return None
+  except (OSError, ValueError):
+    pass
+  try:
+    # cgroup v1
+    with open('/sys/fs/cgroup/cpu/cpu.cfs_quota_us') as f:
+      quota = int(f.read())
+    with open('/sys/fs/cgroup/cpu/cpu.cfs_period_us') as f:
+      period = int(f.read())
+    if quota > 0:
+      return max(1, quota // period)
+  except (OSError, ValueError):
+    pass
+  return None
+
+def cgroup_memory_limit():
+  """Return the memory limit (in bytes) imposed by the container's cgroup, or None."""
+  for limit_path in ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+    try:
+      with open(limit_path) as f:
+        limit = f.read().strip()
+    except OSError:
+      continue
+    if limit == 'max': return None
+    try:
+      limit = int(limit)
+    except ValueError:
+      continue
+    # cgroup v1 reports "unlimited" as a huge page-aligned number
+    if limit >= 2**60: return None
+    return limit
+  return None
+
+# Rough peak memory of a single emcc/clang compile job
+memory_per_job = 1 << 30
+
+def job_budget():
+  """Return the total number of compile jobs the build may run at once.
+
+  Honors BUILD_JOBS if set, otherwise the smaller of the usable CPUs and the
+  number of jobs that fit in the container's memory limit.
+  """
+  if 'BUILD_JOBS' in os.environ:
+    return max(1, int(os.environ['BUILD_JOBS']))
+
+  try:
+    jobs = len(os.sched_getaffinity(0))
+  except AttributeError:
+    jobs = multiprocessing.cpu_count()
+
+  cpu_limit = cgroup_cpu_limit()
+  if cpu_limit is not None:
+    jobs = min(jobs, cpu_limit)
+
+  memory_limit = cgroup_memory_limit()
+  if memory_limit is not None:
+    jobs = min(jobs, max(1, memory_limit // memory_per_job))
+
+  return max(1, jobs)
+
+class JobServer:
+  """A GNU make jobserver shared by every stage of the build.
+
+  The pipe holds one token per job in the budget. Each running stage holds a
+  token for its own implicit job, and every `make` started with `make_env()`
+  takes additional tokens from the same pipe, so concurrently running builds
+  never exceed the budget between them.
+  """
+  def __init__(self, jobs):
+    self.jobs = jobs
+    self.read_fd, self.write_fd = os.pipe()
+    os.write(self.write_fd, b'+' * jobs)
+
+  def acquire(self):
+    os.read(self.read_fd, 1)
+
+  def release(self):
+    os.write(self.write_fd, b'+')
+
+  def make_env(self, env):
+    """Return a copy of `env` that makes child `make`s join this jobserver."""
+    env = dict(env)
+    env['MAKEFLAGS'] = f'-j --jobserver-auth={self.read_fd},{self.write_fd}'
+    return env
+
+  @property
+  def fds(self):
+    return (self.read_fd, self.write_fd)
+
+jobserver = JobServer(job_budget())
+
+# Stage cache
+
+# Each stage records a manifest of the inputs it was built from. When a later
+# run computes the same inputs and the recorded outputs still exist, the stage
+# is skipped and its recorded outputs are reused.
+stage_cache_dir = working_dir / 'build_cache'
+
+def stage_key(inputs):
+  """Return the cache key for a stage's inputs (a JSON-serializable dict)."""
+  return hashlib.sha1(json.dumps(inputs, sort_keys = True).encode()).hexdigest()
+
+class ArtifactStore:
+  """A directory of compressed stage outputs, keyed by stage name and input hash.
+
+  Archives store output paths relative to the dependencies directory, so they
+  can be restored on another machine or in another Docker layer.
+  """
+  def __init__(self, root):
+    self.root = pathlib.Path(root)
+
+  def archive_path(self, name, key):
+    return self.root / name / f'{key}.tar.gz'
+
+  def archive_members(self, outputs):
+    """Return the relative paths to archive, dropping outputs nested in other outputs."""
+    paths = sorted(set(os.path.relpath(path, working_dir) for path in outputs.values()))
+    for path in paths:
+      if path.startswith('..'):
+        raise ValueError(f'Cannot archive {path}: outside of {working_dir}')
+    return [
+      path for path in paths
+      if not any(path.startswith(other + os.sep) for other in paths)
+    ]
+
+  def restore(self, name, key, outputs):
+    """Extract the archive for `name` and `key` if the store has one. Returns whether it did."""
+    archive_path = self.archive_path(name, key)
+    if not archive_path.exists():
+      return False
+
+    print(f'Restoring {name} from {archive_path}...')
+    for member in self.archive_members(outputs):
+      member_path = working_dir / member
+      if member_path.is_dir() and not member_path.is_symlink():
+        shutil.rmtree(member_path)
+      elif os.path.lexists(member_path):
+        os.remove(member_path)
+
+    with tarfile.open(archive_path, 'r:gz') as archive:
+      if hasattr(tarfile, 'data_filter'):
+        archive.extractall(working_dir, filter = 'data')
+      else:
+        archive.extractall(working_dir)
+
+    return all(os.path.exists(path) for path in outputs.values())
+
+  def save(self, name, key, outputs):
+    """Archive the outputs of `name` under `key` unless the store already has them."""
+    archive_path = self.archive_path(name, key)
+    if archive_path.exists():
+      return
+
+    print(f'Exporting {name} to {archive_path}...')
+    os.makedirs(archive_path.parent, exist_ok=True)
+    # Written under a temporary name so concurrent builds never see a partial archive
+    temp_path = archive_path.with_name(f'{archive_path.name}.{os.getpid()}.tmp')
+    with tarfile.open(temp_path, 'w:gz', compresslevel = 6) as archive:
+      for member in self.archive_members(outputs):
+        archive.add(working_dir / member, arcname = member)
+    os.replace(temp_path, archive_path)
+
+artifact_store = ArtifactStore(args.artifact_store) if args.artifact_store else None
+
+def run_stage(name, inputs, outputs, build, archive = False):
+  """Run `build()` unless stage `name` was already built from `inputs`.
+
+  `outputs` maps output names to the paths the stage produces. If `archive` is
+  set and an artifact store is configured, the outputs are restored from the
+  store instead of being built when possible, and exported to it otherwise.
+  Returns the stage's cache key, which downstream stages include in their own
+  inputs.
+  """
+  with trace.span(name, 'stage') as span_args:
+    key = stage_key(inputs)
+    span_args['key'] = key
+    span_args['cached'] = stage_is_cached(name, key, outputs)
+    if span_args['cached']:
+      print(f'{name} is up to date, skipping')
+      return key
+
+    store = artifact_store if archive else None
+    span_args['restored'] = False
+    if store is not None:
+      with trace.span(f'restore {name}', 'store'):
+        span_args['restored'] = store.restore(name, key, outputs)
+
+    if not span_args['restored']:
+      build()
+      if store is not None:
+        with trace.span(f'export {name}', 'store'):
+          store.save(name, key, outputs)
+
+  os.makedirs(stage_cache_dir, exist_ok=True)
+  with open(stage_cache_dir / f'{name}.json', 'w') as f:
+    json.dump({
+      'key': key,
+      'inputs': inputs,
+      'outputs': outputs
+    }, f, indent = 2, sort_keys = True)
+
+  return key
+
+def stage_is_cached(name, key, outputs):
+  """Check whether stage `name` has a manifest for `key` and its outputs still exist."""
+  manifest_path = stage_cache_dir / f'{name}.json'
+
+  try:
+    with open(manifest_path) as f:
+      manifest = json.load(f)
+  except (OSError, ValueError):
+    manifest = None
+
+  return (
+    manifest is not None and
+    manifest.get('key') == key and
+    manifest.get('outputs') == outputs and
+    all(os.path.exists(path) for path in outputs.values())
+  )
+
+# Tree hashing
+
+class TreeHasher:
+  """Computes stable Merkle-style digests of directory trees.
+
+  File digests are computed on a thread pool (hashlib releases the GIL while
+  hashing) and remembered in an on-disk index keyed by path, size, mtime and
+  inode, so files that have not changed since the last build are not re-read.
+  """
+  # Files modified this recently are not indexed, since a later write within
+  # the same mtime tick would go unnoticed.
+  racy_seconds = 2
+
+  def __init__(self, index_path):
+    self.index_path = index_path
+    self.lock = threading.Lock()
+    try:
+      with open(index_path) as f:
+        self.index = json.load(f)
+    except (OSError, ValueError):
+      self.index = {}
+
+  def file_digest(self, path, st):
+    signature = [st.st_size, st.st_mtime_ns, st.st_ino]
+    with self.lock:
+      cached = self.index.get(path)
+    if cached is not None and cached[:3] == signature:
+      return cached[3]
+
+    digest = sha1OfFile(path)
+    if st.st_mtime_ns < (time.time() - self.racy_seconds) * 1e9:
+      with self.lock:
+        self.index[path] = signature + [digest]
+    return digest
+
+  def scan(self, dir_path, exclude, files):
+    """Return the sorted entries of `dir_path`, appending every file found to `files`."""
+    entries = []
+    with os.scandir(dir_path) as it:
+      for entry in sorted(it, key = lambda entry: entry.name):
+        if entry.name in exclude: continue
+        if entry.is_symlink():
+          entries.append(('l', entry.name, os.readlink(entry.path)))
+        elif entry.is_dir():
+          entries.append(('d', entry.name, self.scan(entry.path, (), files)))
+        elif entry.is_file():
+          entries.append(('f', entry.name, entry.path))
+          files.append(entry)
+    return entries
+
+  def merkle(self, entries, file_digests):
+    sha = hashlib.sha1()
+    for kind, name, value in entries:
+      if kind == 'f':
+        digest = file_digests[value]
+      elif kind == 'd':
+        digest = self.merkle(value, file_digests)
+      else:
+        digest = value
+      sha.update(f'{kind} {name} {digest}\n'.encode())
+    return sha.hexdigest()
+
+  def hash_dir(self, dir_path, exclude = ()):
+    files = []
+    entries = self.scan(dir_path, exclude, files)
+
+    with ThreadPoolExecutor() as executor:
+      digests = executor.map(lambda entry: self.file_digest(entry.path, entry.stat()), files)
+      file_digests = dict(zip((entry.path for entry in files), digests))
+
+    self.save()
+    return self.merkle(entries, file_digests)
+
+  def save(self):
+    with self.lock:
+      os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+      temp_path = f'{self.index_path}.{threading.get_ident()}.tmp'
+      with open(temp_path, 'w') as f:
+        json.dump(self.index, f)
+      os.replace(temp_path, self.index_path)
+
+tree_hasher = TreeHasher(stage_cache_dir / 'hash_index.json')
+
+def hash_dir(dir_path, exclude = ()):
+  """Return a stable digest of a directory tree.
+
+  Unlike Python's builtin `hash()`, the digest does not depend on the
+  interpreter's per-process salt, so it can be used as a cache key across runs.
+  Top-level entries named in `exclude` (e.g. build output directories that live
+  inside a source checkout) are skipped.
+  """
+  with trace.span(f'hash {os.path.basename(dir_path)}', 'hash'):
+    return tree_hasher.hash_dir(dir_path, exclude)
+
+# Stage graph
+
+@dataclass
+class Stage:
+  name: str
+  # Names of the stages this stage depends on
+  deps: List[str]
+  # Called with the cache keys of `deps` to produce this stage's inputs
+  inputs: Callable[[Dict[str, str]], dict]
+  outputs: Dict[str, str]
+  build: Callable[[], None]
+  # Whether the outputs are worth keeping in the artifact store
+  archive: bool = False
+
+stages: List[Stage] = []
+
+def run_stages(stages):
+  """Run `stages` in dependency order, running independent stages concurrently.
+
+  Returns a dictionary of stage names to cache keys. If a stage fails, no new
+  stages are started and the first error is raised once running stages finish.
+  """
+  by_name = {stage.name: stage for stage in stages}
+  for stage in stages:
+    for dep in stage.deps:
+      if dep not in by_name:
+        raise ValueError(f'Stage {stage.name} depends on unknown stage {dep}')
+
+  keys = {}
+  keys_lock = threading.Lock()
+
+  def run_graph_stage(stage):
+    with keys_lock:
+      dep_keys = {dep: keys[dep] for dep in stage.deps}
+    jobserver.acquire()
+    try:
+      key = run_stage(stage.name, stage.inputs(dep_keys), stage.outputs, stage.build, stage.archive)
+    finally:
+      jobserver.release()
+    with keys_lock:
+      keys[stage.name] = key
+
+  pending = list(stages)
+  running = {}
+  error = None
+  with ThreadPoolExecutor(max_workers = len(stages)) as executor:
+    while pending or running:
+      if error is None:
+        for stage in list(pending):
+          if all(dep in keys for dep in stage.deps):
+            pending.remove(stage)
+            running[executor.submit(run_graph_stage, stage)] = stage
+      if not running:
+        if error is not None: break
+        raise ValueError(f'Stage graph has a cycle: {", ".join(stage.name for stage in pending)}')
+
+      done, _ = wait(running, return_when = FIRST_COMPLETED)
+      for future in done:
+        stage = running.pop(future)
+        if future.exception() is not None and error is None:
+          print(f'Stage {stage.name} failed')
+          error = future.exception()
+
+  if error is not None: raise error
+  return keys
+
 emsdk_dir = working_dir / 'emsdk'
 
 emsdk_version = '3.1.19'
 
-# Install emsdk 3.1.19
-print(f'Installing emsdk {emsdk_version}')
-subprocess.run(
-  [emsdk_dir / 'emsdk', 'install', emsdk_version],
-  check = True
-)
+emsdk_dot_emscripten = emsdk_dir / '.emscripten'
 
-# Activate emsdk 3.1.19
-print(f'Activating emsdk {emsdk_version}')
-subprocess.run(
-  [emsdk_dir / 'emsdk', 'activate', emsdk_version],
-  check = True
+def build_emsdk():
+  # Install emsdk 3.1.19
+  print(f'Installing emsdk {emsdk_version}')
+  run(
+    'emsdk install',
+    [emsdk_dir / 'emsdk', 'install', emsdk_version],
+    check = True
+  )
+
+  # Activate emsdk 3.1.19
+  print(f'Activating emsdk {emsdk_version}')
+  run(
+    'emsdk activate',
+    [emsdk_dir / 'emsdk', 'activate', emsdk_version],
+    check = True
+  )
+
+# emsdk provides the toolchain environment every other stage runs in, so it
+# is built before the stage graph is scheduled.
+emsdk_key = run_stage(
+  'emsdk',
+  { 'emsdk_version': emsdk_version },
+  { 'em_config': f'{emsdk_dot_emscripten}' },
+  build_emsdk
 )
 
 # Find paths to emsdk dependencies
@@ -78,72 +651,219 @@ emsdk_path = f'{emsdk_dir}:{emsdk_upstream_dir}:{emsdk_node_dir}'
 path = os.environ['PATH']
 path = f'{emsdk_path}:{path}'
 
+# Emscripten builds system libraries (libc, libc++, asyncify variants, ...)
+# on demand into its cache. The build uses its own cache directory, which is
+# pre-warmed for the /compile flags. The server runs emcc with EM_FROZEN_CACHE,
+# which is what keeps compile requests from building (or racing to build)
+# libraries themselves.
+emscripten_cache_dir = working_dir / 'emscripten_cache'
 
-emsdk_dot_emscripten = emsdk_dir / '.emscripten'
+def set_tree_writable(root, writable):
+  """Add or remove write permission on `root` and everything below it.
+
+  Permission bits do not apply to root, so this does not protect anything
+  from a process running as root (e.g. a container build or server).
+  """
+  for path, dirs, files in os.walk(root):
+    for entry in [path] + [os.path.join(path, name) for name in files]:
+      if os.path.islink(entry): continue
+      mode = os.lstat(entry).st_mode
+      os.chmod(entry, mode | 0o200 if writable else mode & ~0o222)
+
+if emscripten_cache_dir.exists():
+  set_tree_writable(emscripten_cache_dir, True)
 
 env = {
   'PATH': path,
   'EMSDK': f'{emsdk_dir}',
-  'EM_CONFIG': f'{emsdk_dot_emscripten}'
+  'EM_CONFIG': f'{emsdk_dot_emscripten}',
+  'EM_CACHE': f'{emscripten_cache_dir}'
 }
 
+# Compiler cache
+
+# libwallaby is configured and compiled twice (libkipr C and libkipr Python),
+# and most translation units are identical between the two. emcc runs clang
+# through ccache when EM_COMPILER_WRAPPER is set, so the second build reuses
+# the first build's objects. Paths are rewritten relative to the dependencies
+# directory so the differing build directories do not affect the hash.
+ccache_dir = working_dir / 'ccache'
+ccache_max_size = os.environ.get('BUILD_CCACHE_MAX_SIZE', '5G')
+
+if is_tool('ccache'):
+  env.update({
+    'EM_COMPILER_WRAPPER': 'ccache',
+    'CCACHE_DIR': f'{ccache_dir}',
+    'CCACHE_BASEDIR': f'{working_dir}',
+    'CCACHE_NOHASHDIR': '1',
+    'CCACHE_MAXSIZE': ccache_max_size
+  })
+else:
+  print('Warning: ccache is not installed. libwallaby will be compiled from scratch twice.')
+
 libkipr_dir = working_dir / 'libwallaby'
 libkipr_hash = hash_dir(libkipr_dir)
 
 # libkipr (C)
 
-print('Configuring libkipr (C)...')
-
 libkipr_build_c_dir = working_dir / 'libkipr_build_c'
 libkipr_install_c_dir = working_dir / 'libkipr_install_c'
-os.makedirs(libkipr_build_c_dir, exist_ok=True)
-
-subprocess.run(
-  [
-    'emcmake',
-    'cmake',
-    '-Dwith_camera=OFF',
-    '-Dwith_tello=OFF',
-    '-Dwith_python_binding=OFF',
-    '-Dwith_documentation=ON',
-    '-Dwith_tests=OFF',
-    '-Dwith_graphics=OFF',
-    f'-DCMAKE_INSTALL_PREFIX={libkipr_install_c_dir}',
-    libkipr_dir
-  ],
-  cwd = libkipr_build_c_dir,
-  check = True,
-  env = env
-)
 
-print('Building libkipr (C)...')
-subprocess.run(
-  [ 'emmake', 'make', f'-j{multiprocessing.cpu_count()}' ],
-  cwd = libkipr_build_c_dir,
-  check = True,
-  env = env
-)
+libkipr_c_cmake_flags = [
+  '-Dwith_camera=OFF',
+  '-Dwith_tello=OFF',
+  '-Dwith_python_binding=OFF',
+  '-Dwith_documentation=ON',
+  '-Dwith_tests=OFF',
+  '-Dwith_graphics=OFF',
+]
 
-print('Installing libkipr (C)...')
-subprocess.run(
-  [ 'emmake', 'make', 'install' ],
-  cwd = libkipr_build_c_dir,
-  check = True,
-  env = env
-)
+def build_libkipr_c_variant(name, build_dir, install_dir, cmake_flags):
+  print(f'Configuring {name}...')
+  os.makedirs(build_dir, exist_ok=True)
+
+  run(
+    f'cmake configure {name}',
+    [
+      'emcmake',
+      'cmake',
+      *cmake_flags,
+      f'-DCMAKE_INSTALL_PREFIX={install_dir}',
+      libkipr_dir
+    ],
+    cwd = build_dir,
+    check = True,
+    env = env
+  )
+
+  print(f'Building {name}...')
+  run(
+    f'make {name}',
+    [ 'emmake', 'make' ],
+    cwd = build_dir,
+    check = True,
+    env = jobserver.make_env(env),
+    pass_fds = jobserver.fds
+  )
+
+  print(f'Installing {name}...')
+  run(
+    f'make install {name}',
+    [ 'emmake', 'make', 'install' ],
+    cwd = build_dir,
+    check = True,
+    env = jobserver.make_env(env),
+    pass_fds = jobserver.fds
+  )
+
+def build_libkipr_c():
+  build_libkipr_c_variant('libkipr (C)', libkipr_build_c_dir, libkipr_install_c_dir, libkipr_c_cmake_flags)
+
+stages.append(Stage(
+  name = 'libkipr_c',
+  deps = [],
+  inputs = lambda keys: {
+    'emsdk': emsdk_key,
+    'libkipr_hash': libkipr_hash,
+    'cmake_flags': libkipr_c_cmake_flags
+  },
+  outputs = {
+    'libkipr_c': f'{libkipr_install_c_dir}',
+    'documentation_xml': f'{libkipr_build_c_dir}/documentation/xml'
+  },
+  build = build_libkipr_c,
+  archive = True
+))
+
+# libkipr (C) optimization profiles
+
+# Builds of libkipr for /compile to choose from per request: O0 links fastest
+# for iterative classroom use, O2 runs fastest in the simulator and Os is the
+# smallest download. `flags` are added to the /compile compile and link.
+#
+# The default build above has no CMAKE_BUILD_TYPE, so it is already unoptimized
+# and keeps assertions, which is what O0 is for. O0 is an alias for it rather
+# than a separate Release build. O2 and Os are Release builds with their own
+# install prefix and the same headers.
+libkipr_c_profiles = {
+  'O0': ['-O0'],
+  'O2': ['-O2'],
+  'Os': ['-Os'],
+}
+libkipr_c_default_profile = 'O0'
+libkipr_c_built_profiles = [profile for profile in libkipr_c_profiles if profile != libkipr_c_default_profile]
+
+def libkipr_c_profile_dirs(profile):
+  if profile == libkipr_c_default_profile:
+    return libkipr_build_c_dir, libkipr_install_c_dir
+  return working_dir / f'libkipr_build_c_{profile}', working_dir / f'libkipr_install_c_{profile}'
+
+def libkipr_c_profile_cmake_flags(profile):
+  opt_flags = ' '.join([*libkipr_c_profiles[profile], '-DNDEBUG'])
+  return [
+    *[flag for flag in libkipr_c_cmake_flags if flag != '-Dwith_documentation=ON'],
+    '-Dwith_documentation=OFF',
+    '-DCMAKE_BUILD_TYPE=Release',
+    f'-DCMAKE_C_FLAGS_RELEASE={opt_flags}',
+    f'-DCMAKE_CXX_FLAGS_RELEASE={opt_flags}',
+  ]
+
+def add_libkipr_c_profile_stage(profile):
+  build_dir, install_dir = libkipr_c_profile_dirs(profile)
+  cmake_flags = libkipr_c_profile_cmake_flags(profile)
+  stages.append(Stage(
+    name = f'libkipr_c_{profile}',
+    deps = [],
+    inputs = lambda keys: {
+      'emsdk': emsdk_key,
+      'libkipr_hash': libkipr_hash,
+      'cmake_flags': cmake_flags
+    },
+    outputs = { 'libkipr_c': f'{install_dir}' },
+    build = lambda: build_libkipr_c_variant(f'libkipr (C, {profile})', build_dir, install_dir, cmake_flags),
+    archive = True
+  ))
+
+for profile in libkipr_c_built_profiles:
+  add_libkipr_c_profile_stage(profile)
 
 # CPython
 
 cpython_dir = working_dir / 'cpython'
+cpython_patches_dir = working_dir / 'cpython_patches'
 
+def patch_applies(patch_file, *flags):
+    """Check whether `patch` would succeed with `flags`, without touching the tree."""
+    with open(patch_file) as patch:
+        return run(
+            'patch dry run',
+            ['patch', '-p0', '--dry-run', '--silent', *flags],
+            stdin = patch,
+            cwd = working_dir,
+            stdout = subprocess.DEVNULL,
+            stderr = subprocess.DEVNULL,
+            check = False
+        ).returncode == 0
+
+# Patches are only applied once. Re-running `patch --forward` on a patched tree
+# writes .rej files into cpython, which would change cpython_hash below and
+# rebuild CPython (and everything downstream of it) on every build.
 print('Applying cpython patches...')
-for patch_file in (working_dir / 'cpython_patches').glob('*.patch'):
+for patch_file in sorted(cpython_patches_dir.glob('*.patch')):
+    if patch_applies(patch_file, '--reverse', '--force'):
+        print('Already applied:', patch_file)
+        continue
+    if not patch_applies(patch_file, '--forward'):
+        print('Warning: patch does not apply, skipping:', patch_file)
+        continue
     print('Applying patch:', patch_file)
     with open(patch_file) as patch:
-        subprocess.run(
+        run(
+            'patch',
             ['patch', '-p0', '--forward'],
             stdin = patch,
-            cwd = working_dir
+            cwd = working_dir,
+            check = True
         )
 
 print('Finding latest host python...')
@@ -164,104 +884,717 @@ elif is_tool('python3.7'):
 else:
     print('Warning: Python 3.7+ could not be found. Using python3. This might not work.')
 
-print(f'Building cpython with {python}...')
-subprocess.run(
-  [python, 'Tools/wasm/wasm_build.py', 'emscripten-browser'],
-  cwd = cpython_dir,
-  env = env,
-  check = True
-)
+# Hashed after patching so that the key reflects the sources actually built.
+# `builddir` holds the build output and must not feed back into the key.
+cpython_hash = hash_dir(cpython_dir, exclude = ('builddir',))
 
-print('Installing cpython to prefix...')
 cpython_emscripten_build_dir = cpython_dir / 'builddir' / 'emscripten-browser'
 cpython_install_prefix_dir = cpython_emscripten_build_dir / 'prefix'
-subprocess.run(
-  f'make install DESTDIR={cpython_install_prefix_dir}',
-  shell = True,
-  cwd = cpython_emscripten_build_dir,
-  env = env,
-  check = True
-)
+# The native interpreter wasm_build.py builds for cross-compiling. It has the
+# same version (and so the same .pyc format) as the browser interpreter, and
+# packages the stdlib bundle below.
+cpython_build_dir = cpython_dir / 'builddir' / 'build'
+cpython_build_python = cpython_build_dir / 'python'
 
+def makefile_variable(makefile, name):
+  """Return the value assigned to `name` in a generated Makefile."""
+  with open(makefile) as f:
+    for line in f:
+      variable, sep, value = line.partition('=')
+      if sep and variable.strip() == name:
+        return value.strip()
+  raise ValueError(f'{name} is not set in {makefile}')
+
+# wasm_build.py drives configure and make itself. It passes make its own -j and
+# starts it with close_fds, so its makes can neither join the jobserver nor be
+# limited through MAKEFLAGS. Instead, the make it finds first on PATH is a shim
+# that replaces any -j with the number of jobserver tokens the stage holds.
+cpython_make_shim_dir = working_dir / 'cpython_make_shim'
+
+def write_make_shim(jobs):
+  real_make = shutil.which('make')
+  os.makedirs(cpython_make_shim_dir, exist_ok=True)
+  shim_path = cpython_make_shim_dir / 'make'
+  with open(shim_path, 'w') as f:
+    f.write(f'''#!{sys.executable}
+# Generated by build.py. Runs make with -j{jobs} in place of any -j it was given.
+import os
+import sys
+
+args = []
+argv = iter(sys.argv[1:])
+for arg in argv:
+  if arg in ('-j', '--jobs'):
+    # The job count is optional and may be the next argument
+    arg = next(argv, None)
+    if arg is not None and not arg.isdigit():
+      args.append(arg)
+  elif not (arg.startswith('--jobs=') or (arg.startswith('-j') and arg[2:].isdigit())):
+    args.append(arg)
+
+os.execv({str(real_make)!r}, [{str(real_make)!r}, '-j{jobs}', *args])
+''')
+  os.chmod(shim_path, 0o755)
+
+def build_cpython():
+  # The stage already holds one token; take the rest of the budget for the
+  # makes wasm_build.py starts, so concurrent stages wait rather than oversubscribe
+  jobs = jobserver.jobs
+  for _ in range(jobs - 1):
+    jobserver.acquire()
+  try:
+    write_make_shim(jobs)
+    print(f'Building cpython with {python} ({jobs} jobs)...')
+    run(
+      'wasm_build.py',
+      [python, 'Tools/wasm/wasm_build.py', 'emscripten-browser'],
+      cwd = cpython_dir,
+      env = { **env, 'PATH': f'{cpython_make_shim_dir}:{env["PATH"]}' },
+      check = True
+    )
+  finally:
+    for _ in range(jobs - 1):
+      jobserver.release()
+
+  print('Installing cpython to prefix...')
+  run(
+    'make install',
+    f'make install DESTDIR={cpython_install_prefix_dir}',
+    shell = True,
+    cwd = cpython_emscripten_build_dir,
+    env = jobserver.make_env(env),
+    pass_fds = jobserver.fds,
+    check = True
+  )
+
+  # wasm_build.py links the whole stdlib into python.data with --preload-file,
+  # which every page that runs Python would download. Relink python.js without
+  # it. The browser loads the precompiled python_stdlib bundle instead.
+  print('Relinking python.js without the preloaded stdlib...')
+  link_flags = makefile_variable(cpython_emscripten_build_dir / 'Makefile', 'LINKFORSHARED').split()
+  link_flags = [flag for flag in link_flags if not flag.startswith('--preload-file')]
+  for artifact in ('python.js', 'python.data'):
+    if os.path.exists(cpython_emscripten_build_dir / artifact):
+      os.remove(cpython_emscripten_build_dir / artifact)
+  run(
+    'make python.js',
+    [ 'make', 'python.js', f'LINKFORSHARED={" ".join(link_flags)}' ],
+    cwd = cpython_emscripten_build_dir,
+    env = jobserver.make_env(env),
+    pass_fds = jobserver.fds,
+    check = True
+  )
+
+stages.append(Stage(
+  name = 'cpython',
+  deps = [],
+  inputs = lambda keys: {
+    'emsdk': emsdk_key,
+    'cpython_hash': cpython_hash,
+    'patches_hash': hash_dir(cpython_patches_dir),
+    'python': python,
+    # Archives from before the relink still have python.data
+    'preload_stdlib': False
+  },
+  outputs = {
+    'cpython': f'{cpython_emscripten_build_dir}',
+    'prefix': f'{cpython_install_prefix_dir}',
+    # The whole build tree, since the interpreter finds its stdlib from it
+    'build_python': f'{cpython_build_dir}'
+  },
+  build = build_cpython,
+  archive = True
+))
 
 # libkipr (Python)
 
-print('Configuring libkipr (Python)...')
 libkipr_build_python_dir = working_dir / 'libkipr_build_python'
-os.makedirs(libkipr_build_python_dir, exist_ok=True)
 
-# Find 
+libkipr_python_cmake_flags = [
+  '-Dwith_camera=OFF',
+  '-Dwith_tello=OFF',
+  '-Dwith_documentation=OFF',
+  '-Dwith_tests=OFF',
+  '-Dwasm=ON',
+  f'-DPYTHON_LIBRARY={cpython_install_prefix_dir}/usr/local/lib/libpython3.12.a',
+  f'-DPYTHON_INCLUDE_DIR={cpython_install_prefix_dir}/usr/local/include/python3.12',
+]
 
-subprocess.run(
-  [
-    'emcmake',
-    'cmake',
-    '-Dwith_camera=OFF',
-    '-Dwith_tello=OFF',
-    '-Dwith_documentation=OFF',
-    '-Dwith_tests=OFF',
-    '-Dwasm=ON',
-    f'-DPYTHON_LIBRARY={cpython_install_prefix_dir}/usr/local/lib/libpython3.12.a',
-    f'-DPYTHON_INCLUDE_DIR={cpython_install_prefix_dir}/usr/local/include/python3.12',
-    libkipr_dir
-  ],
-  cwd = libkipr_build_python_dir,
-  check = True,
-  env = env
-)
+def build_libkipr_python():
+  print('Configuring libkipr (Python)...')
+  os.makedirs(libkipr_build_python_dir, exist_ok=True)
 
-print('Building libkipr (Python)...')
-subprocess.run(
-  [ 'emmake', 'make', f'-j{multiprocessing.cpu_count()}' ],
-  cwd = libkipr_build_python_dir,
-  check = True,
-  env = env
-)
+  run(
+    'cmake configure',
+    [
+      'emcmake',
+      'cmake',
+      *libkipr_python_cmake_flags,
+      libkipr_dir
+    ],
+    cwd = libkipr_build_python_dir,
+    check = True,
+    env = env
+  )
+
+  print('Building libkipr (Python)...')
+  run(
+    'make',
+    [ 'emmake', 'make' ],
+    cwd = libkipr_build_python_dir,
+    check = True,
+    env = jobserver.make_env(env),
+    pass_fds = jobserver.fds
+  )
+
+stages.append(Stage(
+  name = 'libkipr_python',
+  # libkipr_c is not an input, but building after it lets ccache reuse its objects
+  deps = ['cpython', 'libkipr_c'],
+  inputs = lambda keys: {
+    'emsdk': emsdk_key,
+    'cpython': keys['cpython'],
+    'libkipr_hash': libkipr_hash,
+    'cmake_flags': libkipr_python_cmake_flags
+  },
+  outputs = { 'libkipr_python': f'{libkipr_build_python_dir}' },
+  build = build_libkipr_python,
+  archive = True
+))
 
+# Documentation
 
-print('Generating JSON documentation...')
 libkipr_c_documentation_json = f'{libkipr_build_c_dir}/documentation/json.json'
 libkipr_c_common_documentation = f'{libkipr_build_c_dir}/documentation/json_common.json'
-subprocess.run(
-  [ python, 'generate_doxygen_json.py', f'{libkipr_build_c_dir}/documentation/xml', libkipr_c_documentation_json, libkipr_c_common_documentation],
-  cwd = working_dir,
-  check = True
-)
+# json.json in the string-interned format read by CompactDocumentation.decode
+libkipr_c_compact_documentation = f'{libkipr_build_c_dir}/documentation/json.compact.json'
+# Index and per-module shards the IDE loads on demand, served at /docs/libkipr
+libkipr_c_documentation_bundle = f'{libkipr_build_c_dir}/documentation/bundle'
+# Records parsed from each Doxygen XML file, so a rebuild only re-parses files that changed
+doxygen_json_cache_dir = working_dir / 'doxygen_json_cache'
+
+# Subsets of the documentation besides common, e.g. per curriculum
+doc_subsets_path = working_dir / 'doc_subsets.json'
+with open(doc_subsets_path, 'r') as f:
+  libkipr_c_documentation_subsets = {
+    name: f'{libkipr_build_c_dir}/documentation/json_{name}.json'
+    for name in json.load(f) if name != 'common'
+  }
+
+def build_documentation():
+  print('Generating JSON documentation...')
+  run(
+    'generate_doxygen_json.py',
+    [ python, 'generate_doxygen_json.py', f'{libkipr_build_c_dir}/documentation/xml', libkipr_c_documentation_json, libkipr_c_common_documentation,
+      '--jobs', str(jobserver.jobs),
+      '--cache-dir', f'{doxygen_json_cache_dir}',
+      '--subsets', f'{doc_subsets_path}',
+      '--subset-output-dir', f'{libkipr_build_c_dir}/documentation',
+      '--bundle-dir', libkipr_c_documentation_bundle,
+      '--compact-output', libkipr_c_compact_documentation
+    ],
+    cwd = working_dir,
+    check = True
+  )
+
+stages.append(Stage(
+  name = 'documentation',
+  deps = ['libkipr_c'],
+  inputs = lambda keys: {
+    'libkipr_c': keys['libkipr_c'],
+    'generator_hash': sha1OfFile(working_dir / 'generate_doxygen_json.py'),
+    'subsets_hash': sha1OfFile(doc_subsets_path)
+  },
+  outputs = {
+    'libkipr_c_documentation': libkipr_c_documentation_json,
+    'libkipr_c_common_documentation': libkipr_c_common_documentation,
+    'libkipr_c_documentation_bundle': libkipr_c_documentation_bundle,
+    'libkipr_c_compact_documentation': libkipr_c_compact_documentation,
+    **{
+      f'libkipr_c_{name}_documentation': path
+      for name, path in libkipr_c_documentation_subsets.items()
+    }
+  },
+  build = build_documentation
+))
+
+# kipr-scratch
 
-print('Building kipr-scratch...')
 kipr_scratch_path = working_dir / 'kipr-scratch'
-subprocess.run(
-  [ python, kipr_scratch_path / 'build.py' ],
-  cwd = kipr_scratch_path,
-  check = True
-)
 
-print('Packaging kipr-scratch...')
-subprocess.run(
-  [ python, kipr_scratch_path / 'package.py' ],
-  cwd = kipr_scratch_path,
-  check = True
-)
+def build_kipr_scratch():
+  print('Building kipr-scratch...')
+  run(
+    'kipr-scratch build.py',
+    [ python, kipr_scratch_path / 'build.py' ],
+    cwd = kipr_scratch_path,
+    check = True
+  )
+
+  print('Packaging kipr-scratch...')
+  run(
+    'kipr-scratch package.py',
+    [ python, kipr_scratch_path / 'package.py' ],
+    cwd = kipr_scratch_path,
+    check = True
+  )
+
+stages.append(Stage(
+  name = 'kipr_scratch',
+  deps = [],
+  inputs = lambda keys: {
+    # libwallaby-build and kipr-scratch are produced by build.py/package.py
+    'kipr_scratch_hash': hash_dir(kipr_scratch_path, exclude = ('libwallaby-build', 'kipr-scratch')),
+    'python': python
+  },
+  outputs = { 'kipr_scratch': f'{kipr_scratch_path / "kipr-scratch"}' },
+  build = build_kipr_scratch
+))
+
+# Scratch runtime
 
-print('Generating scratch runtime...')
 scratch_runtime_path = working_dir / 'scratch-rt'
-# emcc -s WASM=0 -s INVOKE_RUN=0 -s ASYNCIFY -s EXIT_RUNTIME=1 -s "EXPORTED_FUNCTIONS=['_main', '_simMainWrapper']" -I${config.server.dependencies.libkipr_c}/include -Wl,--whole-archive -L${config.server.dependencies.libkipr_c}/lib -lkipr -o ${path}.js ${path}
-subprocess.run([
-    'emcc',
-    '-sWASM=0',
-    '-sINVOKE_RUN=0',
-    '-sEXIT_RUNTIME=0',
-    '-sERROR_ON_UNDEFINED_SYMBOLS=0',
-    '-sLINKABLE=1',
-    '-sEXPORT_ALL=1',
-    f'-L{libkipr_install_c_dir}/lib',
-    '-Wl,--whole-archive', '-lkipr', '-Wl,--no-whole-archive',
-    f'-o', f'{scratch_runtime_path}.js',
-    f'{scratch_runtime_path}.c'
-  ],
-  env = env,
-  check = True
-)
+
+scratch_runtime_flags = [
+  '-sWASM=0',
+  '-sINVOKE_RUN=0',
+  '-sEXIT_RUNTIME=0',
+  '-sERROR_ON_UNDEFINED_SYMBOLS=0',
+  '-sLINKABLE=1',
+  '-sEXPORT_ALL=1',
+]
+
+def wasm_variant(flags):
+  """Return `flags` with the wasm2js output switched to WebAssembly."""
+  return ['-sWASM=1' if flag == '-sWASM=0' else flag for flag in flags]
+
+# The same runtime as WebAssembly. Its .wasm is loaded from next to the .js, and
+# the server sends it as application/wasm so browsers can compile it while it
+# downloads (WebAssembly.instantiateStreaming).
+scratch_runtime_wasm_dir = working_dir / 'scratch_rt_wasm'
+scratch_runtime_wasm_flags = wasm_variant(scratch_runtime_flags)
+
+def build_scratch_runtime():
+  print('Generating scratch runtime...')
+  # emcc -s WASM=0 -s INVOKE_RUN=0 -s ASYNCIFY -s EXIT_RUNTIME=1 -s "EXPORTED_FUNCTIONS=['_main', '_simMainWrapper']" -I${config.server.dependencies.libkipr_c}/include -Wl,--whole-archive -L${config.server.dependencies.libkipr_c}/lib -lkipr -o ${path}.js ${path}
+  run('emcc link', [
+      'emcc',
+      *scratch_runtime_flags,
+      f'-L{libkipr_install_c_dir}/lib',
+      '-Wl,--whole-archive', '-lkipr', '-Wl,--no-whole-archive',
+      f'-o', f'{scratch_runtime_path}.js',
+      f'{scratch_runtime_path}.c'
+    ],
+    env = env,
+    check = True
+  )
+
+stages.append(Stage(
+  name = 'scratch_runtime',
+  deps = ['libkipr_c'],
+  inputs = lambda keys: {
+    'emsdk': emsdk_key,
+    'libkipr_c': keys['libkipr_c'],
+    'source_hash': sha1OfFile(f'{scratch_runtime_path}.c'),
+    'flags': scratch_runtime_flags
+  },
+  outputs = { 'graphical_rt': f'{scratch_runtime_path}.js' },
+  build = build_scratch_runtime,
+  archive = True
+))
+
+def build_scratch_runtime_wasm():
+  print('Generating scratch runtime (wasm)...')
+  os.makedirs(scratch_runtime_wasm_dir, exist_ok=True)
+  run('emcc link wasm', [
+      'emcc',
+      *scratch_runtime_wasm_flags,
+      f'-L{libkipr_install_c_dir}/lib',
+      '-Wl,--whole-archive', '-lkipr', '-Wl,--no-whole-archive',
+      '-o', f'{scratch_runtime_wasm_dir / "rt.js"}',
+      f'{scratch_runtime_path}.c'
+    ],
+    env = env,
+    check = True
+  )
+
+stages.append(Stage(
+  name = 'scratch_runtime_wasm',
+  deps = ['libkipr_c'],
+  inputs = lambda keys: {
+    'emsdk': emsdk_key,
+    'libkipr_c': keys['libkipr_c'],
+    'source_hash': sha1OfFile(f'{scratch_runtime_path}.c'),
+    'flags': scratch_runtime_wasm_flags
+  },
+  outputs = { 'graphical_rt_wasm': f'{scratch_runtime_wasm_dir}' },
+  build = build_scratch_runtime_wasm,
+  archive = True
+))
+
+# Python stdlib bundle
+
+python_stdlib_dir = working_dir / 'python_stdlib'
+python_stdlib_bundle = python_stdlib_dir / 'python312.zip'
+python_stdlib_manifest = python_stdlib_dir / 'python312.json'
+kipr_py_path = libkipr_build_python_dir / 'binding' / 'python' / 'package' / 'src' / 'kipr' / 'kipr.py'
+student_programs_dir = working_dir / 'student_programs'
+
+def build_python_stdlib():
+  print('Packaging python stdlib...')
+  run('package_stdlib.py', [
+      cpython_build_python,
+      'package_stdlib.py',
+      '--stdlib', f'{cpython_install_prefix_dir}/usr/local/lib/python3.12',
+      '--entry', f'{kipr_py_path}',
+      '--entry', f'{student_programs_dir}',
+      '--output', f'{python_stdlib_bundle}',
+      '--manifest', f'{python_stdlib_manifest}'
+    ],
+    cwd = working_dir,
+    check = True
+  )
+
+stages.append(Stage(
+  name = 'python_stdlib',
+  deps = ['cpython', 'libkipr_python'],
+  inputs = lambda keys: {
+    'cpython': keys['cpython'],
+    'libkipr_python': keys['libkipr_python'],
+    'packager_hash': sha1OfFile(working_dir / 'package_stdlib.py'),
+    'student_programs_hash': hash_dir(student_programs_dir)
+  },
+  outputs = {
+    'bundle': f'{python_stdlib_bundle}',
+    'manifest': f'{python_stdlib_manifest}'
+  },
+  build = build_python_stdlib
+))
+
+# Compile flags
+
+# Flags used by the server for every /compile request
+compile_flags = [
+  '-sWASM=0',
+  '-sINVOKE_RUN=0',
+  '-sASYNCIFY',
+  '-sEXIT_RUNTIME=1',
+  "-sEXPORTED_FUNCTIONS=['_main', '_simMainWrapper']",
+]
+
+# The same as WebAssembly, so the speedup can be measured before /compile
+# switches over. Output is a .js loader and a .wasm next to it.
+compile_flags_wasm = wasm_variant(compile_flags)
+
+# Compile harness
+
+# Precompiled pieces of every /compile request: the simMainWrapper that the
+# server used to append to each program, and precompiled headers for the
+# includes of the default program templates. -O2 and -Os define __OPTIMIZE__,
+# and clang rejects a PCH built with different predefined macros. So those
+# profiles get their own PCH, built with the profile's flags. The default PCH
+# is built without -O, which is the same as -O0.
+compile_harness_dir = working_dir / 'compile_harness'
+compile_harness_build_dir = working_dir / 'compile_harness_build'
+
+# Must match the compile flags used by the server, or clang rejects the PCH
+compile_include_flags = [
+  f'-I{libkipr_install_c_dir}/include',
+]
+
+compile_harness = {
+  'c': {
+    'prefix_header': f'{compile_harness_dir / "kipr.h"}',
+    'pch': f'{compile_harness_build_dir / "kipr.h.pch"}',
+    'wrapper': f'{compile_harness_build_dir / "sim_main_wrapper_c.o"}'
+  },
+  'cpp': {
+    'prefix_header': f'{compile_harness_dir / "kipr.hpp"}',
+    'pch': f'{compile_harness_build_dir / "kipr.hpp.pch"}',
+    'wrapper': f'{compile_harness_build_dir / "sim_main_wrapper_cpp.o"}'
+  }
+}
+
+def compile_harness_profile_pch(profile):
+  if profile == libkipr_c_default_profile:
+    return { language: compile_harness[language]['pch'] for language in compile_harness }
+  return {
+    'c': f'{compile_harness_build_dir / f"kipr.h.{profile}.pch"}',
+    'cpp': f'{compile_harness_build_dir / f"kipr.hpp.{profile}.pch"}'
+  }
+
+def build_compile_harness():
+  os.makedirs(compile_harness_build_dir, exist_ok=True)
+
+  print('Precompiling kipr headers...')
+  run('emcc pch', [
+      'emcc', '-xc-header', *compile_include_flags,
+      compile_harness['c']['prefix_header'], '-o', compile_harness['c']['pch']
+    ],
+    env = env,
+    check = True
+  )
+  run('em++ pch', [
+      'em++', '-xc++-header', *compile_include_flags,
+      compile_harness['cpp']['prefix_header'], '-o', compile_harness['cpp']['pch']
+    ],
+    env = env,
+    check = True
+  )
+  for profile in libkipr_c_built_profiles:
+    pch = compile_harness_profile_pch(profile)
+    for language, cc, header_language in (('c', 'emcc', 'c-header'), ('cpp', 'em++', 'c++-header')):
+      run(f'{cc} pch {profile}', [
+          cc, f'-x{header_language}', *libkipr_c_profiles[profile], *compile_include_flags,
+          compile_harness[language]['prefix_header'], '-o', pch[language]
+        ],
+        env = env,
+        check = True
+      )
+
+  print('Compiling simMainWrapper...')
+  run('emcc wrapper', [
+      'emcc', '-c', f'{compile_harness_dir / "sim_main_wrapper.c"}', '-o', compile_harness['c']['wrapper']
+    ],
+    env = env,
+    check = True
+  )
+  run('em++ wrapper', [
+      'em++', '-c', f'{compile_harness_dir / "sim_main_wrapper.cpp"}', '-o', compile_harness['cpp']['wrapper']
+    ],
+    env = env,
+    check = True
+  )
+
+stages.append(Stage(
+  name = 'compile_harness',
+  deps = ['libkipr_c'],
+  inputs = lambda keys: {
+    'emsdk': emsdk_key,
+    'libkipr_c': keys['libkipr_c'],
+    'harness_hash': hash_dir(compile_harness_dir),
+    'flags': compile_include_flags,
+    'libkipr_c_profiles': libkipr_c_profiles
+  },
+  outputs = {
+    'c_pch': compile_harness['c']['pch'],
+    'c_wrapper': compile_harness['c']['wrapper'],
+    'cpp_pch': compile_harness['cpp']['pch'],
+    'cpp_wrapper': compile_harness['cpp']['wrapper'],
+    **{
+      f'{language}_pch_{profile}': path
+      for profile in libkipr_c_built_profiles
+      for language, path in compile_harness_profile_pch(profile).items()
+    }
+  },
+  build = build_compile_harness
+))
+
+# Emscripten cache
+
+emscripten_cache_warm_dir = working_dir / 'emscripten_cache_warm'
+
+def build_emscripten_cache():
+  print('Pre-building emscripten system libraries...')
+  os.makedirs(emscripten_cache_warm_dir, exist_ok=True)
+
+  # Compile and link a libkipr program the same way /compile does for each
+  # language and profile, precompiled header included, so emscripten builds
+  # exactly the library variants those flags need. This also fails the build if
+  # clang rejects a profile's PCH.
+  for language, cc, source in (
+    ('c', 'emcc', '#include <kipr/wombat.h>\nint main() { return 0; }\n'),
+    ('cpp', 'em++', '#include <kipr/wombat.hpp>\n#include <iostream>\nint main() { std::cout << std::endl; return 0; }\n'),
+  ):
+    source_path = emscripten_cache_warm_dir / f'warm.{language}'
+    with open(source_path, 'w') as f:
+      f.write(source)
+    # Optimization levels change which library variants are linked (e.g.
+    # assertions are only on at -O0), so warm each libkipr profile's flags too
+    pch_flags = ['-include-pch', compile_harness[language]['pch']]
+    variants = [
+      ('js', [*compile_flags, *pch_flags], libkipr_install_c_dir),
+      ('wasm', [*compile_flags_wasm, *pch_flags], libkipr_install_c_dir)
+    ]
+    variants += [
+      (
+        profile,
+        [*compile_flags, *flags, '-include-pch', compile_harness_profile_pch(profile)[language]],
+        libkipr_c_profile_dirs(profile)[1]
+      )
+      for profile, flags in libkipr_c_profiles.items()
+    ]
+    for variant, flags, libkipr_install_dir in variants:
+      run(f'{cc} warm {variant}', [
+          cc,
+          *flags,
+          *compile_include_flags,
+          f'-L{libkipr_install_dir}/lib',
+          '-lkipr',
+          '-o', f'{emscripten_cache_warm_dir / f"warm_{language}_{variant}.js"}',
+          f'{source_path}',
+          compile_harness[language]['wrapper']
+        ],
+        env = env,
+        check = True
+      )
+
+  # Same for the scratch runtime links, in case those stages were restored
+  for variant, flags in (('js', scratch_runtime_flags), ('wasm', scratch_runtime_wasm_flags)):
+    run(f'emcc warm scratch runtime {variant}', [
+        'emcc',
+        *flags,
+        f'-L{libkipr_install_c_dir}/lib',
+        '-Wl,--whole-archive', '-lkipr', '-Wl,--no-whole-archive',
+        '-o', f'{emscripten_cache_warm_dir / f"warm_scratch_rt_{variant}.js"}',
+        f'{scratch_runtime_path}.c'
+      ],
+      env = env,
+      check = True
+    )
+
+stages.append(Stage(
+  name = 'emscripten_cache',
+  deps = ['libkipr_c', 'compile_harness', *[f'libkipr_c_{profile}' for profile in libkipr_c_built_profiles]],
+  inputs = lambda keys: {
+    'emsdk': emsdk_key,
+    'libkipr_c': keys['libkipr_c'],
+    'compile_harness': keys['compile_harness'],
+    **{
+      f'libkipr_c_{profile}': keys[f'libkipr_c_{profile}']
+      for profile in libkipr_c_built_profiles
+    },
+    'compile_flags': compile_flags,
+    'compile_flags_wasm': compile_flags_wasm,
+    'libkipr_c_profiles': libkipr_c_profiles,
+    'scratch_runtime_flags': scratch_runtime_flags,
+    'scratch_runtime_wasm_flags': scratch_runtime_wasm_flags
+  },
+  outputs = { 'emscripten_cache': f'{emscripten_cache_dir}' },
+  build = build_emscripten_cache
+))
+
+# Compressed artifacts
+
+compressed_artifacts_manifest = working_dir / 'compressed_artifacts.json'
+# The variants are written here rather than next to the originals. Restoring an
+# upstream stage replaces its output directory, which would otherwise delete
+# them while this stage still looks up to date.
+compressed_artifacts_dir = working_dir / 'compressed_artifacts'
+
+# Extensions of the files the server sends to browsers
+servable_extensions = ('.js', '.mjs', '.wasm', '.data', '.py')
+
+def servable_artifacts():
+  """Return the paths of the large files served to browsers."""
+  artifacts = [f'{scratch_runtime_path}.js']
+  artifacts += [f'{scratch_runtime_wasm_dir / "rt.js"}', f'{scratch_runtime_wasm_dir / "rt.wasm"}']
+  artifacts += sorted(
+    f'{path}' for path in cpython_emscripten_build_dir.iterdir()
+    if path.is_file() and path.suffix in servable_extensions
+  )
+  artifacts += [
+    f'{libkipr_build_python_dir / "kipr.wasm"}',
+    f'{kipr_py_path}'
+  ]
+  return [path for path in artifacts if os.path.exists(path)]
+
+def compress_artifact(path):
+  """Write .gz and, if brotli is available, .br variants of `path` at maximum compression."""
+  with open(path, 'rb') as f:
+    data = f.read()
+
+  variants = {}
+  variant_base = compressed_artifacts_dir / os.path.relpath(path, working_dir)
+  os.makedirs(variant_base.parent, exist_ok=True)
+
+  gzip_data = io.BytesIO()
+  # mtime is fixed so that the output is reproducible
+  with gzip.GzipFile(fileobj = gzip_data, mode = 'wb', compresslevel = 9, mtime = 0) as gz:
+    gz.write(data)
+  variants['gzip'] = (f'{variant_base}.gz', gzip_data.getvalue())
+
+  if brotli is not None:
+    variants['br'] = (f'{variant_base}.br', brotli.compress(data, quality = 11))
+
+  manifest = {
+    'size': len(data),
+    'sha256': hashlib.sha256(data).hexdigest(),
+    'integrity': 'sha384-' + base64.b64encode(hashlib.sha384(data).digest()).decode(),
+    'variants': {}
+  }
+  for encoding, (variant_path, variant_data) in variants.items():
+    with open(variant_path, 'wb') as f:
+      f.write(variant_data)
+    manifest['variants'][encoding] = {
+      'path': variant_path,
+      'size': len(variant_data)
+    }
+  return manifest
+
+def build_compressed_artifacts():
+  print('Compressing artifacts...')
+  if brotli is None:
+    print('Warning: the brotli module is not installed. Only gzip variants will be written.')
+
+  if compressed_artifacts_dir.exists():
+    shutil.rmtree(compressed_artifacts_dir)
+  os.makedirs(compressed_artifacts_dir)
+
+  artifacts = servable_artifacts()
+  with ThreadPoolExecutor() as executor:
+    manifests = list(executor.map(compress_artifact, artifacts))
+
+  with open(compressed_artifacts_manifest, 'w') as f:
+    json.dump(dict(zip(artifacts, manifests)), f, indent = 2, sort_keys = True)
+
+stages.append(Stage(
+  name = 'compressed_artifacts',
+  deps = ['scratch_runtime', 'scratch_runtime_wasm', 'cpython', 'libkipr_python'],
+  inputs = lambda keys: {
+    'scratch_runtime': keys['scratch_runtime'],
+    'scratch_runtime_wasm': keys['scratch_runtime_wasm'],
+    'cpython': keys['cpython'],
+    'libkipr_python': keys['libkipr_python'],
+    'brotli': brotli is not None
+  },
+  outputs = {
+    'manifest': f'{compressed_artifacts_manifest}',
+    'variants': f'{compressed_artifacts_dir}'
+  },
+  build = build_compressed_artifacts
+))
+
+def load_compressed_artifacts():
+  """Return the compressed artifact manifest, without variants that no longer exist."""
+  with open(compressed_artifacts_manifest) as f:
+    artifacts = json.load(f)
+  for artifact in artifacts.values():
+    artifact['variants'] = {
+      encoding: variant for encoding, variant in artifact['variants'].items()
+      if os.path.exists(variant['path'])
+    }
+  return artifacts
+
+build_trace_path = working_dir / 'build_trace.json'
+build_metrics_path = working_dir / 'build_metrics.prom'
+
+print(f'Building with a budget of {jobserver.jobs} jobs...')
+try:
+  stage_keys = run_stages(stages)
+finally:
+  print(f'Writing build trace to {build_trace_path}...')
+  trace.write_chrome_trace(build_trace_path)
+  trace.write_prometheus(build_metrics_path)
+
+if 'EM_COMPILER_WRAPPER' in env:
+  run('ccache stats', ['ccache', '--show-stats'], env = env, check = False)
+
+# EM_FROZEN_CACHE in emsdk_env below makes emscripten error rather than write
+# to the cache. Removing write permission as well catches other writers, but
+# only those not running as root.
+print('Freezing emscripten cache...')
+set_tree_writable(emscripten_cache_dir, False)
 
 print('Outputting results...')
 output = json.dumps({
@@ -270,16 +1603,44 @@ output = json.dumps({
   'emsdk_env': {
     'PATH': emsdk_path,
     'EMSDK': f'{emsdk_dir}',
-    'EM_CONFIG': f'{emsdk_dot_emscripten}'
+    'EM_CONFIG': f'{emsdk_dot_emscripten}',
+    'EM_CACHE': f'{emscripten_cache_dir}',
+    'EM_FROZEN_CACHE': '1'
   },
+  'emscripten_cache': f'{emscripten_cache_dir}',
+  'compile_flags': compile_flags,
+  'compile_flags_wasm': compile_flags_wasm,
   'libkipr_hash': libkipr_hash,
   'libkipr_c': f'{libkipr_install_c_dir}',
+  'libkipr_c_profiles': {
+    profile: {
+      'path': f'{libkipr_c_profile_dirs(profile)[1]}',
+      'flags': flags,
+      # Use instead of compile_harness[language]['pch'] with this profile's flags
+      'pch': compile_harness_profile_pch(profile)
+    }
+    for profile, flags in libkipr_c_profiles.items()
+  },
   'libkipr_python': f'{libkipr_build_python_dir}',
   'cpython': f'{cpython_emscripten_build_dir}',
-  'cpython_hash': hash_dir(cpython_dir),
+  'cpython_hash': cpython_hash,
   "libkipr_c_documentation": libkipr_c_documentation_json,
   "libkipr_c_common_documentation": libkipr_c_common_documentation,
+  'libkipr_c_documentation_subsets': libkipr_c_documentation_subsets,
+  'libkipr_c_documentation_bundle': libkipr_c_documentation_bundle,
+  'libkipr_c_compact_documentation': libkipr_c_compact_documentation,
   'graphical_rt': f'{scratch_runtime_path}.js',
+  'graphical_rt_wasm': f'{scratch_runtime_wasm_dir}',
+  'compile_harness': compile_harness,
+  # Changes whenever the PCH or wrapper objects are rebuilt from new inputs
+  'compile_harness_hash': stage_keys['compile_harness'],
+  'python_stdlib': {
+    'bundle': f'{python_stdlib_bundle}',
+    'manifest': f'{python_stdlib_manifest}',
+    # Same version as the browser interpreter, for checking imports against the bundle
+    'python': f'{cpython_build_python}'
+  },
+  'compressed_artifacts': load_compressed_artifacts(),
 })
 
 with open(working_dir / 'dependencies.json', 'w') as f:
@@ -0,0 +1,4 @@
+// Headers included by the default C program template. Precompiled by build.py
+// and pre-included when compiling programs that use libkipr.
+#include <stdio.h>
+#include <kipr/wombat.h>
@@ -0,0 +1,5 @@
+// Headers included by the default C++ program template. Precompiled by build.py
+// and pre-included when compiling programs that use libkipr.
+#include <iostream>
+#include <kipr/wombat.h>
+#include <kipr/wombat.hpp>
@@ -0,0 +1,16 @@
+#include <emscripten.h>
+
+int main();
+
+EM_JS(void, on_stop, (), {
+  if (Module.context.onStop) Module.context.onStop();
+})
+
+// Wrap user's main() in our own "main()" that exits properly
+// Required because Asyncify keeps emscripten runtime alive, which would prevent cleanup code from running
+extern "C" void simMainWrapper()
+{
+  main();
+  on_stop();
+  emscripten_force_exit(0);
+}
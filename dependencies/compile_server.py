@@ -0,0 +1,209 @@
+#!/usr/bin/python3
+"""
+compile_server.py
+
+A long-lived compile daemon for the /compile endpoint. emcc is itself a Python
+program, so every emcc process pays for interpreter startup, importing
+emscripten's tools modules, loading the config and sanity checks before any
+compiling starts. This server pays that cost once: emscripten is imported in
+a multiprocessing forkserver, and each job runs in a fresh process forked from
+it. Jobs therefore stay isolated from each other (emcc keeps global state) but
+start warm.
+
+Jobs are accepted over a Unix socket, one per connection. The client sends a
+JSON object and shuts down its write side:
+
+  {"cc": "emcc" | "em++", "args": [...], "cwd": "/tmp", "timeout": 60}
+
+and receives:
+
+  {"code": 0, "stdout": "...", "stderr": "...", "timed_out": false}
+
+Paths in `args` are interpreted by the job as usual, so the output JS is
+written wherever `-o` points.
+
+Usage:
+  python3 compile_server.py \
+    --dependencies /path/to/dependencies.json \
+    --socket /tmp/kipr-compile.sock \
+    --workers 8
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import multiprocessing
+import os
+import signal
+import socketserver
+import sys
+import tempfile
+import threading
+from typing import Any, Dict, List
+
+COMPILERS = ('emcc', 'em++')
+
+# Largest request accepted, to bound memory use per connection
+MAX_REQUEST_SIZE = 1 << 20
+
+
+def configure_emscripten(dependencies: Dict[str, Any]) -> None:
+  """Point this process (and so the forkserver) at the emsdk recorded by build.py."""
+  emsdk_env = dependencies['emsdk_env']
+  for key, value in emsdk_env.items():
+    if key != 'PATH':
+      os.environ[key] = value
+  os.environ['PATH'] = f"{emsdk_env['PATH']}:{os.environ.get('PATH', '')}"
+
+  emscripten_dir = os.path.join(dependencies['emsdk_path'], 'upstream', 'emscripten')
+  sys.path.insert(0, emscripten_dir)
+  # The forkserver is a new interpreter that does not inherit sys.path
+  python_path = os.environ.get('PYTHONPATH')
+  os.environ['PYTHONPATH'] = f'{emscripten_dir}:{python_path}' if python_path else emscripten_dir
+
+
+def run_job(cc: str, args: List[str], cwd: str, stdout_path: str, stderr_path: str) -> None:
+  """Run one emcc/em++ invocation. Runs in a process forked from the warm forkserver."""
+  # A new session lets the server kill clang and friends along with emcc on timeout
+  os.setsid()
+
+  for fd, output_path in ((1, stdout_path), (2, stderr_path)):
+    output_fd = os.open(output_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    os.dup2(output_fd, fd)
+    os.close(output_fd)
+
+  os.chdir(cwd)
+
+  import emcc
+  # em++ is emcc with this flag set
+  emcc.run_via_emxx = cc == 'em++'
+  try:
+    code = emcc.main([cc, *args])
+  finally:
+    sys.stdout.flush()
+    sys.stderr.flush()
+  sys.exit(code)
+
+
+class CompileServer(socketserver.ThreadingUnixStreamServer):
+  daemon_threads = True
+
+  def __init__(self, socket_path: str, workers: int, timeout: float):
+    self.context = multiprocessing.get_context('forkserver')
+    # Imported once in the forkserver and inherited by every job
+    self.context.set_forkserver_preload(['__main__', 'emcc'])
+    self.workers = threading.BoundedSemaphore(workers)
+    self.timeout = timeout
+    super().__init__(socket_path, CompileRequestHandler)
+
+  def compile(self, cc: str, args: List[str], cwd: str, timeout: float) -> Dict[str, Any]:
+    with self.workers, tempfile.TemporaryDirectory(prefix='kipr-compile-') as job_dir:
+      stdout_path = os.path.join(job_dir, 'stdout')
+      stderr_path = os.path.join(job_dir, 'stderr')
+
+      process = self.context.Process(
+        target=run_job,
+        args=(cc, args, cwd, stdout_path, stderr_path),
+        daemon=True,
+      )
+      process.start()
+      process.join(timeout)
+
+      timed_out = process.is_alive()
+      if timed_out:
+        try:
+          os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+          pass
+        process.join()
+
+      def read(output_path: str) -> str:
+        try:
+          with open(output_path, 'r', encoding='utf-8', errors='replace') as f:
+            return f.read()
+        except OSError:
+          return ''
+
+      stderr = read(stderr_path)
+      if timed_out:
+        stderr += f'\nCompilation timed out after {timeout} seconds\n'
+
+      return {
+        'code': process.exitcode if not timed_out else -signal.SIGKILL,
+        'stdout': read(stdout_path),
+        'stderr': stderr,
+        'timed_out': timed_out,
+      }
+
+
+class CompileRequestHandler(socketserver.StreamRequestHandler):
+  server: CompileServer
+
+  def handle(self) -> None:
+    try:
+      request = json.loads(self.rfile.read(MAX_REQUEST_SIZE))
+      cc = request['cc']
+      args = request['args']
+      if cc not in COMPILERS:
+        raise ValueError(f'Unknown compiler {cc}')
+      if not isinstance(args, list) or not all(isinstance(arg, str) for arg in args):
+        raise ValueError('Expected args to be a list of strings')
+      cwd = request.get('cwd', tempfile.gettempdir())
+      timeout = min(float(request.get('timeout', self.server.timeout)), self.server.timeout)
+    except (ValueError, KeyError, TypeError) as e:
+      response = {'error': f'Invalid request: {e}'}
+    else:
+      response = self.server.compile(cc, args, cwd, timeout)
+
+    self.wfile.write(json.dumps(response).encode())
+
+
+def main() -> None:
+  working_dir = os.path.dirname(os.path.abspath(__file__))
+
+  parser = argparse.ArgumentParser()
+  parser.add_argument(
+    "--dependencies",
+    default=os.path.join(working_dir, 'dependencies.json'),
+    help="Path to the dependencies.json written by build.py",
+  )
+  parser.add_argument("--socket", required=True, help="Path of the Unix socket to listen on")
+  parser.add_argument(
+    "--workers",
+    type=int,
+    default=multiprocessing.cpu_count(),
+    help="Maximum number of concurrent compile jobs",
+  )
+  parser.add_argument("--timeout", type=float, default=60, help="Maximum seconds per compile job")
+  args = parser.parse_args()
+
+  with open(args.dependencies, 'r', encoding='utf-8') as f:
+    dependencies = json.load(f)
+  configure_emscripten(dependencies)
+
+  if os.path.exists(args.socket):
+    os.remove(args.socket)
+
+  # Only the user running the server (and its group) may submit jobs
+  old_umask = os.umask(0o007)
+  try:
+    server = CompileServer(args.socket, args.workers, args.timeout)
+  finally:
+    os.umask(old_umask)
+
+  # Start the forkserver (and import emscripten) before the first request
+  warmup = server.context.Process(target=os.getpid)
+  warmup.start()
+  warmup.join()
+
+  print(f"Listening on {args.socket} with {args.workers} workers")
+  try:
+    server.serve_forever()
+  finally:
+    server.server_close()
+    os.remove(args.socket)
+
+
+if __name__ == "__main__":
+  main()
@@ -6,13 +6,24 @@ Reads a Doxygen-generated JSON documentation file and emits a TypeScript file
 containing literal tr("...") calls so the existing i18n extractor can add the
 strings to PO files.
 
+With --split, the strings are instead written as chunk modules in a
+directory named after the output file (docs.generated/), either one per key
+prefix (func, struct, enum) or one per libkipr module (plus "other" for
+functions in no module and "types" for structs and enums). The output file
+becomes an index that dynamically imports a chunk the first time one of its
+keys is requested, so no doc strings are in the main bundle:
+
+  import { getDocString, loadDocString } from "./docs.generated";
+  const brief = await loadDocString("func:motor:brief");
+
 Usage:
   python3 generate_docs_tr_ts.py \
     --input /path/to/json.json \
     --output /path/to/ivygate/src/i18n/docs.generated.ts \
     --tr-import "." \
     --localizedstring-import "../util/LocalizedString" \
-    --export-name DOC_TR
+    --export-name DOC_TR \
+    [--split prefix|module]
 """
 
 from __future__ import annotations
@@ -20,11 +31,15 @@ from __future__ import annotations
 import argparse
 import json
 import os
+import posixpath
+import re
 from typing import Any, Dict, List, Optional, Set, Tuple
 
 
 PREFER_EXISTING_KEYS = True
 
+SPLIT_MODES = ("prefix", "module")
+
 
 def ts_string_literal(s: str) -> str:
     s = s.replace("\\", "\\\\")
@@ -67,6 +82,135 @@ def get_field(obj: Dict[str, Any], text_field: str, key_field: str) -> Tuple[Opt
     return text, None
 
 
+def key_prefix(context: str) -> str:
+    """The key's prefix, e.g. "func" for "func:motor:brief"."""
+    return context.split(":", 1)[0]
+
+
+def key_entity(context: str) -> str:
+    """The key's entity, e.g. "func:motor" for "func:motor:brief"."""
+    return ":".join(context.split(":", 2)[:2])
+
+
+def function_modules(doc: Dict[str, Any]) -> Dict[str, str]:
+    """Map "func:<name>" to the name of the first module listing the function."""
+    functions: Dict[str, Any] = doc.get("functions", {}) or {}
+    ret: Dict[str, str] = {}
+    for module in (doc.get("modules", {}) or {}).values():
+        for fn_id in module.get("functions", []) or []:
+            fn = functions.get(fn_id)
+            if fn is not None:
+                ret.setdefault(f"func:{fn.get('name') or fn_id}", module["name"])
+    return ret
+
+
+def chunk_file_name(chunk: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_-]", "_", chunk)
+
+
+def chunk_import_path(import_path: str) -> str:
+    """Rewrite a relative import for a module one directory further down."""
+    if not import_path.startswith("."):
+        return import_path
+    return posixpath.normpath(posixpath.join("..", import_path))
+
+
+def render_record(
+    entries: List[Tuple[str, str]],
+    export_name: str,
+    tr_import: str,
+    localizedstring_import: str,
+) -> str:
+    lines: List[str] = []
+    lines.append("/* eslint-disable */")
+    lines.append("/**")
+    lines.append(" * AUTO-GENERATED FILE. DO NOT EDIT.")
+    lines.append(" *")
+    lines.append(" * Generated by generate_docs_tr_ts.py from Doxygen JSON output.")
+    lines.append(" */")
+    lines.append("")
+    lines.append(f"import LocalizedString from {ts_string_literal(localizedstring_import)};")
+    lines.append(f"import tr from {ts_string_literal(tr_import)};")
+    lines.append("")
+    lines.append(f"export const {export_name}: Record<string, LocalizedString> = {{")
+    for context, msgid in entries:
+        lines.append(
+            f"  [{ts_string_literal(context)}]: "
+            f"tr({ts_string_literal(msgid)}, {ts_string_literal(context)}),"
+        )
+    lines.append("};")
+    lines.append("")
+    return "\n".join(lines)
+
+
+def render_index(
+    chunks: List[str],
+    chunk_dir: str,
+    split: str,
+    entity_chunks: Dict[str, str],
+    export_name: str,
+    localizedstring_import: str,
+) -> str:
+    lines: List[str] = []
+    lines.append("/* eslint-disable */")
+    lines.append("/**")
+    lines.append(" * AUTO-GENERATED FILE. DO NOT EDIT.")
+    lines.append(" *")
+    lines.append(" * Generated by generate_docs_tr_ts.py from Doxygen JSON output.")
+    lines.append(" * Doc strings are split into chunks that are imported on first use.")
+    lines.append(" */")
+    lines.append("")
+    lines.append(f"import LocalizedString from {ts_string_literal(localizedstring_import)};")
+    lines.append("")
+    lines.append("type Chunk = Record<string, LocalizedString>;")
+    lines.append("")
+    lines.append("const CHUNKS: Record<string, () => Promise<Chunk>> = {")
+    for chunk in chunks:
+        path = f"./{chunk_dir}/{chunk_file_name(chunk)}"
+        lines.append(
+            f"  [{ts_string_literal(chunk)}]: "
+            f"() => import({ts_string_literal(path)}).then((m) => m.{export_name}),"
+        )
+    lines.append("};")
+    lines.append("")
+
+    if split == "module":
+        lines.append("const FUNCTION_CHUNKS: Record<string, string> = {")
+        for entity, chunk in sorted(entity_chunks.items()):
+            lines.append(f"  [{ts_string_literal(entity)}]: {ts_string_literal(chunk)},")
+        lines.append("};")
+        lines.append("")
+        lines.append("export const chunkOf = (key: string): string => {")
+        lines.append('  const [prefix, name] = key.split(":");')
+        lines.append('  if (prefix !== "func") return "types";')
+        lines.append('  return FUNCTION_CHUNKS[`${prefix}:${name}`] || "other";')
+        lines.append("};")
+    else:
+        lines.append('export const chunkOf = (key: string): string => key.split(":")[0];')
+    lines.append("")
+
+    lines.append("const loaded: Record<string, Chunk> = {};")
+    lines.append("const loading: Record<string, Promise<Chunk>> = {};")
+    lines.append("")
+    lines.append("/** The doc string for `key`, loading its chunk if needed. */")
+    lines.append("export const loadDocString = async (key: string): Promise<LocalizedString | undefined> => {")
+    lines.append("  const chunk = chunkOf(key);")
+    lines.append("  if (!(chunk in CHUNKS)) return undefined;")
+    lines.append("  if (!(chunk in loading)) {")
+    lines.append("    loading[chunk] = CHUNKS[chunk]().then((strings) => (loaded[chunk] = strings));")
+    lines.append("  }")
+    lines.append("  return (await loading[chunk])[key];")
+    lines.append("};")
+    lines.append("")
+    lines.append("/** The doc string for `key` if its chunk has been loaded. */")
+    lines.append("export const getDocString = (key: string): LocalizedString | undefined => {")
+    lines.append("  const strings = loaded[chunkOf(key)];")
+    lines.append("  return strings ? strings[key] : undefined;")
+    lines.append("};")
+    lines.append("")
+    return "\n".join(lines)
+
+
 def main() -> None:
     parser = argparse.ArgumentParser()
     parser.add_argument("--input", required=True, help="Path to json.json")
@@ -78,6 +222,11 @@ def main() -> None:
         help='TS import path for LocalizedString',
     )
     parser.add_argument("--export-name", default="DOC_TR", help="Exported const name")
+    parser.add_argument(
+        "--split",
+        choices=SPLIT_MODES,
+        help="Split the strings into lazily imported chunks by key prefix or by module",
+    )
     args = parser.parse_args()
 
     with open(args.input, "r", encoding="utf-8") as f:
@@ -159,31 +308,58 @@ def main() -> None:
 
     os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
 
-    lines: List[str] = []
-    lines.append("/* eslint-disable */")
-    lines.append("/**")
-    lines.append(" * AUTO-GENERATED FILE. DO NOT EDIT.")
-    lines.append(" *")
-    lines.append(" * Generated by generate_docs_tr_ts.py from Doxygen JSON output.")
-    lines.append(" */")
-    lines.append("")
-    lines.append(f"import LocalizedString from {ts_string_literal(args.localizedstring_import)};")
-    lines.append(f"import tr from {ts_string_literal(args.tr_import)};")
-    lines.append("")
-    lines.append(f"export const {args.export_name}: Record<string, LocalizedString> = {{")
-    for context, msgid in entries:
-        lines.append(
-            f"  [{ts_string_literal(context)}]: "
-            f"tr({ts_string_literal(msgid)}, {ts_string_literal(context)}),"
-        )
-    lines.append("};")
-    lines.append("")
+    if not args.split:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(render_record(entries, args.export_name, args.tr_import, args.localizedstring_import))
 
-    with open(args.output, "w", encoding="utf-8") as f:
-        f.write("\n".join(lines))
+        print(f"Wrote {len(entries)} doc strings to {args.output}")
+        return
 
-    print(f"Wrote {len(entries)} doc strings to {args.output}")
+    entity_chunks = function_modules(doc) if args.split == "module" else {}
+    chunk_entries: Dict[str, List[Tuple[str, str]]] = {}
+    for context, msgid in entries:
+        if args.split == "prefix":
+            chunk = key_prefix(context)
+        elif key_prefix(context) == "func":
+            chunk = entity_chunks.get(key_entity(context), "other")
+        else:
+            chunk = "types"
+        chunk_entries.setdefault(chunk, []).append((context, msgid))
+
+    chunk_dir_name = os.path.splitext(os.path.basename(args.output))[0]
+    chunk_dir = os.path.join(os.path.dirname(os.path.abspath(args.output)), chunk_dir_name)
+    os.makedirs(chunk_dir, exist_ok=True)
+
+    written: Set[str] = set()
+    for chunk, chunk_strings in sorted(chunk_entries.items()):
+        file_name = f"{chunk_file_name(chunk)}.ts"
+        if file_name in written:
+            raise ValueError(f"Chunks {chunk!r} and another chunk would both be written to {file_name}")
+        written.add(file_name)
+        with open(os.path.join(chunk_dir, file_name), "w", encoding="utf-8") as f:
+            f.write(render_record(
+                chunk_strings,
+                args.export_name,
+                chunk_import_path(args.tr_import),
+                chunk_import_path(args.localizedstring_import),
+            ))
+
+    # Remove chunks left over from earlier runs
+    for name in os.listdir(chunk_dir):
+        if name.endswith(".ts") and name not in written:
+            os.remove(os.path.join(chunk_dir, name))
 
+    with open(args.output, "w", encoding="utf-8") as f:
+        f.write(render_index(
+            sorted(chunk_entries),
+            chunk_dir_name,
+            args.split,
+            {entity: chunk for entity, chunk in entity_chunks.items() if chunk in chunk_entries},
+            args.export_name,
+            args.localizedstring_import,
+        ))
+
+    print(f"Wrote {len(entries)} doc strings in {len(chunk_entries)} chunks to {chunk_dir}, indexed by {args.output}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
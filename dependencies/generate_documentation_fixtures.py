@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+generate_documentation_fixtures.py
+
+Writes test/state/Documentation/fixtures.ts, the documentation fixtures of the
+CompactDocumentation and SearchIndex tests. A few libkipr-like records are
+encoded with compact_documentation and build_search_index from
+generate_doxygen_json.py, so the tests check the TypeScript decoders against
+the real encoders. Rerun it whenever either format changes:
+
+  python3 dependencies/generate_documentation_fixtures.py
+"""
+
+import json
+import os
+from dataclasses import asdict
+
+from generate_doxygen_json import (
+  Enumeration, EnumerationValue, File, Function, FunctionParameter, Link, Module, ParsedXml,
+  Structure, StructureMember, Type, build_search_index, compact_documentation
+)
+
+def function(id, name, parameters, return_type, brief, detailed = None, return_description = None, return_type_links = []):
+  return Function(
+    id = id,
+    name = name,
+    parameters = [
+      FunctionParameter(
+        parameter_name, type, description,
+        f'func:{name}:param:{parameter_name}:description' if description else None
+      )
+      for parameter_name, type, description in parameters
+    ],
+    return_type = return_type,
+    return_description = return_description,
+    return_description_key = f'func:{name}:return' if return_description else None,
+    brief_description = brief,
+    brief_description_key = f'func:{name}:brief' if brief else None,
+    detailed_description = detailed,
+    detailed_description_key = f'func:{name}:detailed' if detailed else None,
+    return_type_links = return_type_links
+  )
+
+parsed = ParsedXml(
+  functions = [
+    function(
+      'motor_8h_1motor', 'motor', [('motor', 'int', 'The motor port.'), ('percent', 'int', 'The percent of full power.')],
+      'void', 'Turns on the motor at the given percent of full power.',
+      'Motor power is not regulated. Use move_at_velocity to hold a velocity.'
+    ),
+    function(
+      'motor_8h_1get_motor_position_counter', 'get_motor_position_counter', [('motor', 'int', 'The motor port.')],
+      'int', 'Gets the motor position counter.', None, 'The position in ticks.'
+    ),
+    function(
+      'motor_8h_1clear_motor_position_counter', 'clear_motor_position_counter', [('motor', 'int', None)],
+      'void', 'Resets the motor position counter to zero.'
+    ),
+    function(
+      'time_8h_1msleep', 'msleep', [('msecs', 'int', 'The time to wait in milliseconds.')],
+      'void', 'Waits for the given number of milliseconds.'
+    ),
+    function(
+      'geometry_8h_1make_point2', 'make_point2', [('x', 'int', None), ('y', 'int', None)],
+      'point2', 'Makes a point from its coordinates.', None, None,
+      [Link('structpoint2', None, 'point2')]
+    ),
+  ],
+  function_ids = [
+    'motor_8h_1motor', 'motor_8h_1get_motor_position_counter', 'motor_8h_1clear_motor_position_counter',
+    'time_8h_1msleep', 'geometry_8h_1make_point2',
+  ],
+  modules = [
+    Module('group__motor', 'motor', ['motor_8h_1motor', 'motor_8h_1get_motor_position_counter', 'motor_8h_1clear_motor_position_counter'], []),
+  ],
+  structures = [
+    Structure('structpoint2', 'point2', [
+      StructureMember('x', 'int', 'The x coordinate.', None),
+      StructureMember('y', 'int', 'The y coordinate.', None),
+    ], 'A point in two dimensions.', None),
+  ],
+  enumerations = [
+    Enumeration('motor_8h_1motor_direction', 'motor_direction', [
+      EnumerationValue('FORWARD', 'Turn forward.', None),
+      EnumerationValue('BACKWARD', None, None),
+    ], 'Which way a motor turns.', 'Used with motor position counters.'),
+  ],
+  types = [Type('geometry_8h_1point2_t', 'struct point2')],
+  files = [
+    File('motor_8h', 'motor.h', [
+      'motor_8h_1motor', 'motor_8h_1get_motor_position_counter', 'motor_8h_1clear_motor_position_counter'
+    ], ['group__motor'], []),
+    File('time_8h', 'time.h', ['time_8h_1msleep'], [], []),
+    File('geometry_8h', 'geometry.h', ['geometry_8h_1make_point2'], [], ['geometry_8h_1point2_t']),
+  ]
+)
+parsed.link()
+
+# The same dictionaries as json.json (see main in generate_doxygen_json.py)
+documentation = {
+  'files': {file.id: asdict(file) for file in parsed.files},
+  'functions': {function.id: asdict(function) for function in parsed.functions},
+  'modules': {module.id: asdict(module) for module in parsed.modules},
+  'structures': {structure.name: asdict(structure) for structure in parsed.structures},
+  'enumerations': {enumeration.name: asdict(enumeration) for enumeration in parsed.enumerations},
+  'types': {type.id: asdict(type) for type in parsed.types}
+}
+
+fixtures_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'test', 'state', 'Documentation', 'fixtures.ts')
+with open(fixtures_path, 'w') as f:
+  f.write('// Generated by dependencies/generate_documentation_fixtures.py. Do not edit.\n\n')
+  for name, value in (
+    ('DOCUMENTATION', documentation),
+    ('COMPACT_DOCUMENTATION', compact_documentation(documentation)),
+    ('SEARCH_INDEX', build_search_index(parsed)),
+  ):
+    f.write(f'export const {name}: unknown = {json.dumps(value, indent = 2)};\n\n')
@@ -2,12 +2,21 @@
 
 from __future__ import annotations
 import xml.etree.ElementTree as ET
-import glob
+import fnmatch
+import functools
+import gc
+import hashlib
+import os
+import pickle
 import sys
-from dataclasses import dataclass, asdict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, asdict, field
+from collections import Counter, defaultdict
 from typing import List
 import json
 import argparse
+import math
+import re
 
 parser = argparse.ArgumentParser(
   prog = 'generate_doxygen_json',
@@ -29,7 +38,43 @@ parser.add_argument(
   help = 'Output file to write common JSON to'
 )
 
-args = parser.parse_args()
+parser.add_argument(
+  '--subsets',
+  default = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'doc_subsets.json'),
+  help = 'JSON file defining the documentation subsets, by file, function and module name'
+)
+
+parser.add_argument(
+  '--subset-output-dir',
+  help = 'Directory to write every subset other than common to, as json_<name>.json'
+)
+
+parser.add_argument(
+  '--bundle-dir',
+  help = 'Directory to write the sharded documentation bundle to (its previous contents are replaced)'
+)
+
+parser.add_argument(
+  '--search-index',
+  help = 'Output file to write the prebuilt search index to'
+)
+
+parser.add_argument(
+  '--compact-output',
+  help = 'Output file to write the default JSON to in the compact, string-interned format'
+)
+
+parser.add_argument(
+  '--jobs',
+  type = int,
+  default = os.cpu_count(),
+  help = 'Number of processes to parse XML files with'
+)
+
+parser.add_argument(
+  '--cache-dir',
+  help = 'Directory to cache the records parsed from each XML file in, so unchanged files are not parsed again'
+)
 
 def eprint(*args, **kwargs):
   print(*args, file=sys.stderr, **kwargs)
@@ -63,62 +108,26 @@ xml_file_matches = [
 
 ]
 
-commonFileNames = [
-  "analog.h",
-  "analog.hpp",
-  "botball.h",
-  "button_ids.hpp",
-  "button.h",
-  "button.hpp",
-  "color.hpp",
-  "colors.h",
-  "console.hpp",
-  "console.h",
-  "digital.h",
-  "digital.hpp",
-  "display.h",
-  "geometry.h",
-  "geometry.hpp",
-  "logic.hpp",
-  "log.hpp",
-  "motor.hpp",
-  "motor.h",
-  "sensor.hpp",
-  "servo.hpp",
-  "servo.h",
-  "time.h",
-  "wait_for.h"
-]
-
-commonFunctionNames = [
-  "analog",
-  "digital",
-  "get_motor_position_counter",
-  "gmpc",
-  "clear_motor_position_counter",
-  "cmpc",
-  "move_at_velocity",
-  "mav",
-  "motor",
-  "alloff",
-  "ao",
-  "enable_servo",
-  "disable_servo",
-  "enable_servos",
-  "disable_servos",
-  "set_servo_position",
-]
+def find_xml_files(input_dir):
+  """Return the XML files matching xml_file_matches, in pattern order.
 
-commonModuleNames = [
-  "analog",
-  "digital",
-  "motor",
-  "servo",
-]
+  Compounds are discovered from doxygen's index.xml rather than by listing the
+  directory once per pattern. Within a pattern, files are sorted by name so
+  the output does not depend on directory order."""
+  index_path = os.path.join(input_dir, 'index.xml')
+  if os.path.exists(index_path):
+    names = set()
+    for _, elem in ET.iterparse(index_path):
+      if elem.tag == 'compound':
+        names.add(elem.get('refid') + '.xml')
+        elem.clear()
+  else:
+    names = set(os.listdir(input_dir))
 
-xml_files = []
-for match in xml_file_matches:
-  xml_files += glob.glob(args.input_dir + '/' + match)
+  xml_files = []
+  for match in xml_file_matches:
+    xml_files += [os.path.join(input_dir, name) for name in sorted(fnmatch.filter(names, match))]
+  return [path for path in xml_files if os.path.exists(path)]
 
 
 @dataclass
@@ -129,12 +138,20 @@ class File:
   modules: List[str]
   types: List[str]
 
+@dataclass
+class Link:
+  """A reference to a documented function, structure or enumeration."""
+  id: str
+  kind: str | None
+  name: str
+
 @dataclass
 class FunctionParameter:
   name: str
   type: str
   description: str | None
   description_key: str | None
+  type_links: List[Link] = field(default_factory = list)
 
 @dataclass
 class Function:
@@ -148,7 +165,8 @@ class Function:
   brief_description_key: str | None
   detailed_description: str | None
   detailed_description_key: str | None
-  
+  return_type_links: List[Link] = field(default_factory = list)
+
 @dataclass
 class Module:
   id: str
@@ -162,6 +180,7 @@ class StructureMember:
   type: str
   brief_description: str | None
   detailed_description: str | None
+  type_links: List[Link] = field(default_factory = list)
 
 @dataclass
 class Structure:
@@ -170,6 +189,8 @@ class Structure:
   members: List[StructureMember]
   brief_description: str | None
   detailed_description: str | None
+  # Ids of the functions and structures whose types refer to this one
+  used_by: List[str] = field(default_factory = list)
 
 @dataclass
 class EnumerationValue:
@@ -184,35 +205,127 @@ class Enumeration:
   values: List[EnumerationValue]
   brief_description: str | None
   detailed_description: str | None
+  used_by: List[str] = field(default_factory = list)
 
 @dataclass
 class Type:
   id: str
   type: str
 
-functions: List[Function] = []
-modules: List[Module] = []
-structures: List[Structure] = []
-enumerations: List[Enumeration] = []
-types: List[Type] = []
-files: List[File] = []
-
-
-commonFiles: List[File] = []
-commonFunctions: List[Function] = []
-commonModules: List[Module] = []
+@dataclass
+class ParsedXml:
+  """Records parsed from one or more XML files, in the order they were found.
+
+  Each function is parsed only by the compound that owns it, but every
+  compound listing it adds its id to `function_ids`, so link() can put the
+  functions back in the order they were first listed."""
+  functions: List[Function] = field(default_factory = list)
+  function_ids: List[str] = field(default_factory = list)
+  modules: List[Module] = field(default_factory = list)
+  structures: List[Structure] = field(default_factory = list)
+  enumerations: List[Enumeration] = field(default_factory = list)
+  types: List[Type] = field(default_factory = list)
+  files: List[File] = field(default_factory = list)
+
+  def extend(self, other: ParsedXml):
+    self.functions += other.functions
+    self.function_ids += other.function_ids
+    self.modules += other.modules
+    self.structures += other.structures
+    self.enumerations += other.enumerations
+    self.types += other.types
+    self.files += other.files
+
+  def link(self):
+    """Drop duplicate functions, resolve type links to the records they refer
+    to and fill in each structure's and enumeration's used_by list."""
+    registry = {}
+    for function in self.functions:
+      registry.setdefault(function.id, function)
+    self.functions = [registry[func_id] for func_id in dict.fromkeys(self.function_ids) if func_id in registry]
+
+    kinds = {function.id: 'function' for function in self.functions}
+    targets = {}
+    for structure in self.structures:
+      kinds[structure.id] = 'structure'
+      targets[structure.id] = structure
+    for enumeration in self.enumerations:
+      kinds[enumeration.id] = 'enumeration'
+      targets[enumeration.id] = enumeration
+
+    used = set()
+    def resolve(links, user_id):
+      resolved = []
+      for link in links:
+        if link.id not in kinds: continue
+        resolved.append(Link(link.id, kinds[link.id], link.name))
+        target = targets.get(link.id)
+        if target is not None and (link.id, user_id) not in used:
+          used.add((link.id, user_id))
+          target.used_by.append(user_id)
+      return resolved
+
+    for function in self.functions:
+      function.return_type_links = resolve(function.return_type_links, function.id)
+      for parameter in function.parameters:
+        parameter.type_links = resolve(parameter.type_links, function.id)
+    for structure in self.structures:
+      for member in structure.members:
+        member.type_links = resolve(member.type_links, structure.id)
+
+# Subtrees left out of descriptions (parameter docs and return values are
+# collected separately)
+SKIPPED_TEXT_TAGS = ('parameterlist', 'simplesect')
+
+def strip_pieces(pieces, start):
+  """Strip surrounding whitespace from the text in pieces[start:], in place."""
+  for i in range(start, len(pieces)):
+    pieces[i] = pieces[i].lstrip()
+    if pieces[i]: break
+  else:
+    # Nothing but whitespace
+    del pieces[start:]
+    return
+  for i in range(len(pieces) - 1, start - 1, -1):
+    pieces[i] = pieces[i].rstrip()
+    if pieces[i]: break
+
+def collect_text(node, pieces):
+  """Append the stripped text of `node` and its tail to `pieces`."""
+  if len(node) == 0:
+    text = ((node.text or '') + (node.tail or '')).strip()
+    if text: pieces.append(text)
+    return
+
+  start = len(pieces)
+  pieces.append(node.text or '')
+  for child in node:
+    if child.tag not in SKIPPED_TEXT_TAGS:
+      collect_text(child, pieces)
+  pieces.append(node.tail or '')
+  strip_pieces(pieces, start)
 
 def parse_text(node):
+  """Return the text of `node` and its tail, ignoring parameterlist and simplesect tags.
+
+  Each element's text (including its tail) is stripped before being joined
+  into its parent's. Pieces are collected into one list and joined once, so
+  deep <para> nesting doesn't copy the same text at every level."""
   if node is None: return None
-  # Collect all subtext ignoring parameterlist and simplesect tags
-  if node.tag == 'parameterlist' or node.tag == 'simplesect':
+  if node.tag in SKIPPED_TEXT_TAGS:
     return ''
-  
-  text = node.text if node.text is not None else ''
-  for child in node:
-    text += parse_text(child)
-  text += node.tail if node.tail is not None else ''
-  return text.strip()
+
+  pieces = []
+  collect_text(node, pieces)
+  return ''.join(pieces)
+
+def parse_type_links(node):
+  """Return a link for every <ref> in a type, resolved later by ParsedXml.link."""
+  if node is None: return []
+  links = {}
+  for ref in node.iter('ref'):
+    links.setdefault(ref.get('refid'), Link(ref.get('refid'), None, parse_text(ref)))
+  return list(links.values())
 
 def parse_detaileddescription(node):
   """Return a dictionary of parameter names to their descriptions"""
@@ -282,9 +395,7 @@ def parse_detaileddescription(node):
 #     detailed_description
 #   ))
 
-def parse_function(node):
-  global functions
-
+def parse_function(node, result: ParsedXml):
   id = node.get('id')
   name = node.find('name').text
 
@@ -322,7 +433,8 @@ def parse_function(node):
       name=declname.text,
       type=parse_text(type_node),
       description=desc,
-      description_key=desc_key
+      description_key=desc_key,
+      type_links=parse_type_links(type_node)
     ))
 
   # ---- Return description ----
@@ -341,7 +453,7 @@ def parse_function(node):
   return_key = f"func:{name}:return" if return_description else None
 
   # ---- Append ----
-  functions.append(Function(
+  result.functions.append(Function(
     id=id,
     name=name,
     parameters=parameters,
@@ -351,11 +463,25 @@ def parse_function(node):
     brief_description=brief_text,
     brief_description_key=brief_key,
     detailed_description=detailed_description,
-    detailed_description_key=detailed_key
+    detailed_description_key=detailed_key,
+    return_type_links=parse_type_links(return_type_raw)
   ))
-def parse_file(node):
-  global files
-
+def owning_compound(member_id):
+  """Return the id of the compound a member id is anchored in, e.g.
+  group__motor for group__motor_1ga0b6e...; doxygen escapes underscores in
+  compound ids, so the anchor follows the last _1."""
+  return member_id.rsplit('_1', 1)[0]
+
+def parse_member_function(memberdef, compound_id, compound_ids, result: ParsedXml):
+  """Parse a function listed by `compound_id`, unless the compound that owns
+  it is among `compound_ids` and will parse it instead."""
+  id = memberdef.get('id')
+  result.function_ids.append(id)
+  owner = owning_compound(id)
+  if owner == compound_id or owner not in compound_ids:
+    parse_function(memberdef, result)
+
+def parse_file(node, result: ParsedXml, compound_ids):
   id = node.get('id')
   name = node.find('compoundname').text
 
@@ -367,14 +493,12 @@ def parse_file(node):
       for memberdef in section.findall('memberdef'):
         if memberdef.get('kind') == 'function':
           functions.append(memberdef.get('id'))
-          parse_function(memberdef)
+          parse_member_function(memberdef, id, compound_ids, result)
 
       
-  files.append(File(id, name, functions, [], []))
-
-def parse_struct(node):
-  global structures
+  result.files.append(File(id, name, functions, [], []))
 
+def parse_struct(node, result: ParsedXml):
   name = node.find('compoundname').text
   members = []
 
@@ -384,7 +508,8 @@ def parse_struct(node):
         member.find('name').text,
         parse_text(member.find('type')),
         parse_text(member.find('briefdescription')),
-        parse_text(member.find('detaileddescription'))
+        parse_text(member.find('detaileddescription')),
+        parse_type_links(member.find('type'))
       ))
 
   brief_description = node.find('briefdescription')
@@ -392,15 +517,13 @@ def parse_struct(node):
 
 
 
-  structures.append(
+  result.structures.append(
     Structure(node.get('id'), name, members, parse_text(brief_description), parse_text(detailed_description))
   )
 
-  types.append(Type(node.get('id'), 'structure'))
-
-def parse_enum(node):
-  global enumerations
+  result.types.append(Type(node.get('id'), 'structure'))
 
+def parse_enum(node, result: ParsedXml):
   name = node.find('compoundname').text
 
   members = []
@@ -415,7 +538,7 @@ def parse_enum(node):
         )
       )
 
-  enumerations.append(
+  result.enumerations.append(
     Enumeration(
       node.get('id'),
       name,
@@ -425,11 +548,9 @@ def parse_enum(node):
     )
   )
 
-  types.append(Type(node.get('id'), 'enumeration'))
-
-def parse_group(node):
-  global modules
+  result.types.append(Type(node.get('id'), 'enumeration'))
 
+def parse_group(node, result: ParsedXml, compound_ids):
   id = node.get('id')
   name = node.find('compoundname').text
   functions = []
@@ -437,77 +558,448 @@ def parse_group(node):
   for member in node.findall('sectiondef/memberdef'):
     if member.get('kind') == 'function':
       functions.append(member.get('id'))
-      parse_function(member)
+      parse_member_function(member, id, compound_ids, result)
 
-  modules.append(Module(id, name, functions, []))
+  result.modules.append(Module(id, name, functions, []))
 
-def parse_compounddef(node):
+def parse_compounddef(node, result: ParsedXml, compound_ids):
   # Determine kind
   kind = node.get('kind')
   if kind == 'file':
-    parse_file(node)
+    parse_file(node, result, compound_ids)
   elif kind == 'group':
-    parse_group(node)
+    parse_group(node, result, compound_ids)
   elif kind == 'struct':
-    parse_struct(node)
+    parse_struct(node, result)
   elif kind == 'enum':
-    parse_enum(node)
-
-def parse_xml(tree):
-  root = tree.getroot()
-  for child in root:
-    if child.tag == 'compounddef':
-      parse_compounddef(child)
-
-def parse_common():
-  for f in files:
-    if f.name in commonFileNames:
-      commonFiles.append(f)
-  for func in functions:
-    if func.name in commonFunctionNames:
-      commonFunctions.append(func)
-  for mod in modules:
-    if mod.name in commonModuleNames:
-      #commonModules.append(mod)
-      # Filter mod functions to only those in commonFunctions
-      common_func_ids = {func.id for func in commonFunctions}
-      filtered_functions = [func_id for func_id in mod.functions if func_id in common_func_ids]
-      commonModules.append(Module(mod.id, mod.name, filtered_functions, []))
-        
-        
-
-for xml_file in xml_files:
-  tree = ET.parse(xml_file)
-  parse_xml(tree)
-parse_common()
-
-# Convert lists to dictionaries by ID
-files_dict = {file.id: asdict(file) for file in files}
-functions_dict = {function.id: asdict(function) for function in functions}
-modules_dict = {module.id: asdict(module) for module in modules}
-structures_dict = {structure.name: asdict(structure) for structure in structures}
-enumerations_dict = {enumeration.name: asdict(enumeration) for enumeration in enumerations}
-types_dict = {type.id: asdict(type) for type in types}
-
-common_files_dict = {file.id: asdict(file) for file in commonFiles}
-common_functions_dict = {function.id: asdict(function) for function in commonFunctions}
-common_modules_dict = {module.id: asdict(module) for module in commonModules}
-
-with open(args.default_output_file, 'w') as f:
-  f.write(json.dumps({
+    parse_enum(node, result)
+
+def compound_id(path):
+  return os.path.splitext(os.path.basename(path))[0]
+
+def parse_xml_file(path, compound_ids = frozenset()):
+  """Parse the compounds in one XML file, streaming it so that only the
+  compound being parsed is held in memory. Functions owned by the compounds
+  in `compound_ids` are left to them."""
+  result = ParsedXml()
+  for _, elem in ET.iterparse(path):
+    if elem.tag == 'compounddef':
+      parse_compounddef(elem, result, compound_ids)
+      elem.clear()
+  return result
+
+class ParseCache:
+  """Records parsed from each XML file, stored under a hash of the file's
+  contents. The hash also covers this script, so changing the parser or the
+  record classes invalidates every entry."""
+
+  def __init__(self, cache_dir):
+    self.cache_dir = cache_dir
+    self.used = set()
+    with open(__file__, 'rb') as f:
+      self.generator_hash = hashlib.sha1(f.read()).digest()
+    os.makedirs(cache_dir, exist_ok = True)
+
+  def key(self, path, salt = b''):
+    hasher = hashlib.sha1(self.generator_hash)
+    hasher.update(salt)
+    with open(path, 'rb') as f:
+      hasher.update(f.read())
+    return hasher.hexdigest()
+
+  def path(self, key):
+    return os.path.join(self.cache_dir, f'{key}.pickle')
+
+  def get(self, key):
+    self.used.add(key)
+    try:
+      with open(self.path(key), 'rb') as f:
+        return pickle.load(f)
+    except FileNotFoundError:
+      return None
+    except Exception as e:
+      eprint(f'Ignoring unreadable cache entry {key}: {e}')
+      return None
+
+  def set(self, key, result: ParsedXml):
+    # Write then rename, so an interrupted run never leaves a partial entry
+    temp_path = f'{self.path(key)}.{os.getpid()}.tmp'
+    with open(temp_path, 'wb') as f:
+      pickle.dump(result, f, pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_path, self.path(key))
+
+  def prune(self):
+    """Remove entries that were not used by this run."""
+    for name in os.listdir(self.cache_dir):
+      key, _ = os.path.splitext(name)
+      if key not in self.used:
+        os.remove(os.path.join(self.cache_dir, name))
+
+def parse_xml_files(xml_files, jobs, cache: ParseCache = None):
+  """Parse `xml_files` in parallel and merge and link the results in list
+  order. Files found in `cache` are not parsed again."""
+  unique_files = list(dict.fromkeys(xml_files))
+  compound_ids = frozenset(compound_id(path) for path in unique_files)
+  parse = functools.partial(parse_xml_file, compound_ids = compound_ids)
+
+  parsed_files = {}
+  keys = {}
+  if cache is not None:
+    # Which functions a file parses depends on the other files being parsed
+    salt = hashlib.sha1('\n'.join(sorted(compound_ids)).encode()).digest()
+    for path in unique_files:
+      keys[path] = cache.key(path, salt)
+      cached = cache.get(keys[path])
+      if cached is not None:
+        parsed_files[path] = cached
+
+  changed_files = [path for path in unique_files if path not in parsed_files]
+  if jobs > 1 and len(changed_files) > 1:
+    with ProcessPoolExecutor(max_workers = jobs) as executor:
+      chunksize = max(1, len(changed_files) // (jobs * 4))
+      results = list(executor.map(parse, changed_files, chunksize = chunksize))
+  else:
+    results = [parse(path) for path in changed_files]
+
+  for path, result in zip(changed_files, results):
+    parsed_files[path] = result
+    if cache is not None:
+      cache.set(keys[path], result)
+
+  merged = ParsedXml()
+  for path in xml_files:
+    merged.extend(parsed_files[path])
+  merged.link()
+  return merged
+
+@dataclass
+class Subset:
+  """The records selected by one subset profile."""
+  name: str
+  files: List[File] = field(default_factory = list)
+  functions: List[Function] = field(default_factory = list)
+  modules: List[Module] = field(default_factory = list)
+
+  def to_json(self):
+    return {
+      'title': self.name,
+      'files': {file.id: asdict(file) for file in self.files},
+      'functions': {function.id: asdict(function) for function in self.functions},
+      'modules': {module.id: asdict(module) for module in self.modules}
+    }
+
+def load_subset_profiles(path):
+  """Load subset profiles, a mapping of subset name to the names of the files,
+  functions and modules it includes."""
+  with open(path, 'r') as f:
+    return json.load(f)
+
+def select_subsets(parsed: ParsedXml, profiles):
+  """Select every subset in `profiles` in a single pass over the parsed records.
+
+  Each name is indexed to the subsets that include it, so the cost of a pass
+  doesn't grow with the number of profiles. A subset's modules only list the
+  functions selected by the same subset."""
+  subsets = {name: Subset(name) for name in profiles}
+
+  def index(kind):
+    subsets_by_name = defaultdict(list)
+    for subset_name, profile in profiles.items():
+      for name in dict.fromkeys(profile.get(kind, [])):
+        subsets_by_name[name].append(subsets[subset_name])
+    return subsets_by_name
+
+  subsets_by_file = index('files')
+  subsets_by_function = index('functions')
+  subsets_by_module = index('modules')
+  function_ids = {name: set() for name in profiles}
+
+  for f in parsed.files:
+    for subset in subsets_by_file.get(f.name, ()):
+      subset.files.append(f)
+  for func in parsed.functions:
+    for subset in subsets_by_function.get(func.name, ()):
+      subset.functions.append(func)
+      function_ids[subset.name].add(func.id)
+  for mod in parsed.modules:
+    for subset in subsets_by_module.get(mod.name, ()):
+      ids = function_ids[subset.name]
+      subset.modules.append(Module(mod.id, mod.name, [func_id for func_id in mod.functions if func_id in ids], []))
+
+  return subsets
+
+# Weight of a term by where it appears in an entry
+NAME_TERM_WEIGHT = 10
+BRIEF_TERM_WEIGHT = 3
+DETAILED_TERM_WEIGHT = 1
+
+SEARCH_STOP_WORDS = {
+  'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'if', 'in',
+  'is', 'it', 'of', 'on', 'or', 'the', 'this', 'that', 'to', 'with',
+}
+
+def search_terms(text):
+  if not text: return []
+  return [term for term in re.findall(r'[a-z0-9]+', text.lower()) if len(term) > 1 and term not in SEARCH_STOP_WORDS]
+
+def build_search_index(parsed: ParsedXml):
+  """Build an index for searching functions, structures and enumerations.
+
+  `entries` lists [kind, key, name] for every entry, where kind is "f", "s" or
+  "e" and key is the entry's key in json.json. For completion, `prefixes`
+  holds every lowercased name and every suffix of it that starts after an
+  underscore (so "position" finds get_motor_position_counter), sorted, with
+  `prefix_entries` giving the entry of each; all names starting with a prefix
+  are found by binary search. `terms` maps each term of the names and
+  descriptions to a flat [entry, weight, entry, weight, ...] list, highest
+  weight first. Weights are term counts weighted by field and scaled by
+  inverse document frequency, as integers."""
+  entries = []
+  entry_texts = []
+  for function in {function.id: function for function in parsed.functions}.values():
+    entries.append(['f', function.id, function.name])
+    entry_texts.append((function.brief_description, function.detailed_description))
+  for structure in parsed.structures:
+    entries.append(['s', structure.name, structure.name])
+    entry_texts.append((structure.brief_description, structure.detailed_description))
+  for enumeration in parsed.enumerations:
+    entries.append(['e', enumeration.name, enumeration.name])
+    entry_texts.append((enumeration.brief_description, enumeration.detailed_description))
+
+  prefixes = set()
+  term_counts = defaultdict(dict)
+  for i, ((_, _, name), (brief, detailed)) in enumerate(zip(entries, entry_texts)):
+    lower_name = name.lower()
+    prefixes.add((lower_name, i))
+    for match in re.finditer('_+', lower_name):
+      if match.end() < len(lower_name):
+        prefixes.add((lower_name[match.end():], i))
+
+    for terms, weight in (
+      (search_terms(name.replace('_', ' ')), NAME_TERM_WEIGHT),
+      (search_terms(brief), BRIEF_TERM_WEIGHT),
+      (search_terms(detailed), DETAILED_TERM_WEIGHT),
+    ):
+      for term in terms:
+        term_counts[term][i] = term_counts[term].get(i, 0) + weight
+
+  prefixes = sorted(prefixes)
+  terms = {}
+  for term in sorted(term_counts):
+    postings = term_counts[term]
+    idf = math.log(1 + len(entries) / len(postings))
+    ranked = sorted(postings.items(), key = lambda posting: (-posting[1], posting[0]))
+    terms[term] = [value for i, count in ranked for value in (i, max(1, round(count * idf * 10)))]
+
+  return {
+    'entries': entries,
+    'prefixes': [prefix for prefix, _ in prefixes],
+    'prefix_entries': [i for _, i in prefixes],
+    'terms': terms
+  }
+
+def signature(function: Function):
+  parameters = ', '.join(f'{parameter.type} {parameter.name}' for parameter in function.parameters)
+  return f'{function.return_type or "void"} {function.name}({parameters})'
+
+def write_hashed_json(directory, name, value):
+  """Write `value` as minified JSON to `<name>.<content hash>.json` and return the file name."""
+  data = json.dumps(value, separators = (',', ':')).encode('utf-8')
+  file_name = f'{name}.{hashlib.sha256(data).hexdigest()[:16]}.json'
+  with open(os.path.join(directory, file_name), 'wb') as f:
+    f.write(data)
+  return file_name
+
+def write_bundle(parsed: ParsedXml, bundle_dir):
+  """Write the documentation as a small index plus shards that are loaded on demand.
+
+  The index lists every module's functions by id, name and signature. Each
+  module's full function records go in a shard of their own, functions in no
+  module in the "ungrouped" shard, and structures, enumerations and types in
+  the "types" shard. All of these are named by their content hash, so they can
+  be cached indefinitely. manifest.json, the only file with a fixed name, maps
+  "index", "search" (see build_search_index) and every shard key (a module id,
+  "ungrouped" or "types") to its file."""
+  os.makedirs(bundle_dir, exist_ok = True)
+
+  functions = {function.id: function for function in parsed.functions}
+  modules = {module.id: module for module in parsed.modules}
+  grouped = {func_id for module in modules.values() for func_id in module.functions}
+  ungrouped = [func_id for func_id in functions if func_id not in grouped]
+
+  def summaries(func_ids):
+    return [
+      [func_id, functions[func_id].name, signature(functions[func_id])]
+      for func_id in func_ids if func_id in functions
+    ]
+
+  def shard(func_ids):
+    return {'functions': {func_id: asdict(functions[func_id]) for func_id in func_ids if func_id in functions}}
+
+  shards = {}
+  for module in modules.values():
+    shards[module.id] = write_hashed_json(bundle_dir, module.id, shard(module.functions))
+  shards['ungrouped'] = write_hashed_json(bundle_dir, 'ungrouped', shard(ungrouped))
+  shards['types'] = write_hashed_json(bundle_dir, 'types', {
+    'structures': {structure.name: asdict(structure) for structure in parsed.structures},
+    'enumerations': {enumeration.name: asdict(enumeration) for enumeration in parsed.enumerations},
+    'types': {type.id: asdict(type) for type in parsed.types}
+  })
+
+  index = write_hashed_json(bundle_dir, 'index', {
+    'modules': {
+      module.id: {'name': module.name, 'functions': summaries(module.functions)}
+      for module in modules.values()
+    },
+    'ungrouped': summaries(ungrouped),
+    'files': {file.id: {'name': file.name, 'functions': file.functions} for file in parsed.files},
+    'structures': [structure.name for structure in parsed.structures],
+    'enumerations': [enumeration.name for enumeration in parsed.enumerations]
+  })
+
+  search = write_hashed_json(bundle_dir, 'search', build_search_index(parsed))
+
+  manifest = {'index': index, 'search': search, 'shards': shards}
+  # Written last and replaced atomically, so it never refers to missing files
+  temp_path = os.path.join(bundle_dir, f'manifest.json.{os.getpid()}.tmp')
+  with open(temp_path, 'w') as f:
+    f.write(json.dumps(manifest, indent = 2))
+  os.replace(temp_path, os.path.join(bundle_dir, 'manifest.json'))
+
+  # Remove files from earlier bundles
+  current = {'manifest.json', index, search, *shards.values()}
+  for name in os.listdir(bundle_dir):
+    if name not in current:
+      os.remove(os.path.join(bundle_dir, name))
+
+COMPACT_FORMAT_VERSION = 1
+
+def expect_derived_key(record, text_field, key_field, key):
+  expected = key if record[text_field] else None
+  if record[key_field] != expected:
+    raise ValueError(f'{key_field} {record[key_field]!r} cannot be derived, expected {expected!r}')
+
+def compact_documentation(doc):
+  """Encode the default JSON document compactly, without losing anything.
+
+  Records become arrays of their fields in declaration order, and the
+  top-level dictionaries become lists, since their keys are fields of the
+  records. Every string is replaced by its index in a shared string table,
+  most frequent first. The *_key fields are left out, as they are derived
+  from names (see parse_function). CompactDocumentation.decode in
+  src/state/State/Documentation restores the original document."""
+  def links(items):
+    return [[link['id'], link['kind'], link['name']] for link in items]
+
+  def function(func):
+    name = func['name']
+    expect_derived_key(func, 'return_description', 'return_description_key', f'func:{name}:return')
+    expect_derived_key(func, 'brief_description', 'brief_description_key', f'func:{name}:brief')
+    expect_derived_key(func, 'detailed_description', 'detailed_description_key', f'func:{name}:detailed')
+    parameters = []
+    for parameter in func['parameters']:
+      expect_derived_key(parameter, 'description', 'description_key', f'func:{name}:param:{parameter["name"]}:description')
+      parameters.append([parameter['name'], parameter['type'], parameter['description'], links(parameter['type_links'])])
+    return [
+      func['id'], name, parameters, func['return_type'], func['return_description'],
+      func['brief_description'], func['detailed_description'], links(func['return_type_links'])
+    ]
+
+  def structure(struct):
+    members = [
+      [member['name'], member['type'], member['brief_description'], member['detailed_description'], links(member['type_links'])]
+      for member in struct['members']
+    ]
+    return [struct['id'], struct['name'], members, struct['brief_description'], struct['detailed_description'], struct['used_by']]
+
+  def enumeration(enum):
+    values = [[value['name'], value['brief_description'], value['detailed_description']] for value in enum['values']]
+    return [enum['id'], enum['name'], values, enum['brief_description'], enum['detailed_description'], enum['used_by']]
+
+  records = {
+    'files': [[f['id'], f['name'], f['functions'], f['modules'], f['types']] for f in doc['files'].values()],
+    'functions': [function(func) for func in doc['functions'].values()],
+    'modules': [[mod['id'], mod['name'], mod['functions'], mod['types']] for mod in doc['modules'].values()],
+    'structures': [structure(struct) for struct in doc['structures'].values()],
+    'enumerations': [enumeration(enum) for enum in doc['enumerations'].values()],
+    'types': [[type['id'], type['type']] for type in doc['types'].values()]
+  }
+
+  counts = Counter()
+  def count(value):
+    if isinstance(value, str):
+      counts[value] += 1
+    elif isinstance(value, list):
+      for item in value: count(item)
+  count(list(records.values()))
+
+  # Counter keeps first-seen order, so ties are broken deterministically
+  strings = sorted(counts, key = lambda string: -counts[string])
+  indexes = {string: i for i, string in enumerate(strings)}
+  def intern(value):
+    if isinstance(value, str): return indexes[value]
+    if isinstance(value, list): return [intern(item) for item in value]
+    return value
+
+  return {
+    'version': COMPACT_FORMAT_VERSION,
+    'strings': strings,
+    **{name: intern(items) for name, items in records.items()}
+  }
+
+def main():
+  args = parser.parse_args()
+
+  # Nothing built here is cyclic, so the cycle collector would only rescan the
+  # growing set of parsed records, which makes large inputs super-linear
+  gc.disable()
+
+  cache = ParseCache(args.cache_dir) if args.cache_dir else None
+  parsed = parse_xml_files(find_xml_files(args.input_dir), args.jobs, cache)
+  if cache is not None:
+    cache.prune()
+  subsets = select_subsets(parsed, load_subset_profiles(args.subsets))
+
+  # Convert lists to dictionaries by ID
+  files_dict = {file.id: asdict(file) for file in parsed.files}
+  functions_dict = {function.id: asdict(function) for function in parsed.functions}
+  modules_dict = {module.id: asdict(module) for module in parsed.modules}
+  structures_dict = {structure.name: asdict(structure) for structure in parsed.structures}
+  enumerations_dict = {enumeration.name: asdict(enumeration) for enumeration in parsed.enumerations}
+  types_dict = {type.id: asdict(type) for type in parsed.types}
+
+  doc = {
     'files': files_dict,
     'functions': functions_dict,
     'modules': modules_dict,
     'structures': structures_dict,
     'enumerations': enumerations_dict,
     'types': types_dict
-  }, indent = 2))
-  
- 
-with open(args.common_output_file, 'w') as f:
-  f.write(json.dumps({
-    'title': 'common',
-    'files': common_files_dict,
-    'functions': common_functions_dict,
-    'modules': common_modules_dict
-    }, indent = 2))
\ No newline at end of file
+  }
+
+  with open(args.default_output_file, 'w') as f:
+    f.write(json.dumps(doc, indent = 2))
+
+  if args.compact_output:
+    with open(args.compact_output, 'w') as f:
+      f.write(json.dumps(compact_documentation(doc), separators = (',', ':')))
+
+  with open(args.common_output_file, 'w') as f:
+    f.write(json.dumps(subsets['common'].to_json(), indent = 2))
+
+  if args.subset_output_dir:
+    os.makedirs(args.subset_output_dir, exist_ok = True)
+    for name, subset in subsets.items():
+      if name == 'common': continue
+      with open(os.path.join(args.subset_output_dir, f'json_{name}.json'), 'w') as f:
+        f.write(json.dumps(subset.to_json(), indent = 2))
+
+  if args.bundle_dir:
+    write_bundle(parsed, args.bundle_dir)
+
+  if args.search_index:
+    with open(args.search_index, 'w') as f:
+      f.write(json.dumps(build_search_index(parsed), separators = (',', ':')))
+
+if __name__ == '__main__':
+  main()
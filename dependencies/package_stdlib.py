@@ -0,0 +1,220 @@
+#!/usr/bin/python3
+"""
+package_stdlib.py
+
+Builds a bytecode-compiled bundle of the CPython standard library for the
+browser build. Every stdlib module is included except EXCLUDED_MODULES (tests,
+development tools and modules that cannot work in the browser), stored as .pyc
+files in a single zip that zipimport can load directly. The browser loads this
+bundle in place of the full stdlib, so a module left out of it cannot be
+imported at all.
+
+The imports of libkipr's Python binding and of typical student programs are
+traced too, but only for the manifest, which lists the traced modules and the
+excluded ones among them. The trace follows every import, including lazy and
+platform-specific ones, so most excluded modules it reaches never run. A new
+one there is still worth a look when the exclusions change.
+
+Must be run with a host Python of the same version as the target stdlib,
+since .pyc files are version specific.
+
+Usage:
+  python3 package_stdlib.py \
+    --stdlib /path/to/prefix/usr/local/lib/python3.12 \
+    --entry /path/to/kipr.py \
+    --entry /path/to/student_programs \
+    --output /path/to/python312.zip \
+    --manifest /path/to/python312.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import modulefinder
+import os
+import py_compile
+import sys
+import tempfile
+import zipfile
+from typing import Dict, List
+
+# Always needed by the interpreter at startup, or looked up dynamically
+STARTUP_MODULES = [
+  'site',
+  'encodings',
+  'codecs',
+  'io',
+  'abc',
+  'traceback',
+  'warnings',
+  'runpy',
+]
+
+# Modules and packages left out of the bundle, with their submodules. Only
+# modules that are of no use in the simulator belong here: the regression
+# tests, development and packaging tools, and modules whose C extension or
+# platform support the wasm interpreter lacks, so importing them fails anyway.
+EXCLUDED_MODULES = [
+  # Regression tests
+  'test',
+  # Development and packaging tools
+  'idlelib',
+  'ensurepip',
+  'venv',
+  'lib2to3',
+  'pydoc_data',
+  # Need _tkinter
+  'tkinter',
+  'turtle',
+  'turtledemo',
+  # Need _curses, _ctypes, _sqlite3, _dbm and _gdbm
+  'curses',
+  'ctypes',
+  'sqlite3',
+  'dbm.ndbm',
+  'dbm.gnu',
+  # Need processes
+  'multiprocessing',
+  'concurrent.futures.process',
+  # Other platforms, or a browser to open
+  '_aix_support',
+  '_osx_support',
+  'antigravity',
+  'webbrowser',
+]
+
+# Fixed timestamp for zip entries so the bundle is reproducible
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+
+def is_excluded(module: str) -> bool:
+  return any(module == excluded or module.startswith(f'{excluded}.') for excluded in EXCLUDED_MODULES)
+
+
+def module_name(relpath: str) -> str:
+  """Return the module name of a .py file at `relpath` in the stdlib."""
+  parts = relpath[:-len('.py')].split(os.sep)
+  if parts[-1] == '__init__':
+    parts.pop()
+  return '.'.join(parts)
+
+
+def find_entries(paths: List[str]) -> List[str]:
+  """Expand directories in `paths` to the .py files they contain."""
+  entries = []
+  for path in paths:
+    if os.path.isdir(path):
+      for root, dirs, files in os.walk(path):
+        dirs.sort()
+        entries += [os.path.join(root, name) for name in sorted(files) if name.endswith('.py')]
+    else:
+      entries.append(path)
+  return entries
+
+
+def trace_modules(stdlib: str, entries: List[str]) -> modulefinder.ModuleFinder:
+  finder = modulefinder.ModuleFinder(path = [stdlib])
+  for name in STARTUP_MODULES:
+    finder.import_hook(name, fromlist = ['*'])
+  for entry in entries:
+    finder.run_script(entry)
+  return finder
+
+
+def stdlib_modules(stdlib: str) -> Dict[str, str]:
+  """Return a dictionary of archive names to source paths for every stdlib
+  module that is not excluded."""
+  stdlib = os.path.abspath(stdlib)
+  modules = {}
+  for root, dirs, files in os.walk(stdlib):
+    # Packages only: this skips __pycache__, site-packages and config-3.X-*
+    dirs[:] = sorted(name for name in dirs if name.isidentifier() and name != '__pycache__')
+    for name in sorted(files):
+      if not name.endswith('.py'): continue
+      path = os.path.join(root, name)
+      relpath = os.path.relpath(path, stdlib)
+      if is_excluded(module_name(relpath)): continue
+      modules[relpath[:-len('.py')] + '.pyc'] = path
+  return modules
+
+
+def main() -> None:
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--stdlib", required=True, help="Path to the target stdlib (lib/python3.X)")
+  parser.add_argument(
+    "--entry",
+    action="append",
+    default=[],
+    help="Python file, or directory of Python files, whose imports are traced for the manifest",
+  )
+  parser.add_argument("--optimize", type=int, default=1, help="Bytecode optimization level (0-2)")
+  parser.add_argument("--output", required=True, help="Path to write the zip bundle")
+  parser.add_argument("--manifest", required=True, help="Path to write the JSON manifest")
+  args = parser.parse_args()
+
+  version = f'python{sys.version_info[0]}.{sys.version_info[1]}'
+  if os.path.basename(os.path.normpath(args.stdlib)) != version:
+    print(f'{args.stdlib} does not look like a {version} stdlib. Run this script with the matching Python version.', file=sys.stderr)
+    sys.exit(1)
+
+  entries = find_entries(args.entry)
+  modules = stdlib_modules(args.stdlib)
+  finder = trace_modules(args.stdlib, entries)
+
+  os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+  temp_output = f'{args.output}.tmp'
+  with tempfile.TemporaryDirectory() as temp_dir, \
+       zipfile.ZipFile(temp_output, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=9) as bundle:
+    for arcname in sorted(modules):
+      cfile = os.path.join(temp_dir, arcname)
+      py_compile.compile(
+        modules[arcname],
+        cfile=cfile,
+        dfile=arcname[:-len('.pyc')] + '.py',
+        doraise=True,
+        optimize=args.optimize,
+        # No source is shipped, so there is nothing to check the pyc against
+        invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH,
+      )
+      info = zipfile.ZipInfo(arcname, ZIP_DATE_TIME)
+      info.compress_type = zipfile.ZIP_DEFLATED
+      with open(cfile, 'rb') as f:
+        bundle.writestr(info, f.read())
+  os.replace(temp_output, args.output)
+
+  sha = hashlib.sha256()
+  with open(args.output, 'rb') as f:
+    sha.update(f.read())
+
+  # Modules the trace could not resolve to a stdlib file. Most are builtins
+  # of the wasm interpreter or platform-specific imports that never run.
+  missing, maybe_missing = finder.any_missing_maybe()
+  stdlib = os.path.abspath(args.stdlib)
+  traced = set(
+    name for name, module in finder.modules.items()
+    if module.__file__ is not None and module.__file__.endswith('.py')
+    and os.path.commonpath([os.path.abspath(module.__file__), stdlib]) == stdlib
+  )
+
+  with open(args.manifest, 'w', encoding='utf-8') as f:
+    json.dump({
+      'python': version,
+      'optimize': args.optimize,
+      'bundle': os.path.basename(args.output),
+      'size': os.path.getsize(args.output),
+      'sha256': sha.hexdigest(),
+      'entries': [os.path.relpath(entry) for entry in entries],
+      'excluded_modules': EXCLUDED_MODULES,
+      'modules': sorted(module_name(arcname[:-len('.pyc')] + '.py') for arcname in modules),
+      'traced_modules': sorted(traced),
+      'excluded_traced_modules': sorted(name for name in traced if is_excluded(name)),
+      'missing': sorted(missing),
+    }, f, indent=2)
+
+  print(f"Wrote {len(modules)} modules ({os.path.getsize(args.output)} bytes) to {args.output}")
+
+
+if __name__ == "__main__":
+  main()
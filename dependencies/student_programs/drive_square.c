@@ -0,0 +1,22 @@
+#include <stdio.h>
+#include <kipr/wombat.h>
+
+void drive(int left, int right, int ms)
+{
+  motor(0, left);
+  motor(3, right);
+  msleep(ms);
+  ao();
+}
+
+int main()
+{
+  int i;
+  for (i = 0; i < 4; ++i)
+  {
+    drive(80, 80, 1500);
+    drive(80, -80, 700);
+  }
+
+  return 0;
+}
@@ -0,0 +1,17 @@
+#!/usr/bin/python3
+import os, sys
+sys.path.append("/usr/lib")
+from kipr import *
+
+def drive(left, right, ms):
+  motor(0, left)
+  motor(3, right)
+  msleep(ms)
+  ao()
+
+def main():
+  for _ in range(4):
+    drive(80, 80, 1500)
+    drive(80, -80, 700)
+
+main()
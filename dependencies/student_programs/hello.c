@@ -0,0 +1,9 @@
+#include <stdio.h>
+#include <kipr/wombat.h>
+
+int main()
+{
+  printf("Hello, World!\n");
+
+  return 0;
+}
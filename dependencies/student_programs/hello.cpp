@@ -0,0 +1,9 @@
+#include <iostream>
+#include <kipr/wombat.h>
+
+int main()
+{
+  std::cout << "Hello, World!" << std::endl;
+
+  return 0;
+}
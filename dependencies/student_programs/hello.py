@@ -0,0 +1,9 @@
+#!/usr/bin/python3
+import os, sys
+sys.path.append("/usr/lib")
+import _kipr as k
+
+def main():
+	print("Hello, World!")
+
+main()
@@ -0,0 +1,32 @@
+#include <stdio.h>
+#include <kipr/wombat.h>
+
+#define THRESHOLD 1500
+
+int main()
+{
+  double start = seconds();
+
+  enable_servos();
+  set_servo_position(0, 1024);
+  while (seconds() - start < 10 && !push_button())
+  {
+    if (analog(0) > THRESHOLD)
+    {
+      mav(0, 1000);
+      mav(3, 500);
+    }
+    else
+    {
+      mav(0, 500);
+      mav(3, 1000);
+    }
+    msleep(10);
+  }
+  ao();
+  disable_servos();
+
+  printf("Done after %f seconds\n", seconds() - start);
+
+  return 0;
+}
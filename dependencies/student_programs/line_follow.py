@@ -0,0 +1,27 @@
+#!/usr/bin/python3
+import os, sys
+sys.path.append("/usr/lib")
+from kipr import *
+import math
+import random
+import time
+
+THRESHOLD = 1500
+
+def main():
+  start = time.time()
+  enable_servos()
+  set_servo_position(0, 1024)
+  while time.time() - start < 10 and not push_button():
+    if analog(0) > THRESHOLD:
+      mav(0, 1000)
+      mav(3, 500)
+    else:
+      mav(0, 500)
+      mav(3, 1000)
+    msleep(10)
+  ao()
+  disable_servos()
+  print("Distance: %.2f" % math.sqrt(random.random()))
+
+main()
@@ -0,0 +1,32 @@
+#include <iostream>
+#include <vector>
+#include <algorithm>
+#include <kipr/wombat.h>
+
+int main()
+{
+  std::vector<int> readings;
+  for (int i = 0; i < 200; ++i)
+  {
+    const int value = analog(0);
+    readings.push_back(value);
+
+    if (value > 2000)
+    {
+      mav(0, -500);
+      mav(3, 500);
+      msleep(400);
+    }
+    else
+    {
+      mav(0, 800);
+      mav(3, 800);
+    }
+    msleep(20);
+  }
+  ao();
+
+  std::cout << "Closest reading: " << *std::max_element(readings.begin(), readings.end()) << std::endl;
+
+  return 0;
+}
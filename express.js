@@ -5,7 +5,9 @@ const bodyParser = require('body-parser');
 const morgan = require('morgan');
 const fs = require('fs');
 const uuid = require('uuid');
-const { execFile } = require('child_process');
+const { runCompiler } = require('./compileServer');
+const { CompileCache } = require('./compileCache');
+const { compileArgs } = require('./compileArgs');
 const session = require('express-session');
 const csrf = require('lusca').csrf;
 const app = express();
@@ -141,6 +143,16 @@ if (
   config.server.dependencies.libkipr_c &&
   config.server.dependencies.emsdk_env
 ) {
+  const compileCache =
+    config.server.compileCache.maxBytes > 0
+      ? new CompileCache(
+          config.server.compileCache.dir,
+          config.server.compileCache.maxBytes,
+        )
+      : null;
+  const lookupCompileCache = (key, callback) =>
+    compileCache ? compileCache.get(key, callback) : callback(null);
+
   app.post('/compile', (req, res) => {
     const startTime = Date.now();
     const language = req.body.language;
@@ -202,6 +214,11 @@ if (
         });
     }
 
+    // Prebuilt simMainWrapper object and precompiled kipr headers (see dependencies/build.py).
+    // When available, the wrapper is linked in instead of being appended to the program.
+    const harness = config.server.dependencies.compile_harness?.[language];
+    if (harness) augmentation = '';
+
     // Track session interaction
     metrics.trackSessionInteraction(sessionId, 'compile');
 
@@ -226,155 +243,217 @@ if (
     ${augmentation}
     `;
 
-    const id = uuid.v4();
-    const path = `/tmp/${id}.${ext}`;
-    fs.writeFile(path, augmentedCode, (err) => {
-      if (err) {
+    // Optional libkipr optimization profile (see dependencies/build.py), e.g.
+    // O0 for the quickest link or O2 for the fastest simulation
+    const profileName = req.body.profile || config.server.compileProfile;
+    const profiles = config.server.dependencies.libkipr_c_profiles || {};
+    if (profileName && !Object.hasOwn(profiles, profileName)) {
+      return res.status(400).json({
+        error: `Unknown libkipr profile ${profileName}`,
+      });
+    }
+    const profile = profileName ? profiles[profileName] : null;
+
+    // The emscripten cache is pre-built for these flags, so they come from
+    // dependencies.json when it has them.
+    const compileFlags = config.server.dependencies.compile_flags || [
+      '-s',
+      'WASM=0',
+      '-s',
+      'INVOKE_RUN=0',
+      '-s',
+      'ASYNCIFY',
+      '-s',
+      'EXIT_RUNTIME=1',
+      '-s',
+      "EXPORTED_FUNCTIONS=['_main', '_simMainWrapper']",
+    ];
+
+    // Everything that affects the emitted JS, so identical programs (starter
+    // code, tutorial examples) are only compiled once per build of the toolchain
+    const cacheKey = CompileCache.key({
+      language,
+      code: augmentedCode,
+      compileFlags,
+      profile: profileName || null,
+      harness: harness || null,
+      harnessHash: config.server.dependencies.compile_harness_hash || null,
+      emsdkVersion: config.server.dependencies.emsdk_version,
+      libkiprHash: config.server.dependencies.libkipr_hash,
+    });
+
+    lookupCompileCache(cacheKey, (cached) => {
+      if (cached) {
         const durationMs = Date.now() - startTime;
-        const duration = durationMs / 1000;
 
-        // Log failed compilation
         logCompilation({
           userId,
           sessionId,
           language,
           code,
           duration: durationMs,
-          status: 'error',
-          stdout: null,
-          stderr: err.message,
+          status: 'success',
+          stdout: cached.stdout,
+          stderr: cached.stderr || null,
         });
 
-        metrics.compilation.counter.inc({ status: 'error', language });
+        metrics.compilation.counter.inc({ status: 'success', language });
         metrics.compilation.duration.observe(
-          { status: 'error', language },
-          duration,
+          { status: 'success', language },
+          durationMs / 1000,
         );
 
-        return res.status(500).json({
-          error: 'Failed to write ${}',
-        });
+        return res.status(200).json(cached);
       }
 
-      // ...process.env causes a linter error for some reason.
-      // We work around this by doing it manually.
-
-      const env = {};
-      for (const key of Object.keys(process.env)) {
-        env[key] = process.env[key];
-      }
-
-      env['PATH'] =
-        `${config.server.dependencies.emsdk_env.PATH}:${process.env.PATH}`;
-      env['EMSDK'] = config.server.dependencies.emsdk_env.EMSDK;
-      env['EM_CONFIG'] = config.server.dependencies.emsdk_env.EM_CONFIG;
-      const args = [
-        '-s',
-        'WASM=0',
-        '-s',
-        'INVOKE_RUN=0',
-        '-s',
-        'ASYNCIFY',
-        '-s',
-        'EXIT_RUNTIME=1',
-        '-s',
-        "EXPORTED_FUNCTIONS=['_main', '_simMainWrapper']",
-        `-I${config.server.dependencies.libkipr_c}/include`,
-        `-L${config.server.dependencies.libkipr_c}/lib`,
-        '-lkipr',
-        '-o',
-        `${path}.js`,
-        path,
-      ];
-      execFile(
-        cc,
-        args,
-        {
-          env,
-        },
-        (err, stdout, stderr) => {
+      const id = uuid.v4();
+      const path = `/tmp/${id}.${ext}`;
+      fs.writeFile(path, augmentedCode, (err) => {
+        if (err) {
           const durationMs = Date.now() - startTime;
           const duration = durationMs / 1000;
 
-          if (err) {
-            console.log(stderr);
-
-            // Log failed compilation
-            logCompilation({
-              userId,
-              sessionId,
-              language,
-              code,
-              duration: durationMs,
-              status: 'error',
-              stdout,
-              stderr,
-            });
+          // Log failed compilation
+          logCompilation({
+            userId,
+            sessionId,
+            language,
+            code,
+            duration: durationMs,
+            status: 'error',
+            stdout: null,
+            stderr: err.message,
+          });
 
-            metrics.compilation.counter.inc({ status: 'error', language });
-            metrics.compilation.duration.observe(
-              { status: 'error', language },
-              duration,
-            );
+          metrics.compilation.counter.inc({ status: 'error', language });
+          metrics.compilation.duration.observe(
+            { status: 'error', language },
+            duration,
+          );
 
-            return res.status(200).json({
-              stdout,
-              stderr,
-            });
-          }
+          return res.status(500).json({
+            error: 'Failed to write ${}',
+          });
+        }
+
+        // ...process.env causes a linter error for some reason.
+        // We work around this by doing it manually.
+
+        const env = {};
+        for (const key of Object.keys(process.env)) {
+          env[key] = process.env[key];
+        }
+
+        // EMSDK, EM_CONFIG and, for newer builds, the frozen EM_CACHE
+        for (const [key, value] of Object.entries(
+          config.server.dependencies.emsdk_env,
+        )) {
+          env[key] = value;
+        }
+        env['PATH'] =
+          `${config.server.dependencies.emsdk_env.PATH}:${process.env.PATH}`;
+        const args = compileArgs({
+          dependencies: config.server.dependencies,
+          compileFlags,
+          language,
+          profile,
+          code,
+          path,
+        });
+        runCompiler(
+          config.server.compileServerSocket,
+          cc,
+          args,
+          {
+            env,
+          },
+          (err, stdout, stderr) => {
+            const durationMs = Date.now() - startTime;
+            const duration = durationMs / 1000;
 
-          fs.readFile(`${path}.js`, (err, data) => {
             if (err) {
-              return res.status(400).json({
-                error: `Failed to open ${path}.js for reading`,
+              console.log(stderr);
+
+              // Log failed compilation
+              logCompilation({
+                userId,
+                sessionId,
+                language,
+                code,
+                duration: durationMs,
+                status: 'error',
+                stdout,
+                stderr,
+              });
+
+              metrics.compilation.counter.inc({ status: 'error', language });
+              metrics.compilation.duration.observe(
+                { status: 'error', language },
+                duration,
+              );
+
+              return res.status(200).json({
+                stdout,
+                stderr,
               });
             }
 
-            fs.unlink(`${path}.js`, (err) => {
+            fs.readFile(`${path}.js`, (err, data) => {
               if (err) {
-                return res.status(500).json({
-                  error: `Failed to delete ${path}.js`,
+                return res.status(400).json({
+                  error: `Failed to open ${path}.js for reading`,
                 });
               }
-              fs.unlink(`${path}`, (err) => {
+
+              fs.unlink(`${path}.js`, (err) => {
                 if (err) {
                   return res.status(500).json({
-                    error: `Failed to delete ${path}`,
+                    error: `Failed to delete ${path}.js`,
                   });
                 }
+                fs.unlink(`${path}`, (err) => {
+                  if (err) {
+                    return res.status(500).json({
+                      error: `Failed to delete ${path}`,
+                    });
+                  }
+
+                  // Log successful compilation
+                  logCompilation({
+                    userId,
+                    sessionId,
+                    language,
+                    code,
+                    duration: durationMs,
+                    status: 'success',
+                    stdout,
+                    stderr: stderr || null,
+                  });
 
-                // Log successful compilation
-                logCompilation({
-                  userId,
-                  sessionId,
-                  language,
-                  code,
-                  duration: durationMs,
-                  status: 'success',
-                  stdout,
-                  stderr: stderr || null,
-                });
-
-                // Success! Track metrics
-                metrics.compilation.counter.inc({
-                  status: 'success',
-                  language,
-                });
-                metrics.compilation.duration.observe(
-                  { status: 'success', language },
-                  duration,
-                );
-
-                res.status(200).json({
-                  result: data.toString(),
-                  stdout,
-                  stderr,
+                  // Success! Track metrics
+                  metrics.compilation.counter.inc({
+                    status: 'success',
+                    language,
+                  });
+                  metrics.compilation.duration.observe(
+                    { status: 'success', language },
+                    duration,
+                  );
+
+                  const result = {
+                    result: data.toString(),
+                    stdout,
+                    stderr,
+                  };
+                  if (compileCache) compileCache.set(cacheKey, result);
+
+                  res.status(200).json(result);
                 });
               });
             });
-          });
-        },
-      );
+          },
+        );
+      });
     });
   });
 }
@@ -484,6 +563,48 @@ app.post('/feedback', (req, res) => {
     });
 });
 
+// Build-time .br/.gz variants of large artifacts (see dependencies/build.py),
+// keyed by the absolute path of the original file.
+const compressedArtifacts =
+  config.server.dependencies.compressed_artifacts || {};
+
+// Serves the precompressed variant of a file under `root` when the client
+// accepts it, so large artifacts are never compressed per request.
+const precompressed = (root) => (req, res, next) => {
+  if (req.method !== 'GET' && req.method !== 'HEAD') return next();
+  if (!req.headers['accept-encoding']) return next();
+
+  let file;
+  try {
+    file = path.join(root, decodeURIComponent(req.path)).replace(/\/$/, '');
+  } catch (err) {
+    // Malformed percent-escape; let the static handler respond to it
+    if (err instanceof URIError) return next();
+    throw err;
+  }
+  const artifact = compressedArtifacts[file];
+  if (!artifact) return next();
+
+  res.vary('Accept-Encoding');
+  const encoding = req.acceptsEncodings(Object.keys(artifact.variants));
+  if (!encoding) return next();
+
+  res.set('Content-Encoding', encoding);
+  res.type(path.extname(file));
+  res.sendFile(
+    artifact.variants[encoding].path,
+    { maxAge: config.caching.staticMaxAge },
+    (err) => {
+      // Fall back to the uncompressed file if the variant has gone missing
+      if (err && !res.headersSent) {
+        res.removeHeader('Content-Encoding');
+        res.removeHeader('Content-Type');
+        next();
+      }
+    },
+  );
+};
+
 app.use(
   '/static',
   express.static(`${__dirname}/static`, {
@@ -495,6 +616,7 @@ if (config.server.dependencies.graphical_rt) {
   console.log('Graphical Runtime is enabled.');
   app.use(
     '/graphical/rt.js',
+    precompressed(config.server.dependencies.graphical_rt),
     express.static(`${config.server.dependencies.graphical_rt}`, {
       maxAge: config.caching.staticMaxAge,
     }),
@@ -505,12 +627,27 @@ if (config.server.dependencies.graphical_rt) {
   console.log('Graphical Runtime is enabled.');
   app.use(
     '/graphical/rt.js',
+    precompressed(config.server.dependencies.graphical_rt),
     express.static(`${config.server.dependencies.graphical_rt}`, {
       maxAge: config.caching.staticMaxAge,
     }),
   );
 }
 
+// WebAssembly build of the graphical runtime. rt.js fetches rt.wasm from the
+// same directory; express.static sends it as application/wasm, which
+// WebAssembly.instantiateStreaming requires.
+if (config.server.dependencies.graphical_rt_wasm) {
+  console.log('Graphical Runtime (wasm) is enabled.');
+  app.use(
+    '/graphical/wasm',
+    precompressed(config.server.dependencies.graphical_rt_wasm),
+    express.static(`${config.server.dependencies.graphical_rt_wasm}`, {
+      maxAge: config.caching.staticMaxAge,
+    }),
+  );
+}
+
 app.use(
   '/graphical',
   express.static(path.resolve(__dirname, 'node_modules', 'kipr-scratch'), {
@@ -522,6 +659,7 @@ if (config.server.dependencies.graphical_rt) {
   console.log('Graphical Runtime is enabled.');
   app.use(
     '/graphical/rt.js',
+    precompressed(config.server.dependencies.graphical_rt),
     express.static(`${config.server.dependencies.graphical_rt}`, {
       maxAge: config.caching.staticMaxAge,
     }),
@@ -535,6 +673,26 @@ app.use(
   }),
 );
 
+// Sharded libkipr documentation. Everything but manifest.json is named by its
+// content hash, so it is cached indefinitely; the manifest is revalidated.
+if (config.server.dependencies.libkipr_c_documentation_bundle) {
+  app.use(
+    '/docs/libkipr',
+    express.static(
+      `${config.server.dependencies.libkipr_c_documentation_bundle}`,
+      {
+        immutable: true,
+        maxAge: '1y',
+        setHeaders: (res, file) => {
+          if (path.basename(file) === 'manifest.json') {
+            res.setHeader('Cache-Control', 'no-cache');
+          }
+        },
+      },
+    ),
+  );
+}
+
 app.use(
   '/media',
   express.static(
@@ -550,6 +708,7 @@ if (config.server.dependencies.cpython) {
   console.log('CPython artifacts are enabled.');
   app.use(
     '/cpython',
+    precompressed(config.server.dependencies.cpython),
     express.static(`${config.server.dependencies.cpython}`, {
       maxAge: config.caching.staticMaxAge,
     }),
@@ -561,12 +720,27 @@ if (config.server.dependencies.libkipr_python) {
   console.log('libkipr (Python) artifacts are enabled.');
   app.use(
     '/libkipr/python',
+    precompressed(config.server.dependencies.libkipr_python),
     express.static(`${config.server.dependencies.libkipr_python}`, {
       maxAge: config.caching.staticMaxAge,
     }),
   );
 }
 
+// Expose the pruned, precompiled Python stdlib bundle
+if (config.server.dependencies.python_stdlib) {
+  console.log('Python stdlib bundle is enabled.');
+  app.use(
+    '/python_stdlib',
+    express.static(
+      path.dirname(config.server.dependencies.python_stdlib.bundle),
+      {
+        maxAge: config.caching.staticMaxAge,
+      },
+    ),
+  );
+}
+
 // Expose metrics endpoint
 app.get('/metrics', async (req, res) => {
   try {
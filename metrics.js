@@ -65,6 +65,25 @@ const compilationCodeSize = new promClient.Histogram({
   registers: [register]
 });
 
+const compilationCacheRequests = new promClient.Counter({
+  name: 'simulator_compilation_cache_requests_total',
+  help: 'Compile cache lookups by result (hit or miss)',
+  labelNames: ['result'],
+  registers: [register]
+});
+
+const compilationCacheEvictions = new promClient.Counter({
+  name: 'simulator_compilation_cache_evictions_total',
+  help: 'Compile cache entries evicted to stay under the size limit',
+  registers: [register]
+});
+
+const compilationCacheSize = new promClient.Gauge({
+  name: 'simulator_compilation_cache_size_bytes',
+  help: 'Total size of the compile cache on disk',
+  registers: [register]
+});
+
 // AI Assistant Metrics
 const aiRequestCounter = new promClient.Counter({
   name: 'simulator_ai_requests_total',
@@ -165,7 +184,10 @@ const metrics = {
   compilation: {
     counter: compilationCounter,
     duration: compilationDuration,
-    codeSize: compilationCodeSize
+    codeSize: compilationCodeSize,
+    cacheRequests: compilationCacheRequests,
+    cacheEvictions: compilationCacheEvictions,
+    cacheSize: compilationCacheSize
   },
   
   ai: {
@@ -22,6 +22,10 @@ export interface PythonParams {
   onStart?: () => void;
 }
 
+// Where the interpreter looks for its stdlib (sys.prefix is /usr/local)
+const STDLIB_ZIP_PATH = '/usr/local/lib/python312.zip';
+const STDLIB_DIR = '/usr/local/lib/python3.12';
+
 let python: (params: PythonParams) => Promise<void>;
 if (SIMULATOR_HAS_CPYTHON) {
   // This is on a non-standard path specified in the webpack config.
@@ -32,17 +36,29 @@ if (SIMULATOR_HAS_CPYTHON) {
    * Initializes the Python interpreter.
    */
   python = async (params: PythonParams) => {
-    const libkipr = await fetch('/libkipr/python/kipr.wasm');
-    const libkiprBuffer = await libkipr.arrayBuffer();
-
-    const kiprPy = await fetch('/libkipr/python/binding/python/package/src/kipr/kipr.py');
-    const kiprPyBuffer = await kiprPy.text();
+    // python.js is linked without the stdlib. The precompiled bundle built by
+    // dependencies/package_stdlib.py (the stdlib minus tests and modules that
+    // cannot work in the browser) is fetched alongside libkipr.
+    const [libkiprBuffer, kiprPyBuffer, stdlibBuffer] = await Promise.all([
+      fetch('/libkipr/python/kipr.wasm').then(res => res.arrayBuffer()),
+      fetch('/libkipr/python/binding/python/package/src/kipr/kipr.py').then(res => res.text()),
+      fetch('/python_stdlib/python312.zip').then(res => {
+        if (!res.ok) throw new Error(`Failed to fetch the Python stdlib: ${res.status}`);
+        return res.arrayBuffer();
+      }),
+    ]);
 
     await PythonEmscripten.default({
       locateFile: (path: string, prefix: string) => {
         return `/cpython/${path}`;
       },
       preRun: [function (module: any) {
+        // zipimport loads the stdlib from the bundle. The empty os.py and
+        // lib-dynload are the landmarks the interpreter locates its prefix by.
+        module.FS.mkdirTree(`${STDLIB_DIR}/lib-dynload`);
+        module.FS.writeFile(`${STDLIB_DIR}/os.py`, '');
+        module.FS.writeFile(STDLIB_ZIP_PATH, new Uint8Array(stdlibBuffer));
+
         const registers = module.FS.makedev(64, 0);
         module.FS.registerDevice(registers, registersDevice({
           registers: params.registers
@@ -72,7 +88,7 @@ ${params.code}
   `);
 
         // Signal that all Python resources are loaded and execution is about to begin.
-        // This is called inside preRun (after all /cpython/ assets are downloaded)
+        // This is called inside preRun (after the stdlib and libkipr are downloaded)
         // but before the Python interpreter starts running the user's code.
         if (params.onStart) {
           params.onStart();
@@ -0,0 +1,160 @@
+import Documentation from './index';
+import DocumentationLink from './DocumentationLink';
+import Dict from '../../../util/objectOps/Dict';
+
+/**
+ * Documentation in the compact format written by
+ * dependencies/generate_doxygen_json.py (--compact-output).
+ *
+ * Records are arrays of their fields, and every string is an index into
+ * `strings`. Fields that are always derived from others (the *_key fields) are
+ * left out and restored by `decode`.
+ */
+interface CompactDocumentation {
+  version: number;
+  strings: string[];
+  files: CompactDocumentation.File[];
+  functions: CompactDocumentation.Function[];
+  modules: CompactDocumentation.Module[];
+  structures: CompactDocumentation.Structure[];
+  enumerations: CompactDocumentation.Enumeration[];
+  types: CompactDocumentation.Type[];
+}
+
+namespace CompactDocumentation {
+  export const VERSION = 1;
+
+  /** An index into `strings`, or null */
+  export type Str = number | null;
+
+  export type Link = [Str, Str, Str];
+
+  export type File = [Str, Str, Str[], Str[], Str[]];
+
+  export type Parameter = [Str, Str, Str, Link[]];
+
+  // eslint-disable-next-line @typescript-eslint/ban-types
+  export type Function = [Str, Str, Parameter[], Str, Str, Str, Str, Link[]];
+
+  export type Module = [Str, Str, Str[], Str[]];
+
+  export type Member = [Str, Str, Str, Str, Link[]];
+
+  export type Structure = [Str, Str, Member[], Str, Str, Str[]];
+
+  export type Value = [Str, Str, Str];
+
+  export type Enumeration = [Str, Str, Value[], Str, Str, Str[]];
+
+  export type Type = [Str, Str];
+
+  /**
+   * Restore the documentation exactly as generate_doxygen_json.py writes it to json.json.
+   */
+  export const decode = (compact: CompactDocumentation): Documentation => {
+    if (compact.version !== VERSION) {
+      throw new Error(`Unsupported compact documentation version ${compact.version}`);
+    }
+
+    const { strings } = compact;
+    const str = (index: Str) => (index === null ? null : strings[index]);
+    const strs = (indexes: Str[]) => indexes.map(str);
+    const key = (text: string | null, k: string) => (text ? k : null);
+    const links = (items: Link[]) => items.map(([id, kind, name]) => ({
+      id: str(id),
+      kind: str(kind),
+      name: str(name),
+    }) as DocumentationLink);
+
+    const files: Dict<unknown> = {};
+    for (const [id, name, functions, modules, types] of compact.files) {
+      files[str(id)] = {
+        id: str(id),
+        name: str(name),
+        functions: strs(functions),
+        modules: strs(modules),
+        types: strs(types),
+      };
+    }
+
+    const functions: Dict<unknown> = {};
+    for (const [id, nameIndex, parameters, returnType, returnDescription, brief, detailed, returnTypeLinks] of compact.functions) {
+      const name = str(nameIndex);
+      const return_description = str(returnDescription);
+      const brief_description = str(brief);
+      const detailed_description = str(detailed);
+      functions[str(id)] = {
+        id: str(id),
+        name,
+        parameters: parameters.map(([parameterName, type, description, typeLinks]) => ({
+          name: str(parameterName),
+          type: str(type),
+          description: str(description),
+          description_key: key(str(description), `func:${name}:param:${str(parameterName)}:description`),
+          type_links: links(typeLinks),
+        })),
+        return_type: str(returnType),
+        return_description,
+        return_description_key: key(return_description, `func:${name}:return`),
+        brief_description,
+        brief_description_key: key(brief_description, `func:${name}:brief`),
+        detailed_description,
+        detailed_description_key: key(detailed_description, `func:${name}:detailed`),
+        return_type_links: links(returnTypeLinks),
+      };
+    }
+
+    const modules: Dict<unknown> = {};
+    for (const [id, name, moduleFunctions, types] of compact.modules) {
+      modules[str(id)] = {
+        id: str(id),
+        name: str(name),
+        functions: strs(moduleFunctions),
+        types: strs(types),
+      };
+    }
+
+    const structures: Dict<unknown> = {};
+    for (const [id, name, members, brief, detailed, usedBy] of compact.structures) {
+      structures[str(name)] = {
+        id: str(id),
+        name: str(name),
+        members: members.map(([memberName, type, memberBrief, memberDetailed, typeLinks]) => ({
+          name: str(memberName),
+          type: str(type),
+          brief_description: str(memberBrief),
+          detailed_description: str(memberDetailed),
+          type_links: links(typeLinks),
+        })),
+        brief_description: str(brief),
+        detailed_description: str(detailed),
+        used_by: strs(usedBy),
+      };
+    }
+
+    const enumerations: Dict<unknown> = {};
+    for (const [id, name, values, brief, detailed, usedBy] of compact.enumerations) {
+      enumerations[str(name)] = {
+        id: str(id),
+        name: str(name),
+        values: values.map(([valueName, valueBrief, valueDetailed]) => ({
+          name: str(valueName),
+          brief_description: str(valueBrief),
+          detailed_description: str(valueDetailed),
+        })),
+        brief_description: str(brief),
+        detailed_description: str(detailed),
+        used_by: strs(usedBy),
+      };
+    }
+
+    const types: Dict<unknown> = {};
+    for (const [id, type] of compact.types) {
+      types[str(id)] = { id: str(id), type: str(type) };
+    }
+
+    return { files, functions, modules, structures, enumerations, types } as Documentation;
+  };
+}
+
+export default CompactDocumentation;
@@ -0,0 +1,11 @@
+/**
+ * A reference from a type to the documented function, structure or enumeration
+ * it names, resolved by dependencies/generate_doxygen_json.py.
+ */
+interface DocumentationLink {
+  id: string;
+  kind: 'function' | 'structure' | 'enumeration';
+  name: string;
+}
+
+export default DocumentationLink;
@@ -4,6 +4,8 @@ interface EnumerationDocumentation {
   values: EnumerationDocumentation.Value[];
   brief_description?: string;
   detailed_description?: string;
+  /** Ids of the functions and structures whose types refer to this one */
+  used_by?: string[];
 }
 
 namespace EnumerationDocumentation {
@@ -1,3 +1,5 @@
+import DocumentationLink from './DocumentationLink';
+
 interface FunctionDocumentation {
   id: string;
   name: string;
@@ -6,6 +8,7 @@ interface FunctionDocumentation {
   return_description?: string;
   brief_description?: string;
   detailed_description?: string;
+  return_type_links?: DocumentationLink[];
 }
 
 namespace FunctionDocumentation {
@@ -15,6 +18,7 @@ namespace FunctionDocumentation {
     name: string;
     type: string;
     description: string;
+    type_links?: DocumentationLink[];
   }
 }
 
@@ -0,0 +1,79 @@
+import Dict from '../../../util/objectOps/Dict';
+
+/**
+ * Search index prebuilt by dependencies/generate_doxygen_json.py (--search-index).
+ *
+ * Nothing loads it yet: the documentation panel still filters by name.
+ */
+interface SearchIndex {
+  /** [kind, key, name], where key is the entry's key in the documentation */
+  entries: [SearchIndex.Kind, string, string][];
+  /** Lowercased names and their suffixes after each underscore, sorted */
+  prefixes: string[];
+  /** Entry index of each prefix */
+  prefix_entries: number[];
+  /** Term to a flat [entry, weight, entry, weight, ...] list, highest weight first */
+  terms: Dict<number[]>;
+}
+
+namespace SearchIndex {
+  export type Kind = 'f' | 's' | 'e';
+
+  export interface Result {
+    kind: Kind;
+    key: string;
+    name: string;
+  }
+
+  const result = (index: SearchIndex, entry: number): Result => {
+    const [kind, key, name] = index.entries[entry];
+    return { kind, key, name };
+  };
+
+  /**
+   * Entries whose name, or a part of it after an underscore, starts with `prefix`.
+   */
+  export const complete = (index: SearchIndex, prefix: string, limit = 20): Result[] => {
+    const lower = prefix.toLowerCase();
+    const { prefixes, prefix_entries } = index;
+
+    let low = 0;
+    let high = prefixes.length;
+    while (low < high) {
+      const mid = (low + high) >>> 1;
+      if (prefixes[mid] < lower) low = mid + 1;
+      else high = mid;
+    }
+
+    const seen = new Set<number>();
+    const ret: Result[] = [];
+    for (let i = low; i < prefixes.length && ret.length < limit && prefixes[i].startsWith(lower); ++i) {
+      const entry = prefix_entries[i];
+      if (seen.has(entry)) continue;
+      seen.add(entry);
+      ret.push(result(index, entry));
+    }
+    return ret;
+  };
+
+  /**
+   * Entries matching the terms of `query`, ranked by their summed weights.
+   */
+  export const search = (index: SearchIndex, query: string, limit = 20): Result[] => {
+    const scores = new Map<number, number>();
+    for (const term of query.toLowerCase().match(/[a-z0-9]+/g) || []) {
+      const postings = index.terms[term];
+      if (!postings) continue;
+      for (let i = 0; i < postings.length; i += 2) {
+        scores.set(postings[i], (scores.get(postings[i]) || 0) + postings[i + 1]);
+      }
+    }
+
+    return [...scores.entries()]
+      .sort(([a, aScore], [b, bScore]) => bScore - aScore || a - b)
+      .slice(0, limit)
+      .map(([entry]) => result(index, entry));
+  };
+}
+
+export default SearchIndex;
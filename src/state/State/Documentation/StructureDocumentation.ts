@@ -1,9 +1,13 @@
+import DocumentationLink from './DocumentationLink';
+
 interface StructureDocumentation {
   id: string;
   name: string;
   members: StructureDocumentation.Member[];
   brief_description?: string;
   detailed_description?: string;
+  /** Ids of the functions and structures whose types refer to this one */
+  used_by?: string[];
 }
 
 namespace StructureDocumentation {
@@ -12,6 +16,7 @@ namespace StructureDocumentation {
     type: string;
     brief_description?: string;
     detailed_description?: string;
+    type_links?: DocumentationLink[];
   }
 
   export const compare = (a: StructureDocumentation, b: StructureDocumentation) => a.name.localeCompare(b.name);
@@ -7,6 +7,7 @@ import { AsyncChallengeCompletion } from './ChallengeCompletion';
 import { AsyncLimitedChallenge } from './LimitedChallenge';
 import { AsyncLimitedChallengeCompletion } from './LimitedChallengeCompletion';
 import Documentation from './Documentation';
+import CompactDocumentation from './Documentation/CompactDocumentation';
 import DocumentationLocation from './Documentation/DocumentationLocation';
 import Robot from './Robot';
 import Scene, { AsyncScene } from './Scene';
@@ -115,7 +116,9 @@ export interface DocumentationState {
 
 export namespace DocumentationState {
   export const DEFAULT: DocumentationState = {
-    documentation: SIMULATOR_LIBKIPR_C_DOCUMENTATION as Documentation || Documentation.EMPTY,
+    documentation: SIMULATOR_LIBKIPR_C_COMPACT_DOCUMENTATION
+      ? CompactDocumentation.decode(SIMULATOR_LIBKIPR_C_COMPACT_DOCUMENTATION as CompactDocumentation)
+      : SIMULATOR_LIBKIPR_C_DOCUMENTATION as Documentation || Documentation.EMPTY,
     locationStack: [],
     size: Size.MINIMIZED,
     language: 'c'
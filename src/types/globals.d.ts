@@ -3,4 +3,5 @@ declare const SIMULATOR_VERSION: string;
 declare const SIMULATOR_GIT_HASH: string;
 declare const SIMULATOR_HAS_CPYTHON: boolean;
 declare const SIMULATOR_LIBKIPR_C_DOCUMENTATION: unknown | undefined;
+declare const SIMULATOR_LIBKIPR_C_COMPACT_DOCUMENTATION: unknown | undefined;
 declare const SIMULATOR_I18N: unknown | undefined;
@@ -0,0 +1,83 @@
+import { compileArgs } from '../compileArgs';
+
+const DEPENDENCIES = {
+  libkipr_c: '/deps/libkipr_install_c',
+  compile_harness: {
+    c: { pch: '/deps/kipr.h.pch', wrapper: '/deps/sim_main_wrapper_c.o' },
+    cpp: { pch: '/deps/kipr.hpp.pch', wrapper: '/deps/sim_main_wrapper_cpp.o' },
+  },
+  libkipr_c_profiles: {
+    O0: {
+      path: '/deps/libkipr_install_c',
+      flags: ['-O0'],
+      pch: { c: '/deps/kipr.h.pch', cpp: '/deps/kipr.hpp.pch' },
+    },
+    O2: {
+      path: '/deps/libkipr_install_c_O2',
+      flags: ['-O2'],
+      pch: { c: '/deps/kipr.h.O2.pch', cpp: '/deps/kipr.hpp.O2.pch' },
+    },
+    Os: {
+      path: '/deps/libkipr_install_c_Os',
+      flags: ['-Os'],
+      pch: { c: '/deps/kipr.h.Os.pch', cpp: '/deps/kipr.hpp.Os.pch' },
+    },
+  },
+};
+
+const CODE = {
+  c: '#include <kipr/wombat.h>\nint main() { return 0; }\n',
+  cpp: '#include <kipr/wombat.hpp>\nint main() { return 0; }\n',
+};
+
+const args = (language: string, profile: string | null, dependencies = DEPENDENCIES, code = CODE[language]) => compileArgs({
+  dependencies,
+  compileFlags: ['-sASYNCIFY'],
+  language,
+  profile: profile ? dependencies.libkipr_c_profiles[profile] : null,
+  code,
+  path: '/tmp/program.c',
+});
+
+const pchOf = (compilerArgs: string[]) => {
+  const index = compilerArgs.indexOf('-include-pch');
+  return index === -1 ? null : compilerArgs[index + 1];
+};
+
+describe('compileArgs', () => {
+  it('should use the default PCH and libkipr without a profile', () => {
+    const result = args('c', null);
+    expect(pchOf(result)).toEqual('/deps/kipr.h.pch');
+    expect(result).toContain('-L/deps/libkipr_install_c/lib');
+    expect(result).toContain('/deps/sim_main_wrapper_c.o');
+  });
+
+  for (const profile of Object.keys(DEPENDENCIES.libkipr_c_profiles)) {
+    for (const language of ['c', 'cpp']) {
+      it(`should compile ${language} with the ${profile} PCH, flags and libkipr`, () => {
+        const { path, flags, pch } = DEPENDENCIES.libkipr_c_profiles[profile];
+        const result = args(language, profile);
+        expect(pchOf(result)).toEqual(pch[language]);
+        expect(result).toEqual(expect.arrayContaining([...flags, `-L${path}/lib`]));
+        expect(result).toContain(DEPENDENCIES.compile_harness[language].wrapper);
+      });
+    }
+  }
+
+  it('should not use the default PCH with an optimized profile that has none', () => {
+    const { pch, ...O2 } = DEPENDENCIES.libkipr_c_profiles.O2;
+    const dependencies = {
+      ...DEPENDENCIES,
+      libkipr_c_profiles: { ...DEPENDENCIES.libkipr_c_profiles, O2 },
+    };
+    const result = args('c', 'O2', dependencies);
+    expect(pchOf(result)).toBeNull();
+    expect(result).toContain('-O2');
+  });
+
+  it('should not use a PCH for programs that do not include libkipr', () => {
+    const result = args('c', 'O2', DEPENDENCIES, 'int main() { return 0; }\n');
+    expect(pchOf(result)).toBeNull();
+    expect(result).toContain('/deps/sim_main_wrapper_c.o');
+  });
+});
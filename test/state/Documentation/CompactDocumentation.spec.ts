@@ -0,0 +1,18 @@
+import CompactDocumentation from '../../../src/state/State/Documentation/CompactDocumentation';
+import { COMPACT_DOCUMENTATION, DOCUMENTATION } from './fixtures';
+
+const COMPACT = COMPACT_DOCUMENTATION as CompactDocumentation;
+
+describe('CompactDocumentation', () => {
+  it('should restore the documentation it was encoded from', () => {
+    expect(CompactDocumentation.decode(COMPACT)).toEqual(DOCUMENTATION);
+  });
+
+  it('should be smaller than the documentation', () => {
+    expect(JSON.stringify(COMPACT).length).toBeLessThan(JSON.stringify(DOCUMENTATION).length);
+  });
+
+  it('should reject other versions', () => {
+    expect(() => CompactDocumentation.decode({ ...COMPACT, version: CompactDocumentation.VERSION + 1 })).toThrow();
+  });
+});
@@ -0,0 +1,81 @@
+import SearchIndex from '../../../src/state/State/Documentation/SearchIndex';
+import { SEARCH_INDEX } from './fixtures';
+
+const INDEX = SEARCH_INDEX as SearchIndex;
+
+const names = (results: SearchIndex.Result[]) => results.map(({ name }) => name);
+
+describe('SearchIndex.complete', () => {
+  it('should complete names and their parts after underscores, in name order', () => {
+    expect(names(SearchIndex.complete(INDEX, 'motor'))).toEqual([
+      'motor',
+      'motor_direction',
+      'get_motor_position_counter',
+      'clear_motor_position_counter',
+    ]);
+  });
+
+  it('should ignore case', () => {
+    expect(names(SearchIndex.complete(INDEX, 'POS'))).toEqual([
+      'get_motor_position_counter',
+      'clear_motor_position_counter',
+    ]);
+  });
+
+  it('should return each entry once', () => {
+    expect(names(SearchIndex.complete(INDEX, 'point'))).toEqual(['make_point2', 'point2']);
+  });
+
+  it('should return the kind and key of each entry', () => {
+    expect(SearchIndex.complete(INDEX, 'point2')).toEqual([
+      { kind: 'f', key: 'geometry_8h_1make_point2', name: 'make_point2' },
+      { kind: 's', key: 'point2', name: 'point2' },
+    ]);
+  });
+
+  it('should stop at the limit', () => {
+    expect(names(SearchIndex.complete(INDEX, 'counter', 1))).toEqual(['get_motor_position_counter']);
+  });
+
+  it('should return nothing for unknown prefixes', () => {
+    expect(SearchIndex.complete(INDEX, 'zzz')).toEqual([]);
+  });
+});
+
+describe('SearchIndex.search', () => {
+  it('should rank entries by their summed term weights', () => {
+    expect(names(SearchIndex.search(INDEX, 'motor position'))).toEqual([
+      'get_motor_position_counter',
+      'clear_motor_position_counter',
+      'motor_direction',
+      'motor',
+    ]);
+  });
+
+  it('should rank terms in descriptions', () => {
+    expect(names(SearchIndex.search(INDEX, 'counter zero'))).toEqual([
+      'clear_motor_position_counter',
+      'get_motor_position_counter',
+    ]);
+  });
+
+  it('should rank names above descriptions', () => {
+    expect(names(SearchIndex.search(INDEX, 'position'))).toEqual([
+      'get_motor_position_counter',
+      'clear_motor_position_counter',
+      'motor_direction',
+    ]);
+  });
+
+  it('should ignore case, punctuation and unknown terms', () => {
+    expect(names(SearchIndex.search(INDEX, 'Milliseconds? unknown'))).toEqual(['msleep']);
+  });
+
+  it('should stop at the limit', () => {
+    expect(names(SearchIndex.search(INDEX, 'motor', 2))).toEqual(['motor', 'motor_direction']);
+  });
+
+  it('should return nothing for stop words', () => {
+    expect(SearchIndex.search(INDEX, 'the')).toEqual([]);
+  });
+});
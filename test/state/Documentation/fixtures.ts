@@ -0,0 +1,733 @@
+// Generated by dependencies/generate_documentation_fixtures.py. Do not edit.
+
+export const DOCUMENTATION: unknown = {
+  "files": {
+    "motor_8h": {
+      "id": "motor_8h",
+      "name": "motor.h",
+      "functions": [
+        "motor_8h_1motor",
+        "motor_8h_1get_motor_position_counter",
+        "motor_8h_1clear_motor_position_counter"
+      ],
+      "modules": [
+        "group__motor"
+      ],
+      "types": []
+    },
+    "time_8h": {
+      "id": "time_8h",
+      "name": "time.h",
+      "functions": [
+        "time_8h_1msleep"
+      ],
+      "modules": [],
+      "types": []
+    },
+    "geometry_8h": {
+      "id": "geometry_8h",
+      "name": "geometry.h",
+      "functions": [
+        "geometry_8h_1make_point2"
+      ],
+      "modules": [],
+      "types": [
+        "geometry_8h_1point2_t"
+      ]
+    }
+  },
+  "functions": {
+    "motor_8h_1motor": {
+      "id": "motor_8h_1motor",
+      "name": "motor",
+      "parameters": [
+        {
+          "name": "motor",
+          "type": "int",
+          "description": "The motor port.",
+          "description_key": "func:motor:param:motor:description",
+          "type_links": []
+        },
+        {
+          "name": "percent",
+          "type": "int",
+          "description": "The percent of full power.",
+          "description_key": "func:motor:param:percent:description",
+          "type_links": []
+        }
+      ],
+      "return_type": "void",
+      "return_description": null,
+      "return_description_key": null,
+      "brief_description": "Turns on the motor at the given percent of full power.",
+      "brief_description_key": "func:motor:brief",
+      "detailed_description": "Motor power is not regulated. Use move_at_velocity to hold a velocity.",
+      "detailed_description_key": "func:motor:detailed",
+      "return_type_links": []
+    },
+    "motor_8h_1get_motor_position_counter": {
+      "id": "motor_8h_1get_motor_position_counter",
+      "name": "get_motor_position_counter",
+      "parameters": [
+        {
+          "name": "motor",
+          "type": "int",
+          "description": "The motor port.",
+          "description_key": "func:get_motor_position_counter:param:motor:description",
+          "type_links": []
+        }
+      ],
+      "return_type": "int",
+      "return_description": "The position in ticks.",
+      "return_description_key": "func:get_motor_position_counter:return",
+      "brief_description": "Gets the motor position counter.",
+      "brief_description_key": "func:get_motor_position_counter:brief",
+      "detailed_description": null,
+      "detailed_description_key": null,
+      "return_type_links": []
+    },
+    "motor_8h_1clear_motor_position_counter": {
+      "id": "motor_8h_1clear_motor_position_counter",
+      "name": "clear_motor_position_counter",
+      "parameters": [
+        {
+          "name": "motor",
+          "type": "int",
+          "description": null,
+          "description_key": null,
+          "type_links": []
+        }
+      ],
+      "return_type": "void",
+      "return_description": null,
+      "return_description_key": null,
+      "brief_description": "Resets the motor position counter to zero.",
+      "brief_description_key": "func:clear_motor_position_counter:brief",
+      "detailed_description": null,
+      "detailed_description_key": null,
+      "return_type_links": []
+    },
+    "time_8h_1msleep": {
+      "id": "time_8h_1msleep",
+      "name": "msleep",
+      "parameters": [
+        {
+          "name": "msecs",
+          "type": "int",
+          "description": "The time to wait in milliseconds.",
+          "description_key": "func:msleep:param:msecs:description",
+          "type_links": []
+        }
+      ],
+      "return_type": "void",
+      "return_description": null,
+      "return_description_key": null,
+      "brief_description": "Waits for the given number of milliseconds.",
+      "brief_description_key": "func:msleep:brief",
+      "detailed_description": null,
+      "detailed_description_key": null,
+      "return_type_links": []
+    },
+    "geometry_8h_1make_point2": {
+      "id": "geometry_8h_1make_point2",
+      "name": "make_point2",
+      "parameters": [
+        {
+          "name": "x",
+          "type": "int",
+          "description": null,
+          "description_key": null,
+          "type_links": []
+        },
+        {
+          "name": "y",
+          "type": "int",
+          "description": null,
+          "description_key": null,
+          "type_links": []
+        }
+      ],
+      "return_type": "point2",
+      "return_description": null,
+      "return_description_key": null,
+      "brief_description": "Makes a point from its coordinates.",
+      "brief_description_key": "func:make_point2:brief",
+      "detailed_description": null,
+      "detailed_description_key": null,
+      "return_type_links": [
+        {
+          "id": "structpoint2",
+          "kind": "structure",
+          "name": "point2"
+        }
+      ]
+    }
+  },
+  "modules": {
+    "group__motor": {
+      "id": "group__motor",
+      "name": "motor",
+      "functions": [
+        "motor_8h_1motor",
+        "motor_8h_1get_motor_position_counter",
+        "motor_8h_1clear_motor_position_counter"
+      ],
+      "types": []
+    }
+  },
+  "structures": {
+    "point2": {
+      "id": "structpoint2",
+      "name": "point2",
+      "members": [
+        {
+          "name": "x",
+          "type": "int",
+          "brief_description": "The x coordinate.",
+          "detailed_description": null,
+          "type_links": []
+        },
+        {
+          "name": "y",
+          "type": "int",
+          "brief_description": "The y coordinate.",
+          "detailed_description": null,
+          "type_links": []
+        }
+      ],
+      "brief_description": "A point in two dimensions.",
+      "detailed_description": null,
+      "used_by": [
+        "geometry_8h_1make_point2"
+      ]
+    }
+  },
+  "enumerations": {
+    "motor_direction": {
+      "id": "motor_8h_1motor_direction",
+      "name": "motor_direction",
+      "values": [
+        {
+          "name": "FORWARD",
+          "brief_description": "Turn forward.",
+          "detailed_description": null
+        },
+        {
+          "name": "BACKWARD",
+          "brief_description": null,
+          "detailed_description": null
+        }
+      ],
+      "brief_description": "Which way a motor turns.",
+      "detailed_description": "Used with motor position counters.",
+      "used_by": []
+    }
+  },
+  "types": {
+    "geometry_8h_1point2_t": {
+      "id": "geometry_8h_1point2_t",
+      "type": "struct point2"
+    }
+  }
+};
+
+export const COMPACT_DOCUMENTATION: unknown = {
+  "version": 1,
+  "strings": [
+    "int",
+    "motor",
+    "motor_8h_1motor",
+    "motor_8h_1get_motor_position_counter",
+    "motor_8h_1clear_motor_position_counter",
+    "geometry_8h_1make_point2",
+    "void",
+    "point2",
+    "group__motor",
+    "time_8h_1msleep",
+    "geometry_8h_1point2_t",
+    "The motor port.",
+    "x",
+    "y",
+    "structpoint2",
+    "motor_8h",
+    "motor.h",
+    "time_8h",
+    "time.h",
+    "geometry_8h",
+    "geometry.h",
+    "percent",
+    "The percent of full power.",
+    "Turns on the motor at the given percent of full power.",
+    "Motor power is not regulated. Use move_at_velocity to hold a velocity.",
+    "get_motor_position_counter",
+    "The position in ticks.",
+    "Gets the motor position counter.",
+    "clear_motor_position_counter",
+    "Resets the motor position counter to zero.",
+    "msleep",
+    "msecs",
+    "The time to wait in milliseconds.",
+    "Waits for the given number of milliseconds.",
+    "make_point2",
+    "Makes a point from its coordinates.",
+    "structure",
+    "The x coordinate.",
+    "The y coordinate.",
+    "A point in two dimensions.",
+    "motor_8h_1motor_direction",
+    "motor_direction",
+    "FORWARD",
+    "Turn forward.",
+    "BACKWARD",
+    "Which way a motor turns.",
+    "Used with motor position counters.",
+    "struct point2"
+  ],
+  "files": [
+    [
+      15,
+      16,
+      [
+        2,
+        3,
+        4
+      ],
+      [
+        8
+      ],
+      []
+    ],
+    [
+      17,
+      18,
+      [
+        9
+      ],
+      [],
+      []
+    ],
+    [
+      19,
+      20,
+      [
+        5
+      ],
+      [],
+      [
+        10
+      ]
+    ]
+  ],
+  "functions": [
+    [
+      2,
+      1,
+      [
+        [
+          1,
+          0,
+          11,
+          []
+        ],
+        [
+          21,
+          0,
+          22,
+          []
+        ]
+      ],
+      6,
+      null,
+      23,
+      24,
+      []
+    ],
+    [
+      3,
+      25,
+      [
+        [
+          1,
+          0,
+          11,
+          []
+        ]
+      ],
+      0,
+      26,
+      27,
+      null,
+      []
+    ],
+    [
+      4,
+      28,
+      [
+        [
+          1,
+          0,
+          null,
+          []
+        ]
+      ],
+      6,
+      null,
+      29,
+      null,
+      []
+    ],
+    [
+      9,
+      30,
+      [
+        [
+          31,
+          0,
+          32,
+          []
+        ]
+      ],
+      6,
+      null,
+      33,
+      null,
+      []
+    ],
+    [
+      5,
+      34,
+      [
+        [
+          12,
+          0,
+          null,
+          []
+        ],
+        [
+          13,
+          0,
+          null,
+          []
+        ]
+      ],
+      7,
+      null,
+      35,
+      null,
+      [
+        [
+          14,
+          36,
+          7
+        ]
+      ]
+    ]
+  ],
+  "modules": [
+    [
+      8,
+      1,
+      [
+        2,
+        3,
+        4
+      ],
+      []
+    ]
+  ],
+  "structures": [
+    [
+      14,
+      7,
+      [
+        [
+          12,
+          0,
+          37,
+          null,
+          []
+        ],
+        [
+          13,
+          0,
+          38,
+          null,
+          []
+        ]
+      ],
+      39,
+      null,
+      [
+        5
+      ]
+    ]
+  ],
+  "enumerations": [
+    [
+      40,
+      41,
+      [
+        [
+          42,
+          43,
+          null
+        ],
+        [
+          44,
+          null,
+          null
+        ]
+      ],
+      45,
+      46,
+      []
+    ]
+  ],
+  "types": [
+    [
+      10,
+      47
+    ]
+  ]
+};
+
+export const SEARCH_INDEX: unknown = {
+  "entries": [
+    [
+      "f",
+      "motor_8h_1motor",
+      "motor"
+    ],
+    [
+      "f",
+      "motor_8h_1get_motor_position_counter",
+      "get_motor_position_counter"
+    ],
+    [
+      "f",
+      "motor_8h_1clear_motor_position_counter",
+      "clear_motor_position_counter"
+    ],
+    [
+      "f",
+      "time_8h_1msleep",
+      "msleep"
+    ],
+    [
+      "f",
+      "geometry_8h_1make_point2",
+      "make_point2"
+    ],
+    [
+      "s",
+      "point2",
+      "point2"
+    ],
+    [
+      "e",
+      "motor_direction",
+      "motor_direction"
+    ]
+  ],
+  "prefixes": [
+    "clear_motor_position_counter",
+    "counter",
+    "counter",
+    "direction",
+    "get_motor_position_counter",
+    "make_point2",
+    "motor",
+    "motor_direction",
+    "motor_position_counter",
+    "motor_position_counter",
+    "msleep",
+    "point2",
+    "point2",
+    "position_counter",
+    "position_counter"
+  ],
+  "prefix_entries": [
+    2,
+    1,
+    2,
+    6,
+    1,
+    4,
+    0,
+    6,
+    1,
+    2,
+    3,
+    4,
+    5,
+    1,
+    2
+  ],
+  "terms": {
+    "clear": [
+      2,
+      208
+    ],
+    "coordinates": [
+      4,
+      62
+    ],
+    "counter": [
+      1,
+      196,
+      2,
+      196
+    ],
+    "counters": [
+      6,
+      21
+    ],
+    "dimensions": [
+      5,
+      62
+    ],
+    "direction": [
+      6,
+      208
+    ],
+    "full": [
+      0,
+      62
+    ],
+    "get": [
+      1,
+      208
+    ],
+    "gets": [
+      1,
+      62
+    ],
+    "given": [
+      0,
+      45,
+      3,
+      45
+    ],
+    "hold": [
+      0,
+      21
+    ],
+    "its": [
+      4,
+      62
+    ],
+    "make": [
+      4,
+      208
+    ],
+    "makes": [
+      4,
+      62
+    ],
+    "milliseconds": [
+      3,
+      62
+    ],
+    "motor": [
+      0,
+      142,
+      6,
+      142,
+      1,
+      132,
+      2,
+      132
+    ],
+    "move": [
+      0,
+      21
+    ],
+    "msleep": [
+      3,
+      208
+    ],
+    "not": [
+      0,
+      21
+    ],
+    "number": [
+      3,
+      62
+    ],
+    "percent": [
+      0,
+      62
+    ],
+    "point": [
+      4,
+      45,
+      5,
+      45
+    ],
+    "point2": [
+      4,
+      150,
+      5,
+      150
+    ],
+    "position": [
+      1,
+      157,
+      2,
+      157,
+      6,
+      12
+    ],
+    "power": [
+      0,
+      83
+    ],
+    "regulated": [
+      0,
+      21
+    ],
+    "resets": [
+      2,
+      62
+    ],
+    "turns": [
+      0,
+      45,
+      6,
+      45
+    ],
+    "two": [
+      5,
+      62
+    ],
+    "use": [
+      0,
+      21
+    ],
+    "used": [
+      6,
+      21
+    ],
+    "velocity": [
+      0,
+      42
+    ],
+    "waits": [
+      3,
+      62
+    ],
+    "way": [
+      6,
+      62
+    ],
+    "which": [
+      6,
+      62
+    ],
+    "zero": [
+      2,
+      62
+    ]
+  }
+};
+